@@ -9,7 +9,15 @@ using BEST and TOPK operators
 import csv
 import os
 
-from yfimport import TRANSACTION_FILE
+from experiment import FAILURE_LIST, add_run_arguments, claim,\
+    get_artifact_digest, get_cells, get_data_id, get_data_size, get_limits,\
+    get_memory_limit, get_random, get_resource_file, get_status,\
+    invalidate_outdated, is_cell_pending, is_failed, is_pending, is_pruned,\
+    merge_directories, prepare_cache, read_manifest, release, run_adaptive,\
+    run_command, run_warmup, write_artifact, write_manifest
+from prepare import is_prepared, prepare_data
+from schedule import get_model, predict, schedule_jobs
+from warehouse import MISSING_RUN, connect, get_runs, ingest, write_intervals
 
 
 # Experiment parameters
@@ -42,6 +50,10 @@ OPERATOR_DEFAULT = BEST
 # Top-k variation (-1 for best operator)
 TOPK_LIST = [1, 35, 70, 140, 280]
 
+# Parameter variation that makes an experiment harder
+# (1: greater values, -1: smaller values)
+HARDER_DICT = {RAN: 1, SLI: -1, TOPK: 1}
+
 # List of algorithms
 ALGORITHM_LIST = ['inc_ancestors', 'inc_graph', 'inc_partition', 'partition']
 
@@ -65,13 +77,6 @@ RUN_COUNT = 5
 # Command for experiment run
 RUN_COMMAND = \
     "streampref -r'|' -p {alg} -e {env} -d {det} -m {ite}"
-# Command for calculation of confidence interval
-CONFINTERVAL_COMMAND = \
-    'confinterval.py -i {inf} -o {outf} -k {keyf}'
-# Command for sort stream file download
-SORT_COMMAND = \
-    'cat ' + TRANSACTION_FILE + ' | sort -g > ' + DATA_FILE
-
 # Default registration of tables and streams
 REGISTER_DEFAULT = '''
 REGISTER STREAM transactions (symbol STRING, sector STRING, country STRING,
@@ -104,7 +109,7 @@ IF rate >= 0.35 THEN  volume > 1000 BETTER volume <= 1000
 '''
 
 
-def gen_env_file(experiment_conf):
+def gen_env_file(experiment_conf, manifest):
     '''
     Generate environment file for range and slide
     '''
@@ -113,12 +118,10 @@ def gen_env_file(experiment_conf):
                                    qfile=exp_id,
                                    dfile=DATA_FILE)
     filename = ENV_DIR + os.sep + get_experiment_id(experiment_conf) + '.env'
-    out_file = open(filename, 'w')
-    out_file.write(text)
-    out_file.close()
+    write_artifact(filename, text, manifest)
 
 
-def gen_query_file(experiment_conf):
+def gen_query_file(experiment_conf, manifest):
     '''
     Generate query file for range and slide
     '''
@@ -129,26 +132,27 @@ def gen_query_file(experiment_conf):
                                 ran=experiment_conf[RAN],
                                 sli=experiment_conf[SLI])
     filename = QUERY_DIR + os.sep + get_experiment_id(experiment_conf) + '.cql'
-    out_file = open(filename, 'w')
-    out_file.write(text)
-    out_file.close()
+    write_artifact(filename, text, manifest)
 
 
 def gen_files(experiment_list):
     '''
     Generate all files (queries and environments)
     '''
-    # Copy imported data file and sort by timestamp
-    os.system(SORT_COMMAND)
+    # Sort imported data file by timestamp (unless prepared by prepare.py)
+    if not is_prepared(DATA_FILE):
+        prepare_data([(DATA_FILE, REGISTER_DEFAULT)])
     if not os.path.isfile(DATA_FILE):
         print 'Error copying data file\n' + \
             'Make sure that import tool was executed'
+    manifest = read_manifest(MAIN_DIR)
     # Generate query files
     for exp_conf in experiment_list:
-        gen_query_file(exp_conf)
+        gen_query_file(exp_conf, manifest)
     # Generate environment files
     for exp_conf in experiment_list:
-        gen_env_file(exp_conf)
+        gen_env_file(exp_conf, manifest)
+    write_manifest(MAIN_DIR, manifest)
 
 
 def get_experiment_id(experiment_conf):
@@ -162,26 +166,41 @@ def get_experiment_id(experiment_conf):
         SLI + str(experiment_conf[SLI]) + operation
 
 
+def get_cell_key(algorithm, experiment_id):
+    '''
+    Get key of an experiment cell over current data (prefix of its detail
+    filenames)
+    '''
+    return DETAILS_DIR + os.sep + algorithm + '-' + experiment_id + '-' + \
+        get_data_id(get_data_size([DATA_FILE]))
+
+
 def get_detail_file(algorithm, experiment_id, count):
     '''
     Get filename for experiment details
     '''
-    return DETAILS_DIR + os.sep + algorithm + '-' + \
-        experiment_id + '.' + str(count) + '.csv'
+    return get_cell_key(algorithm, experiment_id) + '.' + str(count) + '.csv'
 
 
-def run(experiment_conf, count, algorithm, iterations):
+def run(experiment_conf, count, algorithm, iterations, args):
     '''
     Run experiment for range and slide
     '''
     exp_id = get_experiment_id(experiment_conf)
     detail_file = get_detail_file(algorithm, exp_id, count)
     env_file = ENV_DIR + os.sep + exp_id + '.env'
-    if not os.path.isfile(detail_file):
+    artifact = get_artifact_digest(env_file)
+    data_size = get_data_size([DATA_FILE])
+    invalidate_outdated(detail_file, artifact)
+    if is_failed(detail_file, get_limits(args)):
+        print 'Skipping failed run: ' + detail_file
+    elif not os.path.isfile(detail_file):
         command = RUN_COMMAND.format(alg=algorithm, env=env_file,
                                      det=detail_file, ite=iterations)
-        print command
-        os.system(command)
+        prepare_cache([DATA_FILE], args)
+        run_command(command, detail_file, args.timeout,
+                    get_memory_limit(args), artifact, data_size)
+    return get_status(detail_file)
 
 
 def get_max_iteration():
@@ -194,33 +213,130 @@ def get_max_iteration():
     return int(last_rec[TS])
 
 
-def run_experiments(experiment_list):
+def run_experiments(experiment_list, args):
     '''
     Run all experiments
     '''
     iterations = get_max_iteration()
-    for count in range(RUN_COUNT):
-        for exp_conf in experiment_list:
-            for alg in ALGORITHM_LIST:
-                run(exp_conf, count + 1, alg, iterations)
+    # Configurations killed by limits for each algorithm
+    failed_dict = {alg: [] for alg in ALGORITHM_LIST}
+    rand = get_random(args)
+    model = None
+    if args.lpt:
+        model = get_model(MAIN_DIR)
+    data_size = get_data_size([DATA_FILE])
+    # Assignment of jobs to this shard by scheduler
+    assigned_dict = {}
+    if args.adaptive:
+        cell_list = get_cells(experiment_list, ALGORITHM_LIST, rand)
+        if args.lpt:
+            cell_list, assigned_dict = schedule_jobs(
+                cell_list,
+                lambda cell: get_cell_key(cell[1], get_experiment_id(cell[0])),
+                lambda cell: args.min_runs * predict(model, cell[0], cell[1],
+                                                     data_size),
+                model, args, rand,
+                lambda cell: is_cell_pending(
+                    lambda count: get_detail_file(
+                        cell[1], get_experiment_id(cell[0]), count), args))
+        for exp_conf, alg in cell_list:
+            exp_id = get_experiment_id(exp_conf)
+            if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+                print 'Skipping dominated runs: ' + alg + '-' + exp_id
+                continue
+            # Adaptive cells are claimed as a whole
+            cell_key = get_cell_key(alg, exp_id)
+            if not claim(cell_key, args, assigned_dict.get(cell_key)):
+                continue
+            status = run_adaptive(
+                lambda count: run(exp_conf, count, alg, iterations, args),
+                lambda count: get_summaries(
+                    get_detail_file(alg, exp_id, count))[0],
+                args,
+                lambda count: get_detail_file(alg, exp_id, count))
+            release(cell_key, args)
+            if status in FAILURE_LIST:
+                failed_dict[alg].append(exp_conf)
+        return
+    job_list = [(count, exp_conf, alg) for count in range(RUN_COUNT)
+                for exp_conf, alg in
+                get_cells(experiment_list, ALGORITHM_LIST, rand)]
+    if args.lpt:
+        job_list, assigned_dict = schedule_jobs(
+            job_list,
+            lambda job: get_detail_file(job[2], get_experiment_id(job[1]),
+                                        job[0] + 1),
+            lambda job: predict(model, job[1], job[2], data_size), model,
+            args, rand)
+    # Cells with warm-up runs already executed
+    warm_set = set()
+    for count, exp_conf, alg in job_list:
+        exp_id = get_experiment_id(exp_conf)
+        dfile = get_detail_file(alg, exp_id, count + 1)
+        if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+            print 'Skipping dominated run: ' + dfile
+            continue
+        if not claim(dfile, args, assigned_dict.get(dfile)):
+            # Failures of other hosts also prune configurations
+            if is_failed(dfile, get_limits(args)):
+                failed_dict[alg].append(exp_conf)
+            continue
+        if (exp_id, alg) not in warm_set and \
+                is_pending(dfile, get_limits(args)):
+            run_warmup(
+                lambda wcount: run(exp_conf, wcount, alg, iterations, args),
+                lambda wcount: get_detail_file(alg, exp_id, wcount),
+                args)
+            warm_set.add((exp_id, alg))
+        status = run(exp_conf, count + 1, alg, iterations, args)
+        release(dfile, args)
+        if status in FAILURE_LIST:
+            failed_dict[alg].append(exp_conf)
+
+
+def ingest_all(connection, experiment_list):
+    '''
+    Ingest detail files of all experiments into results database
+    '''
+    data_size = get_data_size([DATA_FILE])
+    for exp_conf in experiment_list:
+        exp_id = get_experiment_id(exp_conf)
+        artifact = get_artifact_digest(ENV_DIR + os.sep + exp_id + '.env')
+        for alg in ALGORITHM_LIST:
+            count = 1
+            dfile = get_detail_file(alg, exp_id, count)
+            # Adaptive mode may run more than RUN_COUNT repetitions
+            while count <= RUN_COUNT or os.path.isfile(dfile) or \
+                    os.path.isfile(get_resource_file(dfile)):
+                ingest(connection, MAIN_DIR, exp_id, exp_conf, alg, count,
+                       dfile, data_size, artifact)
+                count += 1
+                dfile = get_detail_file(alg, exp_id, count)
+    connection.commit()
 
 
 def summarize_all():
     '''
     Summarize all results
     '''
+    connection = connect()
+    ingest_all(connection, gen_experiment_list())
+    run_dict = get_runs(connection, MAIN_DIR, get_data_size([DATA_FILE]))
+    connection.close()
     # Summarize experiments for BEST operator
     variation = {}
     variation[RAN] = RANGE_LIST
     variation[SLI] = SLIDE_LIST
     default_values = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT, OPE: BEST}
     for parameter in variation:
-        summarize(parameter, variation[parameter], default_values)
+        summarize(run_dict, parameter, variation[parameter],
+                  default_values)
     # Summarize experiments for TOPK operator
     variation = {TOPK: TOPK_LIST}
     default_values = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT, OPE: TOPK}
     for parameter in variation:
-        summarize(parameter, variation[parameter], default_values)
+        summarize(run_dict, parameter, variation[parameter],
+                  default_values)
 
 
 def write_file(filename, record_list, key_field):
@@ -241,30 +357,41 @@ def write_file(filename, record_list, key_field):
         output_file.close()
 
 
-def summarize(parameter, value_list, default_values):
+def summarize(run_dict, parameter, value_list, default_values):
     '''
     Summarize experiments about range variation
     '''
     time_list = []
     mem_list = []
+    status_list = []
     exp_conf = default_values.copy()
     for value in value_list:
         exp_conf[parameter] = value
-        for rcount in range(RUN_COUNT):
+        exp_id = get_experiment_id(exp_conf)
+        rcount = 0
+        # Adaptive mode may run more than RUN_COUNT repetitions
+        while rcount < RUN_COUNT or \
+                any((exp_id, alg, rcount + 1) in run_dict
+                    for alg in ALGORITHM_LIST):
             time_rec = {parameter: value}
             mem_rec = {parameter: value}
+            status_rec = {parameter: value}
             for alg in ALGORITHM_LIST:
-                dfile = get_detail_file(alg, get_experiment_id(exp_conf),
-                                        rcount + 1)
-                runtime, memory = get_summaries(dfile)
+                runtime, memory, status = run_dict.get(
+                    (exp_id, alg, rcount + 1), MISSING_RUN)
                 time_rec[alg] = runtime
                 mem_rec[alg] = memory
+                status_rec[alg] = status
             time_list.append(time_rec)
             mem_list.append(mem_rec)
+            status_list.append(status_rec)
+            rcount += 1
     fname = SUMMARY_DIR + os.sep + 'runtime_' + parameter + '.csv'
     write_file(fname, time_list, parameter)
     fname = SUMMARY_DIR + os.sep + 'memory_' + parameter + '.csv'
     write_file(fname, mem_list, parameter)
+    fname = SUMMARY_DIR + os.sep + 'status_' + parameter + '.csv'
+    write_file(fname, status_list, parameter)
 
 
 def get_summaries(detail_file):
@@ -329,35 +456,32 @@ def gen_experiment_list():
     return exp_list
 
 
-def confidence_interval(parameter, in_file, out_file):
-    '''
-    Calculate final result with confidence interval
-    '''
-    if not os.path.isfile(in_file):
-        print 'File does not exists: ' + in_file
-        return
-    command = CONFINTERVAL_COMMAND.format(inf=in_file, outf=out_file,
-                                          keyf=parameter)
-    print command
-    os.system(command)
-    if not os.path.isfile(out_file):
-        print 'Output file not found: ' + out_file
-        print "Check if 'confinterval.py' is in path"
-
-
 def confidence_interval_all():
     '''
     Calculate confidence interval for all summarized results
     '''
-    # Deletions and insertions
-    par_list = [RAN, SLI, TOPK]
-    for parameter in par_list:
-        in_file = SUMMARY_DIR + os.sep + 'runtime_' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'runtime_' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
-        in_file = SUMMARY_DIR + os.sep + 'memory_' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'memory_' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
+    connection = connect()
+    data_size = get_data_size([DATA_FILE])
+    # Variations for BEST and TOPK operators
+    variation_list = [
+        ({RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT, OPE: BEST},
+         {RAN: RANGE_LIST, SLI: SLIDE_LIST}),
+        ({RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT, OPE: TOPK},
+         {TOPK: TOPK_LIST})]
+    for default_values, variation in variation_list:
+        for parameter, value_list in variation.items():
+            exp_conf = default_values.copy()
+            id_list = []
+            for value in value_list:
+                exp_conf[parameter] = value
+                id_list.append(get_experiment_id(exp_conf))
+            for field in [RUNTIME, MEMORY]:
+                out_file = RESULT_DIR + os.sep + field + '_' + parameter + \
+                    '.csv'
+                write_intervals(connection, MAIN_DIR, field, parameter,
+                                value_list, id_list, ALGORITHM_LIST, out_file,
+                                data_size=data_size)
+    connection.close()
 
 
 def get_arguments(print_help=False):
@@ -375,6 +499,7 @@ def get_arguments(print_help=False):
     parser.add_argument('-s', '--summarize', action="store_true",
                         default=False,
                         help='Summarize results')
+    add_run_arguments(parser)
 
     if print_help:
         parser.print_help()
@@ -395,12 +520,16 @@ def main():
         gen_files(exp_list)
     elif args.run:
         print 'Running experiments'
-        run_experiments(exp_list)
-    elif args.summarize:
-        print 'Summarizing results'
-        summarize_all()
-        print 'Calculating confidence intervals'
-        confidence_interval_all()
+        run_experiments(exp_list, args)
+    elif args.merge or args.summarize:
+        if args.merge:
+            print 'Merging results'
+            merge_directories(args.merge, DETAILS_DIR)
+        if args.summarize:
+            print 'Summarizing results'
+            summarize_all()
+            print 'Calculating confidence intervals'
+            confidence_interval_all()
     else:
         get_arguments(True)
 
@@ -8,8 +8,19 @@ using preference operators
 import csv
 import os
 
-from yfimport import TRANSACTION_FILE, TRANSACTION_HEADER, get_max_timestamp,\
-    PRICE, RATE
+from experiment import FAILURE_LIST, add_crossover_arguments,\
+    add_run_arguments, claim, find_crossover, get_artifact_digest, get_cells,\
+    get_data_id, get_data_size, get_env_data_files, get_limits,\
+    get_memory_limit, get_random, get_resource_file, get_status,\
+    invalidate_outdated, is_cell_pending, is_failed, is_pending, is_pruned,\
+    merge_directories, prepare_cache, print_crossover, read_manifest, release,\
+    run_adaptive, run_cell, run_command, run_warmup, write_artifact,\
+    write_manifest
+from prepare import is_prepared, prepare_data
+from schedule import get_model, predict, schedule_jobs
+from warehouse import MISSING_RUN, connect, get_runs, ingest, write_intervals
+from yfimport import TRANSACTION_HEADER, get_max_timestamp,\
+    PRICE, RATE, TS
 
 # =============================================================================
 # Directories and filenames
@@ -28,6 +39,8 @@ DIR_LIST = [MAIN_DIR, DETAIL_DIR, SUMMARY_DIR, RESULT_DIR, DATA_DIR,
 
 DATA_FILE = DATA_DIR + os.sep + 's.csv'
 TUP_FILE = DATA_DIR + os.sep + 'tup.csv'
+# Prefix of files with transitive tuples of windows of each range
+TUP_WINDOW_PREFIX = DATA_DIR + os.sep + 'tup-'
 
 # =============================================================================
 # Experiment execution
@@ -39,14 +52,6 @@ TPREF_RUN_COMMAND = \
     "streampref -r'|' -e {env} -d {det} -m {ite} -t {alg}"
 # Command for experiment run
 CQL_RUN_COMMAND = "streampref -r'|' -e {env} -d {det} -m {ite}"
-# Command for calculation of confidence interval
-CONFINTERVAL_COMMAND = \
-    "confinterval -i {inf} -o {outf} -k {keyf}"
-# Command for sort stream file download
-SORT_COMMAND = \
-    "cat " + TRANSACTION_FILE + \
-    " | cut -d'|' -f1,2,5,7,8 | sort -g > " + DATA_FILE
-
 # =============================================================================
 # Experiment parameters
 # =============================================================================
@@ -56,6 +61,9 @@ RAN = 'ran'
 SLI = 'sli'
 # Identifier attributes
 PARAMETER_LIST = [RAN, SLI]
+# Parameter variation that makes an experiment harder
+# (1: greater values, -1: smaller values)
+HARDER_DICT = {RAN: 1, SLI: -1}
 
 # =============================================================================
 # Parameters for query generation
@@ -314,8 +322,8 @@ INPUT '{dfile}';'''
 REG_PREF_STR = "\n\nREGISTER QUERY pref \nINPUT '{qfile}';"
 # CQL
 # Transitive tuples
-REG_TUP_STR = "\nREGISTER TABLE tup (price FLOAT, rate FLOAT) \nINPUT '" + \
-    TUP_FILE + "';"
+REG_TUP_STR = \
+    "\nREGISTER TABLE tup (price FLOAT, rate FLOAT) \nINPUT '{tfile}';"
 # Sequences
 REG_Z_STR = "\n\nREGISTER QUERY z \nINPUT '{qfile}';"
 # Positions to be compared
@@ -370,7 +378,7 @@ def get_experiment_id(experiment_conf):
         SLI + str(experiment_conf[SLI])
 
 
-def gen_pref_query(experiment_conf):
+def gen_pref_query(experiment_conf, manifest):
     '''
     Generate StreamPref queries with BESTSEQ operator
     '''
@@ -378,76 +386,208 @@ def gen_pref_query(experiment_conf):
     filename = TPREF_QUERY_DIR + os.sep + query_id + '.cql'
     query = PREF_QUERY.format(ran=experiment_conf[RAN],
                               sli=experiment_conf[SLI])
-    out_file = open(filename, 'w')
-    out_file.write(query)
-    out_file.close()
+    write_artifact(filename, query, manifest)
+
+
+def get_tup_size(price_dict, rate_dict):
+    '''
+    Return number of records and bytes of transitive tuples file
+    '''
+    price_len = sum(len(value) for value in price_dict.values())
+    rate_len = sum(len(value) for value in rate_dict.values())
+    row_count = len(price_dict) * len(rate_dict)
+    # Row format: 0|+|price|rate\r\n
+    size = row_count * len('0|+|' + '|' + '\r\n') + \
+        price_len * len(rate_dict) + rate_len * len(price_dict)
+    header = '|'.join([TS_ATT, FL_ATT, PRICE, RATE]) + '\r\n'
+    return row_count, size + len(header)
 
 
-def gen_transitive_tup():
+def gen_transitive_tup(max_tup=None):
     '''
     Generate tuples for equivalence of transitive closure
     '''
     in_file = open(DATA_FILE, 'r')
     reader = csv.DictReader(in_file, skipinitialspace=True, dialect='table')
-    price_set = set([100])
-    rate_set = set([0.25])
-    # Read all values of price and rate of input data
+    price_dict = {100.0: '100'}
+    rate_dict = {0.25: '0.25'}
+    # Read all values of price and rate of input data (deduplicated by
+    # numeric value)
     for rec in reader:
-        price_set.add(rec[PRICE])
-        rate_set.add(rec[RATE])
-    rec_list = []
-    # Cartesian product between price and rate
-    for price in price_set:
-        for rate in rate_set:
-            rec = {TS_ATT: 0, FL_ATT: '+', PRICE: price, RATE: rate}
-            rec_list.append(rec)
+        price_dict.setdefault(float(rec[PRICE]), rec[PRICE])
+        rate_dict.setdefault(float(rec[RATE]), rec[RATE])
+    in_file.close()
+    row_count, size = get_tup_size(price_dict, rate_dict)
+    print 'Transitive tuples: ' + str(len(price_dict)) + ' prices x ' + \
+        str(len(rate_dict)) + ' rates = ' + str(row_count) + \
+        ' records (' + str(round(size / (1024.0 * 1024), 1)) + ' MB)'
+    if max_tup is not None and row_count > max_tup:
+        print 'Transitive tuples exceed maximum (' + str(max_tup) + \
+            '), file not generated: ' + TUP_FILE
+        if os.path.isfile(TUP_FILE):
+            os.remove(TUP_FILE)
+        return
     att_name_list = [TS_ATT, FL_ATT, PRICE, RATE]
-    # Store records on file
+    # Cartesian product between price and rate streamed to file
     out_file = open(TUP_FILE, 'w')
-    out_write = csv.DictWriter(out_file, att_name_list, dialect='table')
-    out_write.writeheader()
-    out_write.writerows(rec_list)
+    out_write = csv.writer(out_file, dialect='table')
+    out_write.writerow(att_name_list)
+    rate_list = [rate_dict[rate] for rate in sorted(rate_dict)]
+    for price in sorted(price_dict):
+        for rate in rate_list:
+            out_write.writerow([0, '+', price_dict[price], rate])
     out_file.close()
 
 
-def gen_cql_queries(experiment_conf):  # IGNORE:too-many-statements
+def get_tup_window_file(ran):
+    '''
+    Return file of transitive tuples of windows of a range
+    '''
+    return TUP_WINDOW_PREFIX + get_id({RAN: ran}, [RAN]) + '.csv'
+
+
+def read_ts_domain():
+    '''
+    Return price and rate values of input data indexed by timestamp and the
+    textual form of each value (deduplicated by numeric value)
+    '''
+    in_file = open(DATA_FILE, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True, dialect='table')
+    ts_dict = {}
+    text_dict = {PRICE: {100.0: '100'}, RATE: {0.25: '0.25'}}
+    for rec in reader:
+        value_dict = ts_dict.setdefault(int(rec[TS]),
+                                        {PRICE: set(), RATE: set()})
+        for att in [PRICE, RATE]:
+            value = float(rec[att])
+            text_dict[att].setdefault(value, rec[att])
+            value_dict[att].add(value)
+    in_file.close()
+    return ts_dict, text_dict
+
+
+def write_product(out_write, timestamp, flag, price_list, rate_list,
+                  text_dict):
+    '''
+    Write Cartesian product between prices and rates, return number of
+    records
+    '''
+    for price in sorted(price_list):
+        for rate in sorted(rate_list):
+            out_write.writerow([timestamp, flag, text_dict[PRICE][price],
+                                text_dict[RATE][rate]])
+    return len(price_list) * len(rate_list)
+
+
+def gen_window_tup(ts_dict, text_dict, ran, max_tup=None):
+    '''
+    Generate stream of transitive tuples holding only the price and rate
+    domain of the window of each timestamp (changes are inserted and deleted)
+
+    The file is not generated when its records exceed max_tup
+    '''
+    att_list = [PRICE, RATE]
+    # Timestamps in window of each value (constants of preferences are never
+    # removed)
+    count_dict = {PRICE: {100.0: 1}, RATE: {0.25: 1}}
+    out_file = open(get_tup_window_file(ran), 'w')
+    out_write = csv.writer(out_file, dialect='table')
+    out_write.writerow([TS_ATT, FL_ATT, PRICE, RATE])
+    row_count = write_product(out_write, 0, '+', [100.0], [0.25], text_dict)
+    max_active = 1
+    empty_dict = {PRICE: set(), RATE: set()}
+    for timestamp in range(min(ts_dict), max(ts_dict) + 1):
+        added = {PRICE: set(), RATE: set()}
+        removed = {PRICE: set(), RATE: set()}
+        for att in att_list:
+            # Values of timestamp leaving the window
+            for value in ts_dict.get(timestamp - ran, empty_dict)[att]:
+                count_dict[att][value] -= 1
+                if not count_dict[att][value]:
+                    del count_dict[att][value]
+                    removed[att].add(value)
+            # Values of timestamp entering the window
+            for value in ts_dict.get(timestamp, empty_dict)[att]:
+                count = count_dict[att].get(value, 0)
+                if not count:
+                    if value in removed[att]:
+                        removed[att].remove(value)
+                    else:
+                        added[att].add(value)
+                count_dict[att][value] = count + 1
+        new_price = set(count_dict[PRICE])
+        new_rate = set(count_dict[RATE])
+        old_price = (new_price - added[PRICE]) | removed[PRICE]
+        old_rate = (new_rate - added[RATE]) | removed[RATE]
+        # Combinations with a removed value
+        row_count += write_product(out_write, timestamp, '-', removed[PRICE],
+                                   old_rate, text_dict)
+        row_count += write_product(out_write, timestamp, '-',
+                                   old_price - removed[PRICE], removed[RATE],
+                                   text_dict)
+        # Combinations with an added value
+        row_count += write_product(out_write, timestamp, '+', added[PRICE],
+                                   new_rate, text_dict)
+        row_count += write_product(out_write, timestamp, '+',
+                                   new_price - added[PRICE], added[RATE],
+                                   text_dict)
+        max_active = max(max_active, len(new_price) * len(new_rate))
+        if max_tup is not None and row_count > max_tup:
+            out_file.close()
+            print 'Window transitive tuples (' + RAN + ' ' + str(ran) + \
+                ') exceed maximum (' + str(max_tup) + \
+                '), file not generated: ' + get_tup_window_file(ran)
+            os.remove(get_tup_window_file(ran))
+            return
+    out_file.close()
+    print 'Window transitive tuples (' + RAN + ' ' + str(ran) + '): ' + \
+        str(row_count) + ' records, at most ' + str(max_active) + \
+        ' in a window'
+
+
+def gen_all_window_tup(max_tup=None):
+    '''
+    Generate files of transitive tuples of windows for all ranges
+    '''
+    ts_dict, text_dict = read_ts_domain()
+    if not ts_dict:
+        print 'Empty data file: ' + DATA_FILE
+        return
+    for ran in RANGE_LIST:
+        gen_window_tup(ts_dict, text_dict, ran, max_tup)
+
+
+def gen_cql_queries(experiment_conf, manifest):
     '''
     Generate queries with CQL original operators equivalent to BESTSEQ operator
     '''
     # Generate query z (sequences)
     query = Q_Z.format(N=experiment_conf[RAN],
                        L=experiment_conf[SLI])
-    out_file = open(CQL_QUERY_DIR + os.sep + 'z-' +
-                    get_experiment_id(experiment_conf) + '.cql', 'w')
-    out_file.write(query)
-    out_file.close()
+    write_artifact(CQL_QUERY_DIR + os.sep + 'z-' +
+                   get_experiment_id(experiment_conf) + '.cql', query,
+                   manifest)
     # Remaining queries
     for query_id in Q_ID_LIST:
         filename = CQL_QUERY_DIR + os.sep + query_id + '.cql'
-        query = Q_DICT[query_id]
-        out_file = open(filename, 'w')
-        out_file.write(query)
-        out_file.close()
+        write_artifact(filename, Q_DICT[query_id], manifest)
 
 
-def gen_pref_env(experiment_conf):
+def gen_pref_env(experiment_conf, manifest):
     '''
     Generate environment files for SEQ operator
     '''
     # environment files for SEQ operator
     filename = TPREF_ENV_DIR + os.sep + get_id(experiment_conf) + '.env'
-    if not os.path.isfile(filename):
-        text = REG_STREAM_STR.format(dfile=DATA_FILE)
-        text += '\n\n' + '#' * 80 + '\n\n'
-        query_file = TPREF_QUERY_DIR + os.sep \
-            + get_id(experiment_conf, [RAN, SLI]) + '.cql'
-        text += REG_Z_STR.format(qfile=query_file)
-        out_file = open(filename, 'w')
-        out_file.write(text)
-        out_file.close()
+    text = REG_STREAM_STR.format(dfile=DATA_FILE)
+    text += '\n\n' + '#' * 80 + '\n\n'
+    query_file = TPREF_QUERY_DIR + os.sep \
+        + get_id(experiment_conf, [RAN, SLI]) + '.cql'
+    text += REG_Z_STR.format(qfile=query_file)
+    write_artifact(filename, text, manifest)
 
 
-def gen_cql_env(experiment_conf):
+def gen_cql_env(experiment_conf, manifest, window_tup=False):
     '''
     Generate environment files for StremPref
     '''
@@ -455,7 +595,10 @@ def gen_cql_env(experiment_conf):
     text = REG_STREAM_STR.format(dfile=DATA_FILE)
     text += '\n\n' + '#' * 80 + '\n\n'
     # Trasitive tuples
-    text += REG_TUP_STR
+    tup_file = TUP_FILE
+    if window_tup:
+        tup_file = get_tup_window_file(experiment_conf[RAN])
+    text += REG_TUP_STR.format(tfile=tup_file)
     # Sequences
     filename = CQL_QUERY_DIR + os.sep + 'z-' + \
         get_experiment_id(experiment_conf) + '.cql'
@@ -465,75 +608,230 @@ def gen_cql_env(experiment_conf):
         filename = CQL_QUERY_DIR + os.sep + query_id + '.cql'
         text += REG_Q_STR.format(qname=query_id, qfile=filename)
     filename = CQL_ENV_DIR + os.sep + get_id(experiment_conf) + '.env'
-    out_file = open(filename, 'w')
-    out_file.write(text)
-    out_file.close()
+    write_artifact(filename, text, manifest)
+
+
+def get_cell_key(experiment_conf, algorithm):
+    '''
+    Return key of an experiment cell over current data (prefix of its detail
+    filenames)
+    '''
+    return DETAIL_DIR + os.sep + algorithm + '-' + get_id(experiment_conf) \
+        + '-' + get_data_id(get_data_size([DATA_FILE]))
 
 
 def get_detail_file(experiment_conf, algorithm, count):
     '''
     Return detail filename
     '''
-    return DETAIL_DIR + os.sep + algorithm + '-' + get_id(experiment_conf) \
-        + '-' + str(count) + '.csv'
+    return get_cell_key(experiment_conf, algorithm) + '-' + str(count) + \
+        '.csv'
 
 
-def run(experiment_conf, algorithm, count, iterations):
+def get_env_file(experiment_conf, algorithm):
     '''
-    Run experiment for range and slide
+    Return environment filename used by an algorithm
     '''
-    exp_id = get_id(experiment_conf)
     env_dir = TPREF_ENV_DIR
     if algorithm == CQL:
         env_dir = CQL_ENV_DIR
-    env_file = env_dir + os.sep + exp_id + '.env'
+    return env_dir + os.sep + get_id(experiment_conf) + '.env'
+
+
+def get_missing_data(experiment_conf, algorithm):
+    '''
+    Return data files registered by the environment of an algorithm that do
+    not exist (transitive tuples over maximum are not generated)
+    '''
+    return [filename for filename in
+            get_env_data_files(get_env_file(experiment_conf, algorithm))
+            if not os.path.isfile(filename)]
+
+
+def run(experiment_conf, algorithm, count, iterations, args):
+    '''
+    Run experiment for range and slide
+    '''
+    env_file = get_env_file(experiment_conf, algorithm)
     detail_file = get_detail_file(experiment_conf, algorithm, count)
-    if not os.path.isfile(detail_file):
+    artifact = get_artifact_digest(env_file)
+    data_size = get_data_size([DATA_FILE])
+    invalidate_outdated(detail_file, artifact)
+    missing_list = get_missing_data(experiment_conf, algorithm)
+    if is_failed(detail_file, get_limits(args)):
+        print 'Skipping failed run: ' + detail_file
+    elif missing_list and not os.path.isfile(detail_file):
+        print 'Skipping run without data file ' + missing_list[0] + ': ' + \
+            detail_file
+    elif not os.path.isfile(detail_file):
         if algorithm == CQL:
             command = CQL_RUN_COMMAND.format(env=env_file, det=detail_file,
                                              ite=iterations)
         else:
             command = TPREF_RUN_COMMAND.format(env=env_file, det=detail_file,
                                                ite=iterations, alg=algorithm)
-        print command
-        os.system(command)
-        if not os.path.isfile(detail_file):
+        # Only tuples registered by the environment of the run are warmed
+        prepare_cache(get_env_data_files(env_file), args)
+        run_command(command, detail_file, args.timeout,
+                    get_memory_limit(args), artifact, data_size)
+        if not os.path.isfile(detail_file) and not is_failed(detail_file):
             print 'Detail results file not found: ' + detail_file
             print "Check if 'streampref' is in path"
+    return get_status(detail_file)
 
 
-def run_experiments(experiment_list):
+def run_experiments(experiment_list, args):
     '''
     Run all experiments
     '''
     max_ts = get_max_timestamp(DATA_FILE, TRANSACTION_HEADER)
-    for count in range(1, RUN_COUNT+1):
-        for exp_conf in experiment_list:
-            for alg in ALGORITHM_LIST:
-                run(exp_conf, alg, count, max_ts)
+    # Configurations killed by limits for each algorithm
+    failed_dict = {alg: [] for alg in ALGORITHM_LIST}
+    rand = get_random(args)
+    model = None
+    if args.lpt:
+        model = get_model(MAIN_DIR)
+    data_size = get_data_size([DATA_FILE])
+    # Cells without transitive tuples (over --max-tup) are skipped
+    cell_list = []
+    for exp_conf, alg in get_cells(experiment_list, ALGORITHM_LIST, rand):
+        missing_list = get_missing_data(exp_conf, alg)
+        if missing_list:
+            print 'Skipping runs without data file ' + missing_list[0] + \
+                ': ' + alg + '-' + get_id(exp_conf)
+        else:
+            cell_list.append((exp_conf, alg))
+    # Assignment of jobs to this shard by scheduler
+    assigned_dict = {}
+    if args.adaptive:
+        if args.lpt:
+            cell_list, assigned_dict = schedule_jobs(
+                cell_list,
+                lambda cell: get_cell_key(cell[0], cell[1]),
+                lambda cell: args.min_runs * predict(model, cell[0], cell[1],
+                                                     data_size),
+                model, args, rand,
+                lambda cell: is_cell_pending(
+                    lambda count: get_detail_file(cell[0], cell[1], count),
+                    args))
+        for exp_conf, alg in cell_list:
+            if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+                print 'Skipping dominated runs: ' + alg + '-' + \
+                    get_id(exp_conf)
+                continue
+            # Adaptive cells are claimed as a whole
+            cell_key = get_cell_key(exp_conf, alg)
+            if not claim(cell_key, args, assigned_dict.get(cell_key)):
+                continue
+            status = run_adaptive(
+                lambda count: run(exp_conf, alg, count, max_ts, args),
+                lambda count: get_summaries(
+                    get_detail_file(exp_conf, alg, count))[0],
+                args,
+                lambda count: get_detail_file(exp_conf, alg, count))
+            release(cell_key, args)
+            if status in FAILURE_LIST:
+                failed_dict[alg].append(exp_conf)
+        return
+    job_list = [(count, exp_conf, alg) for count in range(1, RUN_COUNT+1)
+                for exp_conf, alg in cell_list]
+    if args.lpt:
+        job_list, assigned_dict = schedule_jobs(
+            job_list, lambda job: get_detail_file(job[1], job[2], job[0]),
+            lambda job: predict(model, job[1], job[2], data_size), model,
+            args, rand)
+    # Cells with warm-up runs already executed
+    warm_set = set()
+    for count, exp_conf, alg in job_list:
+        dfile = get_detail_file(exp_conf, alg, count)
+        if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+            print 'Skipping dominated run: ' + dfile
+            continue
+        if not claim(dfile, args, assigned_dict.get(dfile)):
+            # Failures of other hosts also prune configurations
+            if is_failed(dfile, get_limits(args)):
+                failed_dict[alg].append(exp_conf)
+            continue
+        cell = (get_id(exp_conf), alg)
+        if cell not in warm_set and is_pending(dfile, get_limits(args)):
+            run_warmup(
+                lambda wcount: run(exp_conf, alg, wcount, max_ts, args),
+                lambda wcount: get_detail_file(exp_conf, alg, wcount),
+                args)
+            warm_set.add(cell)
+        status = run(exp_conf, alg, count, max_ts, args)
+        release(dfile, args)
+        if status in FAILURE_LIST:
+            failed_dict[alg].append(exp_conf)
+
+
+def get_crossover_means(experiment_conf, manifest, max_ts, args):
+    '''
+    Run both algorithms of crossover search and return their mean runtimes
+    '''
+    # Values out of the grid have no queries and environments yet
+    tup_file = get_tup_window_file(experiment_conf[RAN])
+    if args.window_tup and not os.path.isfile(tup_file):
+        ts_dict, text_dict = read_ts_domain()
+        gen_window_tup(ts_dict, text_dict, experiment_conf[RAN],
+                       args.max_tup)
+    gen_all_queries([experiment_conf], manifest)
+    gen_all_env_files([experiment_conf], manifest, args.window_tup)
+    mean_list = []
+    for alg in args.crossover:
+        mean_list.append(run_cell(
+            lambda count: run(experiment_conf, alg, count, max_ts, args),
+            lambda count: get_summaries(
+                get_detail_file(experiment_conf, alg, count))[0],
+            lambda count: get_detail_file(experiment_conf, alg, count),
+            RUN_COUNT, args))
+    print 'Evaluated ' + get_id(experiment_conf) + ': ' + \
+        ', '.join([alg + ' ' + str(mean)
+                   for alg, mean in zip(args.crossover, mean_list)])
+    return tuple(mean_list)
+
+
+def run_crossover(args):
+    '''
+    Search value of a parameter where runtimes of two algorithms cross
+    '''
+    max_ts = get_max_timestamp(DATA_FILE, TRANSACTION_HEADER)
+    def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
+    # Variations
+    var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
+    low, high = args.bounds or (min(var_dict[args.axis]),
+                                max(var_dict[args.axis]))
+    manifest = read_manifest(MAIN_DIR)
+    mean_dict, bracket = find_crossover(
+        lambda value: get_crossover_means(dict(def_conf, **{args.axis: value}),
+                                          manifest, max_ts, args),
+        low, high)
+    write_manifest(MAIN_DIR, manifest)
+    print_crossover(args.crossover, args.axis, mean_dict, bracket)
 
 
 def gen_data_files():
     '''
     Generate all files (queries and environments)
     '''
-    # Copy imported data file and sort by timestamp
-    os.system(SORT_COMMAND)
+    # Sort imported data file by timestamp (unless prepared by prepare.py)
+    if not is_prepared(DATA_FILE):
+        prepare_data([(DATA_FILE, REG_STREAM_STR)])
     if not os.path.isfile(DATA_FILE):
         print 'Error copying data file\n' + \
             'Make sure that import tool was executed'
 
 
-def gen_all_env_files(experiment_list):
+def gen_all_env_files(experiment_list, manifest, window_tup=False):
     '''
     Generate all environment files
     '''
     for exp_conf in experiment_list:
-        gen_pref_env(exp_conf)
-        gen_cql_env(exp_conf)
+        gen_pref_env(exp_conf, manifest)
+        gen_cql_env(exp_conf, manifest, window_tup)
 
 
-def gen_all_queries(experiment_list):
+def gen_all_queries(experiment_list, manifest):
     '''
     Generate all query files
     '''
@@ -545,44 +843,80 @@ def gen_all_queries(experiment_list):
         if exp_id not in generated_set:
             generated_set.add(exp_id)
             # Generate queries
-            gen_cql_queries(exp)
-            gen_pref_query(exp)
+            gen_cql_queries(exp, manifest)
+            gen_pref_query(exp, manifest)
+
+
+def ingest_all(connection, experiment_list):
+    '''
+    Ingest detail files of all experiments into results database
+    '''
+    data_size = get_data_size([DATA_FILE])
+    for exp_conf in experiment_list:
+        for alg in ALGORITHM_LIST:
+            artifact = get_artifact_digest(get_env_file(exp_conf, alg))
+            count = 1
+            dfile = get_detail_file(exp_conf, alg, count)
+            # Adaptive mode may run more than RUN_COUNT repetitions
+            while count <= RUN_COUNT or os.path.isfile(dfile) or \
+                    os.path.isfile(get_resource_file(dfile)):
+                ingest(connection, MAIN_DIR, get_id(exp_conf), exp_conf, alg,
+                       count, dfile, data_size, artifact)
+                count += 1
+                dfile = get_detail_file(exp_conf, alg, count)
+    connection.commit()
 
 
 def summarize_all():
     '''
     Summarize all results
     '''
+    connection = connect()
+    ingest_all(connection, gen_experiment_list())
+    run_dict = get_runs(connection, MAIN_DIR, get_data_size([DATA_FILE]))
+    connection.close()
     def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
     # Variations
     var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
     for par, par_list in var_dict.items():
-        summarize(par, par_list, def_conf)
+        summarize(run_dict, par, par_list, def_conf)
 
 
-def summarize(parameter, value_list, default_values):
+def summarize(run_dict, parameter, value_list, default_values):
     '''
     Summarize experiments about range variation
     '''
     time_list = []
     mem_list = []
+    status_list = []
     exp_conf = default_values.copy()
     for value in value_list:
         exp_conf[parameter] = value
-        for rcount in range(1, RUN_COUNT + 1):
+        exp_id = get_id(exp_conf)
+        rcount = 1
+        # Adaptive mode may run more than RUN_COUNT repetitions
+        while rcount <= RUN_COUNT or \
+                any((exp_id, alg, rcount) in run_dict
+                    for alg in ALGORITHM_LIST):
             time_rec = {parameter: value}
             mem_rec = {parameter: value}
+            status_rec = {parameter: value}
             for alg in ALGORITHM_LIST:
-                dfile = get_detail_file(exp_conf, alg, rcount)
-                runtime, memory = get_summaries(dfile)
+                runtime, memory, status = run_dict.get((exp_id, alg, rcount),
+                                                       MISSING_RUN)
                 time_rec[alg] = runtime
                 mem_rec[alg] = memory
+                status_rec[alg] = status
             time_list.append(time_rec)
             mem_list.append(mem_rec)
+            status_list.append(status_rec)
+            rcount += 1
     fname = SUMMARY_DIR + os.sep + 'runtime-' + parameter + '.csv'
     write_file(fname, time_list, parameter)
     fname = SUMMARY_DIR + os.sep + 'memory-' + parameter + '.csv'
     write_file(fname, mem_list, parameter)
+    fname = SUMMARY_DIR + os.sep + 'status-' + parameter + '.csv'
+    write_file(fname, status_list, parameter)
 
 
 def write_file(filename, record_list, key_field):
@@ -623,34 +957,27 @@ def get_summaries(detail_file):
     return (sum_time, sum_memory / count)
 
 
-def confidence_interval(parameter, in_file, out_file):
-    '''
-    Calculate final result with confidence interval
-    '''
-    if not os.path.isfile(in_file):
-        print 'File does not exists: ' + in_file
-        return
-    command = CONFINTERVAL_COMMAND.format(inf=in_file, outf=out_file,
-                                          keyf=parameter)
-    print command
-    os.system(command)
-    if not os.path.isfile(out_file):
-        print 'Output file not found: ' + out_file
-        print "Check if 'confinterval.py' is in path"
-
-
 def confidence_interval_all():
     '''
     Calculate confidence interval for all summarized results
     '''
-    # Deletions and insertions
-    for parameter in PARAMETER_LIST:
-        in_file = SUMMARY_DIR + os.sep + 'runtime-' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'runtime-' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
-        in_file = SUMMARY_DIR + os.sep + 'memory-' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'memory-' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
+    connection = connect()
+    data_size = get_data_size([DATA_FILE])
+    def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
+    # Variations
+    var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
+    for parameter, value_list in var_dict.items():
+        exp_conf = def_conf.copy()
+        id_list = []
+        for value in value_list:
+            exp_conf[parameter] = value
+            id_list.append(get_id(exp_conf))
+        for field in [RUNTIME, MEMORY]:
+            out_file = RESULT_DIR + os.sep + field + '-' + parameter + '.csv'
+            write_intervals(connection, MAIN_DIR, field, parameter,
+                            value_list, id_list, ALGORITHM_LIST, out_file,
+                            data_size=data_size)
+    connection.close()
 
 
 def get_arguments(print_help=False):
@@ -668,6 +995,17 @@ def get_arguments(print_help=False):
     parser.add_argument('-s', '--summarize', action="store_true",
                         default=False,
                         help='Summarize results')
+    parser.add_argument('--max-tup', action="store", type=int,
+                        default=None,
+                        help='Maximum number of transitive tuples ' +
+                        '(tuples are not generated above it, also for ' +
+                        'each stream of --window-tup, and CQL runs are ' +
+                        'skipped)')
+    parser.add_argument('--window-tup', action="store_true", default=False,
+                        help='Generate transitive tuples as a stream ' +
+                        'with the domain of each window')
+    add_run_arguments(parser)
+    add_crossover_arguments(parser, ALGORITHM_LIST, PARAMETER_LIST)
     args = parser.parse_args()
     if print_help:
         parser.print_help()
@@ -694,19 +1032,31 @@ def main():
     if args.gen:
         print 'Generating data files'
         gen_data_files()
-        gen_transitive_tup()
+        if args.window_tup:
+            gen_all_window_tup(args.max_tup)
+        else:
+            gen_transitive_tup(args.max_tup)
+        manifest = read_manifest(MAIN_DIR)
         print 'Generating queries'
-        gen_all_queries(exp_list)
+        gen_all_queries(exp_list, manifest)
         print 'Generating environments'
-        gen_all_env_files(exp_list)
+        gen_all_env_files(exp_list, manifest, args.window_tup)
+        write_manifest(MAIN_DIR, manifest)
     elif args.run:
         print 'Running experiments'
-        run_experiments(exp_list)
-    elif args.summarize:
-        print 'Summarizing results'
-        summarize_all()
-        print 'Calculating confidence intervals'
-        confidence_interval_all()
+        run_experiments(exp_list, args)
+    elif args.crossover:
+        print 'Searching crossover'
+        run_crossover(args)
+    elif args.merge or args.summarize:
+        if args.merge:
+            print 'Merging results'
+            merge_directories(args.merge, DETAIL_DIR)
+        if args.summarize:
+            print 'Summarizing results'
+            summarize_all()
+            print 'Calculating confidence intervals'
+            confidence_interval_all()
     else:
         get_arguments(True)
 
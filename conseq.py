@@ -8,7 +8,20 @@ using CONSEQ operator
 import csv
 import os
 
-from yfimport import TRANSACTION_FILE, TRANSACTION_HEADER, get_max_timestamp
+from experiment import FAILURE_LIST, add_crossover_arguments,\
+    add_run_arguments, claim, find_crossover, get_artifact_digest, get_cells,\
+    get_data_id, get_data_size, get_limits, get_memory_limit, get_random,\
+    get_resource_file, get_status, invalidate_outdated, is_cell_pending,\
+    is_failed, is_pending, is_pruned, merge_directories, prepare_cache,\
+    print_crossover, read_manifest, release, run_adaptive, run_cell,\
+    run_command, run_warmup, write_artifact, write_manifest
+from preflight import add_preflight_arguments, get_predictor,\
+    is_over_budget
+from prepare import is_prepared, prepare_data
+from schedule import get_model, predict, schedule_jobs
+from streamstats import get_window_stats
+from warehouse import MISSING_RUN, connect, get_runs, ingest, write_intervals
+from yfimport import TRANSACTION_HEADER, get_max_timestamp
 
 
 # =============================================================================
@@ -40,13 +53,6 @@ CQL_RUN_COMMAND = \
 # CONSEQ operator
 CONSEQ_RUN_COMMAND = \
     "streampref -r'|' -e {env} -d {det} -m {max} -s {alg}"
-# Command for calculation of confidence interval
-CONFINTERVAL_COMMAND = \
-    "confinterval -i {inf} -o {outf} -k {keyf}"
-# Command for sort stream file download
-SORT_COMMAND = \
-    'cat ' + TRANSACTION_FILE + ' | sort -g > ' + DATA_FILE
-
 # =============================================================================
 # Experiment parameters
 # =============================================================================
@@ -56,6 +62,9 @@ RAN = 'ran'
 SLI = 'sli'
 # Identifier attributes
 PARAMETER_LIST = [RAN, SLI]
+# Parameter variation that makes an experiment harder
+# (1: greater values, -1: smaller values)
+HARDER_DICT = {RAN: 1, SLI: -1}
 
 # =============================================================================
 # Parameters for query generation
@@ -255,62 +264,38 @@ def gen_experiment_list():
     return exp_list
 
 
-def gen_endseq_query(experiment_conf):
+def gen_endseq_query(experiment_conf, manifest):
     '''
     Generate queries with SEQ operator
     '''
     filename = CONSEQ_QUERY_DIR + os.sep \
         + get_id(experiment_conf, [RAN, SLI]) + '.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        query = Q_Z.format(ran=experiment_conf[RAN],
-                                 sli=experiment_conf[SLI])
-        out_file.write(query)
-        out_file.close()
+    query = Q_Z.format(ran=experiment_conf[RAN],
+                       sli=experiment_conf[SLI])
+    write_artifact(filename, query, manifest)
 
 
-def gen_common_cql_queries():
+def gen_common_cql_queries(manifest):
     '''
     Generate common CQL queries
     '''
     filename = CQL_QUERY_DIR + os.sep + 'table_ots.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(TABLE_ORIGINAL_TS_QUERY)
-        out_file.close()
+    write_artifact(filename, TABLE_ORIGINAL_TS_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'stream_ots.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(STREAM_ORIGINAL_TS_QUERY)
-        out_file.close()
+    write_artifact(filename, STREAM_ORIGINAL_TS_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'consecutive_pos.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(CONSECUTIVE_POS_QUERY)
-        out_file.close()
+    write_artifact(filename, CONSECUTIVE_POS_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'first_pos.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(FIRST_POS_QUERY)
-        out_file.close()
+    write_artifact(filename, FIRST_POS_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'start_end_follow.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(START_END_FOLLOWING_QUERY)
-        out_file.close()
+    write_artifact(filename, START_END_FOLLOWING_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'start_end.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(START_END_QUERY)
-        out_file.close()
+    write_artifact(filename, START_END_QUERY, manifest)
     filename = CQL_QUERY_DIR + os.sep + 'equiv.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(CONSEQ_EQUIV_QUERY)
-        out_file.close()
+    write_artifact(filename, CONSEQ_EQUIV_QUERY, manifest)
 
 
-def gen_seq_ots_query(experiment_conf):
+def gen_seq_ots_query(experiment_conf, manifest):
     '''
     Generate query to select sequences with original timestamp as OTS attribute
     '''
@@ -319,39 +304,33 @@ def gen_seq_ots_query(experiment_conf):
     query = SEQ_ORIGINAL_TS_QUERY.format(ran=range_value, sli=slide_value)
     filename = CQL_QUERY_DIR + os.sep + 'seq_ots-' \
         + get_id(experiment_conf, [RAN, SLI]) + '.cql'
-    if not os.path.isfile(filename):
-        out_file = open(filename, 'w')
-        out_file.write(query)
-        out_file.close()
+    write_artifact(filename, query, manifest)
 
 
-def gen_all_cql_queries(experiment_list):
+def gen_all_cql_queries(experiment_list, manifest):
     '''
     Generate all CQL queries equivalent to SEQ operator
     '''
-    gen_common_cql_queries()
+    gen_common_cql_queries(manifest)
     for exp_conf in experiment_list:
-        gen_seq_ots_query(exp_conf)
+        gen_seq_ots_query(exp_conf, manifest)
 
 
-def gen_conseq_env(experiment_conf):
+def gen_conseq_env(experiment_conf, manifest):
     '''
     Generate environment files for SEQ operator
     '''
     # Environment files for SEQ operator
     filename = CONSEQ_ENV_DIR + os.sep + get_id(experiment_conf) + '.env'
-    if not os.path.isfile(filename):
-        text = REG_STREAM_STR.format(d=DATA_FILE)
-        text += '\n\n' + '#' * 80 + '\n\n'
-        query_file = CONSEQ_QUERY_DIR + os.sep \
-            + get_id(experiment_conf, [RAN, SLI]) + '.cql'
-        text += REG_CONSEQ_STR.format(q=query_file)
-        out_file = open(filename, 'w')
-        out_file.write(text)
-        out_file.close()
+    text = REG_STREAM_STR.format(d=DATA_FILE)
+    text += '\n\n' + '#' * 80 + '\n\n'
+    query_file = CONSEQ_QUERY_DIR + os.sep \
+        + get_id(experiment_conf, [RAN, SLI]) + '.cql'
+    text += REG_CONSEQ_STR.format(q=query_file)
+    write_artifact(filename, text, manifest)
 
 
-def gen_cql_env(experiment_conf):
+def gen_cql_env(experiment_conf, manifest):
     '''
     Generate enviroNment files for StremPref
     '''
@@ -376,30 +355,48 @@ def gen_cql_env(experiment_conf):
     qfile = CQL_QUERY_DIR + os.sep + 'equiv.cql'
     text += REG_EQUIV_STR.format(q=qfile)
     filename = CQL_ENV_DIR + os.sep + get_id(experiment_conf) + '.env'
-    out_file = open(filename, 'w')
-    out_file.write(text)
-    out_file.close()
+    write_artifact(filename, text, manifest)
+
+
+def get_cell_key(experiment_conf, algorithm):
+    '''
+    Return key of an experiment cell over current data (prefix of its detail
+    filenames)
+    '''
+    return DETAIL_DIR + os.sep + algorithm + '-' + get_id(experiment_conf) \
+        + '-' + get_data_id(get_data_size([DATA_FILE]))
 
 
 def get_detail_file(experiment_conf, algorithm, count):
     '''
     Return detail filename
     '''
-    return DETAIL_DIR + os.sep + algorithm + '-' + get_id(experiment_conf) \
-        + '-' + str(count) + '.csv'
+    return get_cell_key(experiment_conf, algorithm) + '-' + str(count) + \
+        '.csv'
 
 
-def run(experiment_conf, algorithm, count, iterations):
+def get_env_file(experiment_conf, algorithm):
     '''
-    Run experiment for range and slide
+    Return environment filename used by an algorithm
     '''
-    exp_id = get_id(experiment_conf)
     env_dir = CONSEQ_ENV_DIR
     if algorithm == CQL_ALG:
         env_dir = CQL_ENV_DIR
-    env_file = env_dir + os.sep + exp_id + '.env'
+    return env_dir + os.sep + get_id(experiment_conf) + '.env'
+
+
+def run(experiment_conf, algorithm, count, iterations, args):
+    '''
+    Run experiment for range and slide
+    '''
+    env_file = get_env_file(experiment_conf, algorithm)
     detail_file = get_detail_file(experiment_conf, algorithm, count)
-    if not os.path.isfile(detail_file):
+    artifact = get_artifact_digest(env_file)
+    data_size = get_data_size([DATA_FILE])
+    invalidate_outdated(detail_file, artifact)
+    if is_failed(detail_file, get_limits(args)):
+        print 'Skipping failed run: ' + detail_file
+    elif not os.path.isfile(detail_file):
         if algorithm == CQL_ALG:
             command = CQL_RUN_COMMAND.format(env=env_file, det=detail_file,
                                              max=iterations)
@@ -407,87 +404,271 @@ def run(experiment_conf, algorithm, count, iterations):
             command = CONSEQ_RUN_COMMAND.format(env=env_file, det=detail_file,
                                                 max=iterations,
                                                 alg=algorithm)
-        print command
-        os.system(command)
-        if not os.path.isfile(detail_file):
+        prepare_cache([DATA_FILE], args)
+        run_command(command, detail_file, args.timeout,
+                    get_memory_limit(args), artifact, data_size)
+        if not os.path.isfile(detail_file) and not is_failed(detail_file):
             print 'Detail results file not found: ' + detail_file
             print "Check if 'streampref' is in path"
+    return get_status(detail_file)
+
+
+def estimate_state(experiment_conf, algorithm, stats):
+    '''
+    Estimate tuples held by the relations of an algorithm from stream
+    statistics
+    '''
+    window = get_window_stats(stats, experiment_conf[RAN])
+    tuples = window['tuples']['p99']
+    ids = window['identifiers']['p99']
+    length = window['sequence_length']['p99']
+    if algorithm != CQL_ALG:
+        # Window and subsequences
+        return 2.0 * tuples
+    # TABLE_OTS, STREAM_OTS, SEQ_OTS, CONSECUTIVE_POS and FIRST_POS
+    size = 2.0 * stats['tuples_per_ts']['p99'] + 3.0 * tuples
+    # Start and end pairs (first positions are bounded by sequence length)
+    following = length * (length + 1) / 2.0
+    # Self-joins of SEQ_OTS, FIRST_POS and START_END_FOLLOWING, join of
+    # START_END and SEQ_OTS
+    size += ids * (2.0 * length * length + following +
+                   following * following)
+    return size
 
 
-def run_experiments(experiment_list):
+def run_experiments(experiment_list, args):
     '''
     Run all experiments
     '''
     max_ts = get_max_timestamp(DATA_FILE, TRANSACTION_HEADER)
-    for count in range(1, RUN_COUNT+1):
-        for exp_conf in experiment_list:
-            for alg in ALGORITHM_LIST:
-                run(exp_conf, alg, count, max_ts)
+    # Configurations killed by limits for each algorithm
+    failed_dict = {alg: [] for alg in ALGORITHM_LIST}
+    rand = get_random(args)
+    model = None
+    if args.lpt:
+        model = get_model(MAIN_DIR)
+    data_size = get_data_size([DATA_FILE])
+    predictor = None
+    if args.memory_budget is not None:
+        predictor = get_predictor(MAIN_DIR, DATA_FILE, REG_STREAM_STR,
+                                  estimate_state)
+    # Algorithms predicted over budget are dropped from configurations
+    cell_list = [(exp_conf, alg) for exp_conf, alg in
+                 get_cells(experiment_list, ALGORITHM_LIST, rand)
+                 if not is_over_budget(predictor, exp_conf, alg, args)]
+    # Assignment of jobs to this shard by scheduler
+    assigned_dict = {}
+    if args.adaptive:
+        if args.lpt:
+            cell_list, assigned_dict = schedule_jobs(
+                cell_list,
+                lambda cell: get_cell_key(cell[0], cell[1]),
+                lambda cell: args.min_runs * predict(model, cell[0], cell[1],
+                                                     data_size),
+                model, args, rand,
+                lambda cell: is_cell_pending(
+                    lambda count: get_detail_file(cell[0], cell[1], count),
+                    args))
+        for exp_conf, alg in cell_list:
+            if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+                print 'Skipping dominated runs: ' + alg + '-' + \
+                    get_id(exp_conf)
+                continue
+            # Adaptive cells are claimed as a whole
+            cell_key = get_cell_key(exp_conf, alg)
+            if not claim(cell_key, args, assigned_dict.get(cell_key)):
+                continue
+            status = run_adaptive(
+                lambda count: run(exp_conf, alg, count, max_ts, args),
+                lambda count: get_summaries(
+                    get_detail_file(exp_conf, alg, count))[0],
+                args,
+                lambda count: get_detail_file(exp_conf, alg, count))
+            release(cell_key, args)
+            if status in FAILURE_LIST:
+                failed_dict[alg].append(exp_conf)
+        return
+    job_list = [(count, exp_conf, alg) for count in range(1, RUN_COUNT+1)
+                for exp_conf, alg in cell_list]
+    if args.lpt:
+        job_list, assigned_dict = schedule_jobs(
+            job_list, lambda job: get_detail_file(job[1], job[2], job[0]),
+            lambda job: predict(model, job[1], job[2], data_size), model,
+            args, rand)
+    # Cells with warm-up runs already executed
+    warm_set = set()
+    for count, exp_conf, alg in job_list:
+        dfile = get_detail_file(exp_conf, alg, count)
+        if is_pruned(exp_conf, failed_dict[alg], HARDER_DICT):
+            print 'Skipping dominated run: ' + dfile
+            continue
+        if not claim(dfile, args, assigned_dict.get(dfile)):
+            # Failures of other hosts also prune configurations
+            if is_failed(dfile, get_limits(args)):
+                failed_dict[alg].append(exp_conf)
+            continue
+        cell = (get_id(exp_conf), alg)
+        if cell not in warm_set and is_pending(dfile, get_limits(args)):
+            run_warmup(
+                lambda wcount: run(exp_conf, alg, wcount, max_ts, args),
+                lambda wcount: get_detail_file(exp_conf, alg, wcount),
+                args)
+            warm_set.add(cell)
+        status = run(exp_conf, alg, count, max_ts, args)
+        release(dfile, args)
+        if status in FAILURE_LIST:
+            failed_dict[alg].append(exp_conf)
+
+
+def get_crossover_means(experiment_conf, manifest, max_ts, predictor,
+                        args):
+    '''
+    Run both algorithms of crossover search and return their mean runtimes
+    '''
+    # Values out of the grid have no queries and environments yet
+    gen_all_queries([experiment_conf], manifest)
+    gen_all_env_files([experiment_conf], manifest)
+    mean_list = []
+    for alg in args.crossover:
+        # Runs predicted over budget count as killed by limits
+        if is_over_budget(predictor, experiment_conf, alg, args):
+            mean_list.append(float('inf'))
+            continue
+        mean_list.append(run_cell(
+            lambda count: run(experiment_conf, alg, count, max_ts, args),
+            lambda count: get_summaries(
+                get_detail_file(experiment_conf, alg, count))[0],
+            lambda count: get_detail_file(experiment_conf, alg, count),
+            RUN_COUNT, args))
+    print 'Evaluated ' + get_id(experiment_conf) + ': ' + \
+        ', '.join([alg + ' ' + str(mean)
+                   for alg, mean in zip(args.crossover, mean_list)])
+    return tuple(mean_list)
+
+
+def run_crossover(args):
+    '''
+    Search value of a parameter where runtimes of two algorithms cross
+    '''
+    max_ts = get_max_timestamp(DATA_FILE, TRANSACTION_HEADER)
+    def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
+    # Variations
+    var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
+    low, high = args.bounds or (min(var_dict[args.axis]),
+                                max(var_dict[args.axis]))
+    predictor = None
+    if args.memory_budget is not None:
+        predictor = get_predictor(MAIN_DIR, DATA_FILE, REG_STREAM_STR,
+                                  estimate_state)
+    manifest = read_manifest(MAIN_DIR)
+    mean_dict, bracket = find_crossover(
+        lambda value: get_crossover_means(dict(def_conf, **{args.axis: value}),
+                                          manifest, max_ts, predictor, args),
+        low, high)
+    write_manifest(MAIN_DIR, manifest)
+    print_crossover(args.crossover, args.axis, mean_dict, bracket)
 
 
 def gen_data_files():
     '''
     Generate all files (queries and environments)
     '''
-    # Copy imported data file and sort by timestamp
-    os.system(SORT_COMMAND)
+    # Sort imported data file by timestamp (unless prepared by prepare.py)
+    if not is_prepared(DATA_FILE):
+        prepare_data([(DATA_FILE, REG_STREAM_STR)])
     if not os.path.isfile(DATA_FILE):
         print 'Error copying data file\n' + \
             'Make sure that import tool was executed'
 
 
-def gen_all_env_files(experiment_list):
+def gen_all_env_files(experiment_list, manifest):
     '''
     Generate all environment files
     '''
     for exp_conf in experiment_list:
-        gen_conseq_env(exp_conf)
-        gen_cql_env(exp_conf)
+        gen_conseq_env(exp_conf, manifest)
+        gen_cql_env(exp_conf, manifest)
 
 
-def gen_all_queries(experiment_list):
+def gen_all_queries(experiment_list, manifest):
     '''
     Generate all queries
     '''
     for exp_conf in experiment_list:
-        gen_endseq_query(exp_conf)
-    gen_all_cql_queries(experiment_list)
+        gen_endseq_query(exp_conf, manifest)
+    gen_all_cql_queries(experiment_list, manifest)
+
+
+def ingest_all(connection, experiment_list):
+    '''
+    Ingest detail files of all experiments into results database
+    '''
+    data_size = get_data_size([DATA_FILE])
+    for exp_conf in experiment_list:
+        for alg in ALGORITHM_LIST:
+            artifact = get_artifact_digest(get_env_file(exp_conf, alg))
+            count = 1
+            dfile = get_detail_file(exp_conf, alg, count)
+            # Adaptive mode may run more than RUN_COUNT repetitions
+            while count <= RUN_COUNT or os.path.isfile(dfile) or \
+                    os.path.isfile(get_resource_file(dfile)):
+                ingest(connection, MAIN_DIR, get_id(exp_conf), exp_conf, alg,
+                       count, dfile, data_size, artifact)
+                count += 1
+                dfile = get_detail_file(exp_conf, alg, count)
+    connection.commit()
 
 
 def summarize_all():
     '''
     Summarize all results
     '''
+    connection = connect()
+    ingest_all(connection, gen_experiment_list())
+    run_dict = get_runs(connection, MAIN_DIR, get_data_size([DATA_FILE]))
+    connection.close()
     def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
     # Variations
     var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
     for par, par_list in var_dict.items():
-        summarize(par, par_list, def_conf)
+        summarize(run_dict, par, par_list, def_conf)
 
 
-def summarize(parameter, value_list, default_values):
+def summarize(run_dict, parameter, value_list, default_values):
     '''
     Summarize experiments about range variation
     '''
     time_list = []
     mem_list = []
+    status_list = []
     exp_conf = default_values.copy()
     for value in value_list:
         exp_conf[parameter] = value
-        for rcount in range(1, RUN_COUNT + 1):
+        exp_id = get_id(exp_conf)
+        rcount = 1
+        # Adaptive mode may run more than RUN_COUNT repetitions
+        while rcount <= RUN_COUNT or \
+                any((exp_id, alg, rcount) in run_dict
+                    for alg in ALGORITHM_LIST):
             time_rec = {parameter: value}
             mem_rec = {parameter: value}
+            status_rec = {parameter: value}
             for alg in ALGORITHM_LIST:
-                dfile = get_detail_file(exp_conf, alg, rcount)
-                runtime, memory = get_summaries(dfile)
+                runtime, memory, status = run_dict.get((exp_id, alg, rcount),
+                                                       MISSING_RUN)
                 time_rec[alg] = runtime
                 mem_rec[alg] = memory
+                status_rec[alg] = status
             time_list.append(time_rec)
             mem_list.append(mem_rec)
+            status_list.append(status_rec)
+            rcount += 1
     fname = SUMMARY_DIR + os.sep + 'runtime-' + parameter + '.csv'
     write_file(fname, time_list, parameter)
     fname = SUMMARY_DIR + os.sep + 'memory-' + parameter + '.csv'
     write_file(fname, mem_list, parameter)
+    fname = SUMMARY_DIR + os.sep + 'status-' + parameter + '.csv'
+    write_file(fname, status_list, parameter)
 
 
 def write_file(filename, record_list, key_field):
@@ -528,34 +709,27 @@ def get_summaries(detail_file):
     return (sum_time, sum_memory / count)
 
 
-def confidence_interval(parameter, in_file, out_file):
-    '''
-    Calculate final result with confidence interval
-    '''
-    if not os.path.isfile(in_file):
-        print 'File does not exists: ' + in_file
-        return
-    command = CONFINTERVAL_COMMAND.format(inf=in_file, outf=out_file,
-                                          keyf=parameter)
-    print command
-    os.system(command)
-    if not os.path.isfile(out_file):
-        print 'Output file not found: ' + out_file
-        print "Check if 'confinterval.py' is in path"
-
-
 def confidence_interval_all():
     '''
     Calculate confidence interval for all summarized results
     '''
-    # Deletions and insertions
-    for parameter in PARAMETER_LIST:
-        in_file = SUMMARY_DIR + os.sep + 'runtime-' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'runtime-' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
-        in_file = SUMMARY_DIR + os.sep + 'memory-' + parameter + '.csv'
-        out_file = RESULT_DIR + os.sep + 'memory-' + parameter + '.csv'
-        confidence_interval(parameter, in_file, out_file)
+    connection = connect()
+    data_size = get_data_size([DATA_FILE])
+    def_conf = {RAN: RANGE_DEFAULT, SLI: SLIDE_DEFAULT}
+    # Variations
+    var_dict = {RAN: RANGE_LIST, SLI: SLIDE_LIST}
+    for parameter, value_list in var_dict.items():
+        exp_conf = def_conf.copy()
+        id_list = []
+        for value in value_list:
+            exp_conf[parameter] = value
+            id_list.append(get_id(exp_conf))
+        for field in [RUNTIME, MEMORY]:
+            out_file = RESULT_DIR + os.sep + field + '-' + parameter + '.csv'
+            write_intervals(connection, MAIN_DIR, field, parameter,
+                            value_list, id_list, ALGORITHM_LIST, out_file,
+                            data_size=data_size)
+    connection.close()
 
 
 def get_arguments(print_help=False):
@@ -573,6 +747,9 @@ def get_arguments(print_help=False):
     parser.add_argument('-s', '--summarize', action="store_true",
                         default=False,
                         help='Summarize results')
+    add_run_arguments(parser)
+    add_crossover_arguments(parser, ALGORITHM_LIST, PARAMETER_LIST)
+    add_preflight_arguments(parser)
     args = parser.parse_args()
     if print_help:
         parser.print_help()
@@ -599,18 +776,27 @@ def main():
     if args.gen:
         print 'Generating data files'
         gen_data_files()
+        manifest = read_manifest(MAIN_DIR)
         print 'Generating queries'
-        gen_all_queries(exp_list)
+        gen_all_queries(exp_list, manifest)
         print 'Generating environments'
-        gen_all_env_files(exp_list)
+        gen_all_env_files(exp_list, manifest)
+        write_manifest(MAIN_DIR, manifest)
     elif args.run:
         print 'Running experiments'
-        run_experiments(exp_list)
-    elif args.summarize:
-        print 'Summarizing results'
-        summarize_all()
-        print 'Calculating confidence intervals'
-        confidence_interval_all()
+        run_experiments(exp_list, args)
+    elif args.crossover:
+        print 'Searching crossover'
+        run_crossover(args)
+    elif args.merge or args.summarize:
+        if args.merge:
+            print 'Merging results'
+            merge_directories(args.merge, DETAIL_DIR)
+        if args.summarize:
+            print 'Summarizing results'
+            summarize_all()
+            print 'Calculating confidence intervals'
+            confidence_interval_all()
     else:
         get_arguments(True)
 
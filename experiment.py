@@ -0,0 +1,1246 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module with common routines for execution of experiments with StreamPref
+'''
+
+import csv
+import errno
+import hashlib
+import math
+import os
+import random
+import re
+import resource
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# =============================================================================
+# Resource monitoring
+# =============================================================================
+# Initial interval between samples of process information (seconds)
+SAMPLE_INTERVAL_MIN = 0.01
+# Maximum interval between samples of process information (seconds)
+SAMPLE_INTERVAL_MAX = 0.2
+
+# Resource fields
+WALLTIME = 'walltime'
+USERTIME = 'usertime'
+SYSTIME = 'systime'
+MAXRSS = 'maxrss'
+MINFLT = 'minflt'
+MAJFLT = 'majflt'
+NVCSW = 'nvcsw'
+NIVCSW = 'nivcsw'
+INBLOCK = 'inblock'
+OUBLOCK = 'oublock'
+RCHAR = 'rchar'
+WCHAR = 'wchar'
+READ_BYTES = 'read_bytes'
+WRITE_BYTES = 'write_bytes'
+EXIT_CODE = 'exit_code'
+STATUS = 'status'
+HOST = 'host'
+REVISION = 'revision'
+ARTIFACT = 'artifact'
+DATA_SIZE = 'data_size'
+TIMEOUT_LIMIT = 'timeout_limit'
+MEMORY_LIMIT = 'memory_limit'
+# Fields read from /proc/<pid>/io
+PROC_IO_LIST = [RCHAR, WCHAR, READ_BYTES, WRITE_BYTES]
+# Header of resource files
+RESOURCE_HEADER = [WALLTIME, USERTIME, SYSTIME, MAXRSS, MINFLT, MAJFLT,
+                   NVCSW, NIVCSW, INBLOCK, OUBLOCK] + PROC_IO_LIST + \
+    [EXIT_CODE, STATUS, HOST, REVISION, ARTIFACT, DATA_SIZE, TIMEOUT_LIMIT,
+     MEMORY_LIMIT]
+
+# Environment variable to override revision of experiments
+REVISION_VARIABLE = 'STREAMPREF_REVISION'
+# Command to get revision of experiments
+REVISION_COMMAND = ['git', 'rev-parse', '--short', 'HEAD']
+# Revision when it can not be found
+UNKNOWN_REVISION = 'unknown'
+
+# =============================================================================
+# Run limits
+# =============================================================================
+# Run outcomes
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+STATUS_MEMORY = 'memory'
+STATUS_MISSING = 'missing'
+# Outcomes of runs killed by limits (retried only under higher limits)
+FAILURE_LIST = [STATUS_TIMEOUT, STATUS_MEMORY]
+# Resource field of the limit exceeded by each failure
+FAILURE_LIMIT = {STATUS_TIMEOUT: TIMEOUT_LIMIT, STATUS_MEMORY: MEMORY_LIMIT}
+# Time between SIGTERM and SIGKILL for killed runs (seconds)
+KILL_GRACE = 5.0
+# Address space limit relative to memory limit (virtual memory is larger
+# than resident memory, the resident memory is checked by sampling)
+ADDRESS_SPACE_FACTOR = 2
+# Error messages of allocations refused by the address space limit
+ALLOCATION_ERROR_RE = re.compile(r'MemoryError|OutOfMemoryError|bad_alloc|'
+                                 r'Cannot allocate memory|out of memory',
+                                 re.I)
+
+# =============================================================================
+# Distributed execution
+# =============================================================================
+# Suffix of lease files
+LOCK_SUFFIX = '.lock'
+# Time after which a lease is considered stale (seconds)
+LEASE_TTL = 24 * 3600
+
+# =============================================================================
+# Generated artifacts
+# =============================================================================
+# Manifest of generated queries and environments (in main directory of tools)
+MANIFEST_FILE = 'manifest.csv'
+MANIFEST_FILE_FIELD = 'file'
+MANIFEST_DIGEST_FIELD = 'digest'
+MANIFEST_HEADER = [MANIFEST_FILE_FIELD, MANIFEST_DIGEST_FIELD]
+# Files registered in environment files
+INPUT_RE = re.compile(r"INPUT\s+'([^']*)'", re.I)
+# Suffix of registered files that are artifacts (queries)
+QUERY_SUFFIX = '.cql'
+
+# =============================================================================
+# Run conditions
+# =============================================================================
+# Run number of discarded warm-up runs
+WARMUP_RUN = 0
+# Page cache modes (keep as is, read data files or drop cache before runs)
+CACHE_NONE = 'none'
+CACHE_WARM = 'warm'
+CACHE_DROP = 'drop'
+CACHE_LIST = [CACHE_NONE, CACHE_WARM, CACHE_DROP]
+# Kernel interface to drop page cache (requires root)
+DROP_CACHES_FILE = '/proc/sys/vm/drop_caches'
+# Block size for reading of data files
+READ_BLOCK_SIZE = 1024 * 1024
+# Prefix of data identifier in detail filenames
+DATA_ID_PREFIX = 'data'
+
+# =============================================================================
+# Confidence intervals
+# =============================================================================
+# Confidence level
+CONFIDENCE = 0.95
+# Suffixes of result fields
+STD_SUFFIX = '_std'
+CI_SUFFIX = '_ci'
+COUNT_SUFFIX = '_count'
+# Adaptive repetitions (bounds and target relative half-width of the
+# runtime confidence interval)
+ADAPTIVE_MIN_RUNS = 3
+ADAPTIVE_MAX_RUNS = 20
+ADAPTIVE_TARGET = 0.05
+# Iterations for numerical routines
+MAX_ITERATIONS = 200
+EPSILON = 1e-12
+
+
+def get_host():
+    '''
+    Return name of current host
+    '''
+    return socket.gethostname()
+
+
+def get_revision():
+    '''
+    Return revision of experiments (environment variable or git revision)
+    '''
+    if os.environ.get(REVISION_VARIABLE):
+        return os.environ[REVISION_VARIABLE]
+    try:
+        process = subprocess.Popen(REVISION_COMMAND, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    except OSError:
+        return UNKNOWN_REVISION
+    output = process.communicate()[0].strip()
+    if process.returncode != 0 or not output:
+        return UNKNOWN_REVISION
+    return output
+
+
+def get_resource_file(detail_file):
+    '''
+    Return filename of resource usage for a detail file
+    '''
+    return os.path.splitext(detail_file)[0] + '.res.csv'
+
+
+def read_proc_io(pid):
+    '''
+    Read I/O counters of a process from /proc (empty dict if not available)
+    '''
+    io_rec = {}
+    try:
+        in_file = open('/proc/' + str(pid) + '/io')
+    except IOError:
+        return io_rec
+    try:
+        for line in in_file:
+            key, value = line.split(':')
+            if key in PROC_IO_LIST:
+                io_rec[key] = int(value)
+    except (IOError, ValueError):
+        pass
+    in_file.close()
+    return io_rec
+
+
+def read_proc_memory(pid):
+    '''
+    Read resident memory and peak address space of a process in bytes from
+    /proc (zeros if not available)
+    '''
+    try:
+        in_file = open('/proc/' + str(pid) + '/status')
+    except IOError:
+        return (0, 0)
+    memory_dict = {'VmRSS:': 0, 'VmPeak:': 0}
+    try:
+        for line in in_file:
+            field_list = line.split()
+            if field_list and field_list[0] in memory_dict:
+                memory_dict[field_list[0]] = int(field_list[1]) * 1024
+    except (IOError, ValueError, IndexError):
+        pass
+    in_file.close()
+    return (memory_dict['VmRSS:'], memory_dict['VmPeak:'])
+
+
+def write_resource_file(filename, resource_rec):
+    '''
+    Write resource usage record to file
+    '''
+    out_file = open(filename, 'w')
+    writer = csv.DictWriter(out_file, RESOURCE_HEADER)
+    header = {field: field for field in RESOURCE_HEADER}
+    writer.writerow(header)
+    writer.writerow(resource_rec)
+    out_file.close()
+
+
+def read_resource_file(filename):
+    '''
+    Read resource usage record from file (None if it does not exist)
+    '''
+    if not os.path.isfile(filename):
+        return None
+    in_file = open(filename, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True)
+    resource_rec = None
+    for rec in reader:
+        resource_rec = rec
+    in_file.close()
+    return resource_rec
+
+
+def get_limits_function(memory_limit):
+    '''
+    Return function to start a new process group and set rlimits on the child
+    '''
+    def set_limits():
+        '''
+        Executed in the child process before StreamPref starts
+        '''
+        os.setsid()
+        if memory_limit is not None:
+            as_limit = memory_limit * ADDRESS_SPACE_FACTOR
+            resource.setrlimit(resource.RLIMIT_AS, (as_limit, as_limit))
+    return set_limits
+
+
+def signal_group(pid, signum):
+    '''
+    Send a signal to the process group of a run
+    '''
+    try:
+        os.killpg(pid, signum)
+    except OSError:
+        pass
+
+
+def check_limits(rss, start, timeout, memory_limit):
+    '''
+    Return failure status if a running process (with resident memory rss)
+    exceeded its limits
+    '''
+    if timeout is not None and time.time() - start > timeout:
+        return STATUS_TIMEOUT
+    if memory_limit is not None and rss > memory_limit:
+        return STATUS_MEMORY
+    return None
+
+
+def run_command(command, detail_file, timeout=None, memory_limit=None,
+                artifact=None, data_size=None):
+    '''
+    Run a StreamPref command, monitor its resource usage and store it
+    alongside the detail file
+
+    The run is killed if it exceeds timeout (seconds) or memory_limit (bytes),
+    runs failing with allocation errors or after reaching memory_limit in
+    address space (allocations refused by the address space limit) are also
+    memory failures, artifact is the digest of the environment used by the
+    run and data_size the size of its input data (bytes)
+    '''
+    print command
+    start = time.time()
+    # Error output is checked for allocation errors and shown after the run
+    error_file = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(shlex.split(command), stderr=error_file,
+                                   preexec_fn=get_limits_function(
+                                       memory_limit))
+    except OSError as exc:
+        print 'Error running command: ' + str(exc)
+        error_file.close()
+        return None
+    io_rec = {}
+    vm_peak = 0
+    outcome = None
+    kill_time = None
+    interval = SAMPLE_INTERVAL_MIN
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        # Keep last sample (counters are lost when the process is reaped)
+        io_rec = read_proc_io(process.pid) or io_rec
+        rss, peak = read_proc_memory(process.pid)
+        vm_peak = max(vm_peak, peak)
+        if kill_time is None:
+            outcome = check_limits(rss, start, timeout, memory_limit)
+            if outcome is not None:
+                print 'Killing run (' + outcome + '): ' + detail_file
+                signal_group(process.pid, signal.SIGTERM)
+                kill_time = time.time()
+        elif time.time() - kill_time > KILL_GRACE:
+            signal_group(process.pid, signal.SIGKILL)
+        time.sleep(interval)
+        interval = min(interval * 2, SAMPLE_INTERVAL_MAX)
+    # Process was reaped by wait4
+    process.returncode = os.WEXITSTATUS(status) \
+        if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    error_file.seek(0)
+    error_text = error_file.read()
+    error_file.close()
+    sys.stderr.write(error_text)
+    if outcome is None:
+        outcome = STATUS_OK
+        if process.returncode != 0:
+            outcome = STATUS_ERROR
+            if memory_limit is not None and \
+                    (max(vm_peak, usage.ru_maxrss * 1024) >= memory_limit or
+                     ALLOCATION_ERROR_RE.search(error_text)):
+                outcome = STATUS_MEMORY
+    if outcome in FAILURE_LIST and os.path.isfile(detail_file):
+        # Partial results of killed runs are discarded
+        os.remove(detail_file)
+    resource_rec = {WALLTIME: time.time() - start,
+                    USERTIME: usage.ru_utime,
+                    SYSTIME: usage.ru_stime,
+                    MAXRSS: usage.ru_maxrss,
+                    MINFLT: usage.ru_minflt,
+                    MAJFLT: usage.ru_majflt,
+                    NVCSW: usage.ru_nvcsw,
+                    NIVCSW: usage.ru_nivcsw,
+                    INBLOCK: usage.ru_inblock,
+                    OUBLOCK: usage.ru_oublock,
+                    EXIT_CODE: process.returncode,
+                    STATUS: outcome,
+                    HOST: get_host(),
+                    REVISION: get_revision(),
+                    ARTIFACT: artifact,
+                    DATA_SIZE: data_size,
+                    TIMEOUT_LIMIT: timeout,
+                    MEMORY_LIMIT: memory_limit}
+    resource_rec.update(io_rec)
+    write_resource_file(get_resource_file(detail_file), resource_rec)
+    return resource_rec
+
+
+def is_limit_raised(resource_rec, limits):
+    '''
+    Check if the limit exceeded by a failed run is lower than the current one
+    in limits (timeout, memory limit), no limit is higher than any limit and
+    failures without recorded limit are kept
+    '''
+    recorded = to_number(resource_rec.get(FAILURE_LIMIT[resource_rec[STATUS]]))
+    if recorded is None:
+        return False
+    current = limits[FAILURE_LIST.index(resource_rec[STATUS])]
+    return current is None or current > recorded
+
+
+def get_status(detail_file, limits=None):
+    '''
+    Return the outcome of a run
+
+    Failures under limits lower than the current ones in limits (timeout,
+    memory limit) are retried, so they count as missing runs
+    '''
+    resource_rec = read_resource_file(get_resource_file(detail_file))
+    if resource_rec is not None and \
+            resource_rec.get(STATUS) in FAILURE_LIST:
+        if limits is not None and is_limit_raised(resource_rec, limits):
+            return STATUS_MISSING
+        return resource_rec[STATUS]
+    if os.path.isfile(detail_file):
+        return STATUS_OK
+    if resource_rec is not None and resource_rec.get(STATUS):
+        return resource_rec[STATUS]
+    return STATUS_MISSING
+
+
+def is_failed(detail_file, limits=None):
+    '''
+    Check if a run was killed for exceeding its limits (the current ones in
+    limits are checked by get_status)
+    '''
+    return get_status(detail_file, limits) in FAILURE_LIST
+
+
+def get_digest(text):
+    '''
+    Return digest of a text
+    '''
+    return hashlib.sha1(text).hexdigest()
+
+
+def read_manifest(main_dir):
+    '''
+    Read digests of generated artifacts indexed by filename
+    '''
+    manifest = {}
+    filename = main_dir + os.sep + MANIFEST_FILE
+    if not os.path.isfile(filename):
+        return manifest
+    in_file = open(filename, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True)
+    for rec in reader:
+        manifest[rec[MANIFEST_FILE_FIELD]] = rec[MANIFEST_DIGEST_FIELD]
+    in_file.close()
+    return manifest
+
+
+def write_manifest(main_dir, manifest):
+    '''
+    Write digests of generated artifacts
+    '''
+    out_file = open(main_dir + os.sep + MANIFEST_FILE, 'w')
+    writer = csv.DictWriter(out_file, MANIFEST_HEADER)
+    writer.writeheader()
+    for filename in sorted(manifest):
+        writer.writerow({MANIFEST_FILE_FIELD: filename,
+                         MANIFEST_DIGEST_FIELD: manifest[filename]})
+    out_file.close()
+
+
+def write_artifact(filename, text, manifest):
+    '''
+    Write a generated artifact only if its content changed, return True if
+    the file was written
+    '''
+    digest = get_digest(text)
+    if filename not in manifest and os.path.isfile(filename):
+        # Artifacts generated before the manifest existed
+        manifest[filename] = get_digest(open(filename).read())
+    if manifest.get(filename) == digest and os.path.isfile(filename):
+        return False
+    out_file = open(filename, 'w')
+    out_file.write(text)
+    out_file.close()
+    manifest[filename] = digest
+    return True
+
+
+def get_artifact_digest(env_file):
+    '''
+    Return digest of an environment file and the queries it registers
+    (None if the environment file does not exist)
+    '''
+    if not os.path.isfile(env_file):
+        return None
+    text = open(env_file).read()
+    digest_list = [get_digest(text)]
+    for filename in INPUT_RE.findall(text):
+        if filename.endswith(QUERY_SUFFIX) and os.path.isfile(filename):
+            digest_list.append(get_digest(open(filename).read()))
+    return get_digest(' '.join(digest_list))
+
+
+def get_env_data_files(env_file):
+    '''
+    Return data files registered by an environment file (inputs other than
+    queries, empty if the environment file does not exist)
+    '''
+    if not os.path.isfile(env_file):
+        return []
+    return [filename for filename in INPUT_RE.findall(open(env_file).read())
+            if not filename.endswith(QUERY_SUFFIX)]
+
+
+def is_outdated(detail_file, artifact):
+    '''
+    Check if a run used artifacts different from the current ones (runs
+    without recorded artifact are kept)
+    '''
+    resource_rec = read_resource_file(get_resource_file(detail_file))
+    if resource_rec is None:
+        return False
+    if not resource_rec.get(ARTIFACT) or artifact is None:
+        return False
+    return resource_rec[ARTIFACT] != artifact
+
+
+def invalidate_outdated(detail_file, artifact):
+    '''
+    Remove a run that used outdated artifacts
+    '''
+    if is_outdated(detail_file, artifact):
+        print 'Removing run with outdated artifacts: ' + detail_file
+        remove_run(detail_file)
+
+
+def is_pending(detail_file, limits=None):
+    '''
+    Check if a run was neither executed nor killed by its limits
+    '''
+    return not os.path.isfile(detail_file) and \
+        not is_failed(detail_file, limits)
+
+
+def remove_run(detail_file):
+    '''
+    Remove detail and resource files of a run
+    '''
+    for filename in [detail_file, get_resource_file(detail_file)]:
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def run_warmup(run_function, detail_function, args):
+    '''
+    Execute discarded warm-up runs of an experiment cell
+
+    run_function(count) executes a run and detail_function(count) returns
+    its detail file, warm-up runs use run number WARMUP_RUN and their files
+    are removed
+    '''
+    if not args.warmup:
+        return
+    detail_file = detail_function(WARMUP_RUN)
+    # Hosts sharing a directory must not share warm-up files
+    if args.lease and not acquire_lease(detail_file, args.lease_ttl):
+        print 'Skipping warm-up in use: ' + detail_file
+        return
+    for _ in range(args.warmup):
+        remove_run(detail_file)
+        run_function(WARMUP_RUN)
+    remove_run(detail_file)
+    if args.lease:
+        release_lease(detail_file)
+
+
+def warm_file(filename):
+    '''
+    Read a file to load it into page cache
+    '''
+    in_file = open(filename, 'rb')
+    while in_file.read(READ_BLOCK_SIZE):
+        pass
+    in_file.close()
+
+
+def drop_cache():
+    '''
+    Drop clean pages of page cache, return False if not permitted
+    '''
+    subprocess.call(['sync'])
+    try:
+        out_file = open(DROP_CACHES_FILE, 'w')
+        out_file.write('1\n')
+        out_file.close()
+    except IOError:
+        return False
+    return True
+
+
+def prepare_cache(file_list, args):
+    '''
+    Set page cache state of data files before a run
+    '''
+    if args.cache == CACHE_WARM:
+        for filename in file_list:
+            if os.path.isfile(filename):
+                warm_file(filename)
+    elif args.cache == CACHE_DROP and not drop_cache():
+        print 'Permission denied to drop page cache, keeping it as is'
+        args.cache = CACHE_NONE
+
+
+def get_random(args):
+    '''
+    Return random generator for execution order of cells (None if order is
+    not randomized)
+    '''
+    if not args.shuffle:
+        return None
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+    # Seed is shown so that an order can be repeated
+    print 'Execution order seed: ' + str(seed)
+    return random.Random(seed)
+
+
+def get_cells(experiment_list, algorithm_list, rand=None):
+    '''
+    Return list of experiment cells (configuration, algorithm), shuffled if
+    a random generator is given
+    '''
+    cell_list = [(exp_conf, alg) for exp_conf in experiment_list
+                 for alg in algorithm_list]
+    if rand is not None:
+        rand.shuffle(cell_list)
+    return cell_list
+
+
+def is_dominated(experiment_conf, failed_conf, harder_dict):
+    '''
+    Check if an experiment is at least as hard as a failed experiment
+
+    harder_dict maps parameters to 1 when greater values are harder or -1
+    when smaller values are harder, other parameters must be equal
+    '''
+    if set(experiment_conf.keys()) != set(failed_conf.keys()):
+        return False
+    for key, value in experiment_conf.items():
+        if key in harder_dict:
+            if harder_dict[key] * (value - failed_conf[key]) < 0:
+                return False
+        elif value != failed_conf[key]:
+            return False
+    return True
+
+
+def is_pruned(experiment_conf, failed_list, harder_dict):
+    '''
+    Check if an experiment is dominated by any failed experiment
+    '''
+    for failed_conf in failed_list:
+        if is_dominated(experiment_conf, failed_conf, harder_dict):
+            return True
+    return False
+
+
+def get_shard(shard_str):
+    '''
+    Parse a shard in format i/N (0 <= i < N)
+    '''
+    import argparse
+    try:
+        index, count = [int(value) for value in shard_str.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid shard: ' + shard_str)
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('Invalid shard: ' + shard_str)
+    return (index, count)
+
+
+def is_assigned(key, shard):
+    '''
+    Check if a job is assigned to a shard (stable hash of job file name)
+    '''
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.md5(os.path.basename(key)).hexdigest()
+    return int(digest, 16) % count == index
+
+
+def acquire_lease(key, ttl=LEASE_TTL):
+    '''
+    Claim a job by atomic creation of its lease file (stale leases are
+    broken after ttl seconds)
+    '''
+    lock_file = key + LOCK_SUFFIX
+    for _ in range(2):
+        try:
+            lock_fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+            try:
+                age = time.time() - os.path.getmtime(lock_file)
+            except OSError:
+                # Lease released meanwhile
+                continue
+            if age <= ttl:
+                return False
+            print 'Breaking stale lease: ' + lock_file
+            try:
+                os.remove(lock_file)
+            except OSError:
+                pass
+            continue
+        os.write(lock_fd, get_host() + ':' + str(os.getpid()) + '\n')
+        os.close(lock_fd)
+        return True
+    return False
+
+
+def release_lease(key):
+    '''
+    Release the lease of a job
+    '''
+    try:
+        os.remove(key + LOCK_SUFFIX)
+    except OSError:
+        pass
+
+
+def claim(key, args, assigned=None):
+    '''
+    Check if this host must execute a job (shard assignment and lease)
+
+    assigned is the shard assignment decided by a scheduler (by hash of key
+    if None)
+    '''
+    if assigned is None:
+        assigned = is_assigned(key, args.shard)
+    if not assigned:
+        return False
+    if args.lease:
+        return acquire_lease(key, args.lease_ttl)
+    return True
+
+
+def release(key, args):
+    '''
+    Release a job claimed by this host
+    '''
+    if args.lease:
+        release_lease(key)
+
+
+def merge_directories(source_list, target_dir):
+    '''
+    Copy detail and resource files of other hosts into target directory
+    '''
+    copy_count = 0
+    for source_dir in source_list:
+        if not os.path.isdir(source_dir):
+            print 'Directory does not exists: ' + source_dir
+            continue
+        if os.path.samefile(source_dir, target_dir):
+            continue
+        for filename in sorted(os.listdir(source_dir)):
+            if filename.endswith(LOCK_SUFFIX):
+                continue
+            source_file = source_dir + os.sep + filename
+            target_file = target_dir + os.sep + filename
+            if os.path.exists(target_file):
+                if os.path.getsize(target_file) != \
+                        os.path.getsize(source_file):
+                    print 'Keeping existing file: ' + target_file
+                continue
+            shutil.copy2(source_file, target_file)
+            copy_count += 1
+    print str(copy_count) + ' files merged into ' + target_dir
+
+
+def add_run_arguments(parser):
+    '''
+    Add arguments for control of experiment runs
+    '''
+    parser.add_argument('-t', '--timeout', action="store", type=float,
+                        default=None,
+                        help='Wall-clock limit of each run in seconds')
+    parser.add_argument('-l', '--memory-limit', action="store", type=int,
+                        default=None,
+                        help='Memory limit of each run in MB')
+    parser.add_argument('-a', '--adaptive', action="store_true",
+                        default=False,
+                        help='Repeat runs until runtime confidence ' +
+                        'interval converges')
+    parser.add_argument('--min-runs', action="store", type=int,
+                        default=ADAPTIVE_MIN_RUNS,
+                        help='Minimum runs in adaptive mode ' +
+                        '(default: ' + str(ADAPTIVE_MIN_RUNS) + ')')
+    parser.add_argument('--max-runs', action="store", type=int,
+                        default=ADAPTIVE_MAX_RUNS,
+                        help='Maximum runs in adaptive mode ' +
+                        '(default: ' + str(ADAPTIVE_MAX_RUNS) + ')')
+    parser.add_argument('--target-width', action="store", type=float,
+                        default=ADAPTIVE_TARGET,
+                        help='Target half-width of confidence interval ' +
+                        'relative to mean (default: ' +
+                        str(ADAPTIVE_TARGET) + ')')
+    parser.add_argument('--shard', action="store", type=get_shard,
+                        default=None,
+                        help='Run only shard i of N (format i/N)')
+    parser.add_argument('--lease', action="store_true", default=False,
+                        help='Claim runs by lease files (shared directory)')
+    parser.add_argument('--lease-ttl', action="store", type=float,
+                        default=LEASE_TTL,
+                        help='Seconds after which a lease is stale ' +
+                        '(default: ' + str(LEASE_TTL) + ')')
+    parser.add_argument('-M', '--merge', action="store", nargs='+',
+                        metavar='DIR',
+                        help='Merge detail directories of other hosts')
+    parser.add_argument('-w', '--warmup', action="store", type=int,
+                        default=0,
+                        help='Discarded warm-up runs per cell (default: 0)')
+    parser.add_argument('-c', '--cache', action="store", choices=CACHE_LIST,
+                        default=CACHE_NONE,
+                        help='Page cache of data files before each run ' +
+                        '(default: ' + CACHE_NONE + ')')
+    parser.add_argument('--shuffle', action="store_true", default=False,
+                        help='Randomize execution order of cells ' +
+                        '(only among equal predicted costs with --lpt)')
+    parser.add_argument('--seed', action="store", type=int, default=None,
+                        help='Seed of randomized execution order')
+    parser.add_argument('--lpt', action="store_true", default=False,
+                        help='Run longest predicted jobs first (cost ' +
+                        'model fitted from results database)')
+    parser.add_argument('--workers', action="store", type=int,
+                        default=None,
+                        help='Workers for prediction of sweep makespan ' +
+                        'without shards (default: 1)')
+
+
+def get_data_size(file_list):
+    '''
+    Return total size of existing data files (bytes)
+    '''
+    return sum(os.path.getsize(filename) for filename in file_list
+               if os.path.isfile(filename))
+
+
+def get_data_id(data_size):
+    '''
+    Return identifier of the input data of runs (runs over data of different
+    sizes, e.g. symbol tiers, are kept in different detail files)
+    '''
+    return DATA_ID_PREFIX + str(data_size)
+
+
+def get_memory_limit(args):
+    '''
+    Return memory limit in bytes from arguments
+    '''
+    if args.memory_limit is None:
+        return None
+    return args.memory_limit * 1024 * 1024
+
+
+def get_limits(args):
+    '''
+    Return limits of runs (timeout in seconds, memory limit in bytes) from
+    arguments, in the order of FAILURE_LIST
+    '''
+    return (args.timeout, get_memory_limit(args))
+
+
+def beta_fraction(a_par, b_par, x_val):
+    '''
+    Continued fraction for the regularized incomplete beta function
+    '''
+    tiny = 1e-300
+    qab = a_par + b_par
+    qap = a_par + 1.0
+    qam = a_par - 1.0
+    c_val = 1.0
+    d_val = 1.0 - qab * x_val / qap
+    if abs(d_val) < tiny:
+        d_val = tiny
+    d_val = 1.0 / d_val
+    result = d_val
+    for mpos in range(1, MAX_ITERATIONS + 1):
+        m2_val = 2 * mpos
+        aa_val = mpos * (b_par - mpos) * x_val / \
+            ((qam + m2_val) * (a_par + m2_val))
+        d_val = 1.0 + aa_val * d_val
+        if abs(d_val) < tiny:
+            d_val = tiny
+        c_val = 1.0 + aa_val / c_val
+        if abs(c_val) < tiny:
+            c_val = tiny
+        d_val = 1.0 / d_val
+        result *= d_val * c_val
+        aa_val = -(a_par + mpos) * (qab + mpos) * x_val / \
+            ((a_par + m2_val) * (qap + m2_val))
+        d_val = 1.0 + aa_val * d_val
+        if abs(d_val) < tiny:
+            d_val = tiny
+        c_val = 1.0 + aa_val / c_val
+        if abs(c_val) < tiny:
+            c_val = tiny
+        d_val = 1.0 / d_val
+        delta = d_val * c_val
+        result *= delta
+        if abs(delta - 1.0) < EPSILON:
+            break
+    return result
+
+
+def incomplete_beta(a_par, b_par, x_val):
+    '''
+    Regularized incomplete beta function I_x(a, b)
+    '''
+    if x_val <= 0.0:
+        return 0.0
+    if x_val >= 1.0:
+        return 1.0
+    factor = math.exp(math.lgamma(a_par + b_par) - math.lgamma(a_par) -
+                      math.lgamma(b_par) + a_par * math.log(x_val) +
+                      b_par * math.log(1.0 - x_val))
+    if x_val < (a_par + 1.0) / (a_par + b_par + 2.0):
+        return factor * beta_fraction(a_par, b_par, x_val) / a_par
+    return 1.0 - factor * beta_fraction(b_par, a_par, 1.0 - x_val) / b_par
+
+
+def t_cdf(t_val, dof):
+    '''
+    Cumulative distribution function of Student's t distribution
+    '''
+    tail = 0.5 * incomplete_beta(dof / 2.0, 0.5,
+                                 dof / (dof + t_val * t_val))
+    if t_val > 0:
+        return 1.0 - tail
+    return tail
+
+
+def t_quantile(prob, dof):
+    '''
+    Quantile of Student's t distribution (prob >= 0.5) by bisection
+    '''
+    low = 0.0
+    high = 1.0
+    while t_cdf(high, dof) < prob:
+        high *= 2
+    for _ in range(MAX_ITERATIONS):
+        middle = (low + high) / 2.0
+        if t_cdf(middle, dof) < prob:
+            low = middle
+        else:
+            high = middle
+        if high - low < EPSILON:
+            break
+    return (low + high) / 2.0
+
+
+def get_statistics(count, mean, sum_sq, confidence=CONFIDENCE):
+    '''
+    Return (standard deviation, half-width of confidence interval) from
+    accumulated count, mean and sum of squared differences
+    '''
+    if count < 2:
+        return (float('NaN'), float('NaN'))
+    std = math.sqrt(sum_sq / (count - 1))
+    t_val = t_quantile(1.0 - (1.0 - confidence) / 2.0, count - 1)
+    return (std, t_val * std / math.sqrt(count))
+
+
+def to_number(value):
+    '''
+    Convert a summary value to float (None for missing values)
+    '''
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(number):
+        return None
+    return number
+
+
+def read_summary_file(filename, parameter=None):
+    '''
+    Accumulate count, mean and sum of squared differences of every algorithm
+    for each parameter value of a summary file in a single pass
+
+    Return (parameter, value list, algorithm list, accumulators), the
+    parameter is the first column when it is not given
+    '''
+    in_file = open(filename, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True)
+    if parameter is None:
+        parameter = reader.fieldnames[0]
+    alg_list = [field for field in reader.fieldnames if field != parameter]
+    value_list = []
+    # Accumulators (count, mean, sum of squared differences) per cell
+    acc_dict = {}
+    for rec in reader:
+        value = rec[parameter]
+        if value not in acc_dict:
+            value_list.append(value)
+            acc_dict[value] = {alg: [0, 0.0, 0.0] for alg in alg_list}
+        for alg in alg_list:
+            number = to_number(rec[alg])
+            if number is None:
+                continue
+            # Welford's online update
+            acc = acc_dict[value][alg]
+            acc[0] += 1
+            delta = number - acc[1]
+            acc[1] += delta / acc[0]
+            acc[2] += delta * (number - acc[1])
+    in_file.close()
+    return (parameter, value_list, alg_list, acc_dict)
+
+
+def read_interval_file(filename):
+    '''
+    Read a file written by write_interval_file
+
+    Return (parameter, value list, algorithm list, accumulators)
+    '''
+    in_file = open(filename, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True)
+    parameter = reader.fieldnames[0]
+    alg_list = [field[:-len(COUNT_SUFFIX)] for field in reader.fieldnames
+                if field.endswith(COUNT_SUFFIX)]
+    value_list = []
+    acc_dict = {}
+    for rec in reader:
+        value = rec[parameter]
+        value_list.append(value)
+        acc_dict[value] = {}
+        for alg in alg_list:
+            count = int(rec[alg + COUNT_SUFFIX])
+            mean = to_number(rec[alg]) or 0.0
+            std = to_number(rec[alg + STD_SUFFIX]) or 0.0
+            acc_dict[value][alg] = [count, mean,
+                                    std * std * max(count - 1, 0)]
+    in_file.close()
+    return (parameter, value_list, alg_list, acc_dict)
+
+
+def is_interval_file(filename):
+    '''
+    Check if a file was written by write_interval_file
+    '''
+    in_file = open(filename, 'r')
+    header = in_file.readline()
+    in_file.close()
+    return COUNT_SUFFIX + ',' in header or \
+        header.rstrip().endswith(COUNT_SUFFIX)
+
+
+def write_interval_file(out_file, parameter, value_list, alg_list, acc_dict,
+                        confidence=CONFIDENCE):
+    '''
+    Write mean, standard deviation and confidence interval of each parameter
+    value and algorithm
+
+    acc_dict[value][alg] holds (count, mean, sum of squared differences)
+    '''
+    field_list = [parameter]
+    for alg in sorted(alg_list):
+        field_list += [alg, alg + STD_SUFFIX, alg + CI_SUFFIX,
+                       alg + COUNT_SUFFIX]
+    output_file = open(out_file, 'w')
+    writer = csv.DictWriter(output_file, field_list)
+    header = {field: field for field in field_list}
+    writer.writerow(header)
+    for value in value_list:
+        rec = {parameter: value}
+        for alg in alg_list:
+            count, mean, sum_sq = acc_dict[value][alg]
+            std, half_width = get_statistics(count, mean, sum_sq, confidence)
+            rec[alg] = mean if count else float('NaN')
+            rec[alg + STD_SUFFIX] = std
+            rec[alg + CI_SUFFIX] = half_width
+            rec[alg + COUNT_SUFFIX] = count
+        writer.writerow(rec)
+    output_file.close()
+
+
+def is_converged(value_list, target, confidence=CONFIDENCE):
+    '''
+    Check if the relative half-width of the confidence interval of a list of
+    values is within target
+    '''
+    count = len(value_list)
+    if count < 2:
+        return False
+    mean = sum(value_list) / count
+    sum_sq = sum((value - mean) * (value - mean) for value in value_list)
+    half_width = get_statistics(count, mean, sum_sq, confidence)[1]
+    if mean == 0:
+        return half_width == 0
+    return half_width / abs(mean) <= target
+
+
+def run_adaptive(run_function, runtime_function, args, detail_function=None):
+    '''
+    Repeat runs of an experiment cell until its runtime confidence interval
+    converges (bounded by minimum and maximum number of runs)
+
+    run_function(count) executes a run and returns its status and
+    runtime_function(count) returns the runtime of a run, warm-up runs
+    precede the first pending run when detail_function(count) is given
+    '''
+    status = STATUS_MISSING
+    runtime_list = []
+    warm = detail_function is None
+    for count in range(1, args.max_runs + 1):
+        if not warm and is_pending(detail_function(count),
+                                   get_limits(args)):
+            run_warmup(run_function, detail_function, args)
+            warm = True
+        status = run_function(count)
+        if status in FAILURE_LIST:
+            break
+        runtime = to_number(runtime_function(count))
+        if runtime is not None:
+            runtime_list.append(runtime)
+        if count >= args.min_runs and \
+                is_converged(runtime_list, args.target_width):
+            print 'Converged after ' + str(count) + ' runs'
+            break
+    return status
+
+
+def is_cell_pending(detail_function, args):
+    '''
+    Check if an adaptive experiment cell has pending runs among its minimum
+    number of runs (detail_function(count) returns the detail file of a run,
+    a failure ends the cell)
+    '''
+    limits = get_limits(args)
+    for count in range(1, args.min_runs + 1):
+        detail_file = detail_function(count)
+        if is_failed(detail_file, limits):
+            return False
+        if not os.path.isfile(detail_file):
+            return True
+    return False
+
+
+def add_crossover_arguments(parser, algorithm_list, parameter_list):
+    '''
+    Add arguments for search of crossover between algorithms
+    '''
+    parser.add_argument('-x', '--crossover', action="store", nargs=2,
+                        metavar='ALGORITHM', choices=algorithm_list,
+                        help='Search parameter value where runtimes of ' +
+                        'two algorithms cross')
+    parser.add_argument('--axis', action="store", choices=parameter_list,
+                        default=parameter_list[0],
+                        help='Parameter of crossover search (default: ' +
+                        parameter_list[0] + ')')
+    parser.add_argument('--bounds', action="store", nargs=2, type=int,
+                        metavar=('LOW', 'HIGH'), default=None,
+                        help='Bounds of crossover search (default: ' +
+                        'bounds of experiment grid)')
+
+
+def get_mean(value_list):
+    '''
+    Return mean of values (None for empty list)
+    '''
+    number_list = [number for number in
+                   [to_number(value) for value in value_list]
+                   if number is not None]
+    if not number_list:
+        return None
+    return sum(number_list) / len(number_list)
+
+
+def run_cell(run_function, runtime_function, detail_function, run_count,
+             args):
+    '''
+    Run an experiment cell (adaptively or run_count times) and return the
+    mean runtime of its runs (infinite when a run is killed by limits)
+    '''
+    if args.adaptive:
+        status = run_adaptive(run_function, runtime_function, args,
+                              detail_function)
+    else:
+        status = STATUS_MISSING
+        warm = False
+        for count in range(1, run_count + 1):
+            if not warm and is_pending(detail_function(count),
+                                       get_limits(args)):
+                run_warmup(run_function, detail_function, args)
+                warm = True
+            status = run_function(count)
+            if status in FAILURE_LIST:
+                break
+    if status in FAILURE_LIST:
+        return float('inf')
+    runtime_list = []
+    count = 1
+    while os.path.isfile(detail_function(count)):
+        runtime_list.append(runtime_function(count))
+        count += 1
+    return get_mean(runtime_list)
+
+
+def get_difference(mean_a, mean_b):
+    '''
+    Return difference of mean runtimes (None if it is undefined)
+    '''
+    if mean_a is None or mean_b is None or mean_a == mean_b == float('inf'):
+        return None
+    return mean_a - mean_b
+
+
+def find_crossover(evaluate, low, high):
+    '''
+    Bisect an integer parameter axis for the value where the runtime
+    difference of two algorithms changes sign (a single crossing between
+    bounds is assumed)
+
+    evaluate(value) returns the mean runtimes of both algorithms, return the
+    evaluated means indexed by value and the bracket (low, high) of the
+    crossover (None if the difference has the same sign at both bounds)
+    '''
+    mean_dict = {low: evaluate(low), high: evaluate(high)}
+    diff_low = get_difference(*mean_dict[low])
+    diff_high = get_difference(*mean_dict[high])
+    if diff_low is None or diff_high is None or \
+            (diff_low > 0) == (diff_high > 0):
+        return mean_dict, None
+    while high - low > 1:
+        middle = (low + high) // 2
+        mean_dict[middle] = evaluate(middle)
+        diff = get_difference(*mean_dict[middle])
+        if diff is None:
+            break
+        if (diff > 0) == (diff_low > 0):
+            low = middle
+        else:
+            high = middle
+    return mean_dict, (low, high)
+
+
+def print_crossover(algorithm_pair, parameter, mean_dict, bracket):
+    '''
+    Print result of crossover search
+    '''
+    print '|'.join([parameter] + list(algorithm_pair))
+    for value in sorted(mean_dict):
+        print '|'.join([str(value)] + [str(mean)
+                                       for mean in mean_dict[value]])
+    if bracket is None:
+        print 'No crossover found'
+    else:
+        print 'Crossover between ' + parameter + ' ' + str(bracket[0]) + \
+            ' and ' + str(bracket[1])
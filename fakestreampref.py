@@ -0,0 +1,198 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Stand-in for StreamPref DSMS to exercise the experiment tools without the
+real prototype
+
+It accepts the command line used by the experiment tools, reads the streams
+registered in the environment file and writes a details file with simulated
+runtime and memory for each iteration
+
+Simulation is configured by environment variables:
+- FAKE_STREAMPREF_COST: seconds per tuple in window (default: 1e-6)
+- FAKE_STREAMPREF_MEMORY: bytes per tuple in window (default: 100)
+- FAKE_STREAMPREF_NOISE: relative noise of runtime (default: 0.05)
+- FAKE_STREAMPREF_SLEEP: sleep the simulated runtime when set to 1
+- FAKE_STREAMPREF_ALLOCATE: allocate the simulated memory when set to 1
+- FAKE_STREAMPREF_FACTOR_<ALGORITHM>: cost factor of an algorithm
+'''
+
+import csv
+import os
+import random
+import re
+import sys
+import time
+
+
+# Environment variables
+COST_VARIABLE = 'FAKE_STREAMPREF_COST'
+MEMORY_VARIABLE = 'FAKE_STREAMPREF_MEMORY'
+NOISE_VARIABLE = 'FAKE_STREAMPREF_NOISE'
+SLEEP_VARIABLE = 'FAKE_STREAMPREF_SLEEP'
+ALLOCATE_VARIABLE = 'FAKE_STREAMPREF_ALLOCATE'
+FACTOR_VARIABLE = 'FAKE_STREAMPREF_FACTOR_'
+
+# Defaults
+COST_DEFAULT = 1e-6
+MEMORY_DEFAULT = 100
+NOISE_DEFAULT = 0.05
+# Cost factor of algorithms (CQL equivalences are the slowest)
+FACTOR_DICT = {'cql': 10.0, 'naive': 2.0, 'bnl_search': 3.0,
+               'partition': 1.5}
+# Default window range when query has no window
+RANGE_DEFAULT = 1
+
+# Registration of streams, tables and queries in environment files
+REGISTER_RE = re.compile(r"REGISTER\s+(STREAM|TABLE|QUERY)\s+(\w+)"
+                         r"[^;]*?INPUT\s+'([^']*)'\s*;", re.I | re.S)
+# Window range in queries
+RANGE_RE = re.compile(r'RANGE\s+(\d+)\s+SECOND', re.I)
+
+# Details fields
+TIMESTAMP = 'timestamp'
+RUNTIME = 'runtime'
+MEMORY = 'memory'
+DETAILS_HEADER = [TIMESTAMP, RUNTIME, MEMORY]
+
+
+def parse_environment(env_file):
+    '''
+    Return lists of input files (streams and tables) and query files
+    '''
+    text = open(env_file).read()
+    input_list = []
+    query_list = []
+    for kind, _, filename in REGISTER_RE.findall(text):
+        if kind.upper() == 'QUERY':
+            query_list.append(filename)
+        else:
+            input_list.append(filename)
+    return input_list, query_list
+
+
+def get_range(query_list):
+    '''
+    Return largest window range of queries
+    '''
+    max_range = RANGE_DEFAULT
+    for filename in query_list:
+        if not os.path.isfile(filename):
+            print 'Query file not found: ' + filename
+            sys.exit(1)
+        for value in RANGE_RE.findall(open(filename).read()):
+            max_range = max(max_range, int(value))
+    return max_range
+
+
+def count_tuples(input_list, delimiter, max_ts):
+    '''
+    Count tuples per timestamp of input files
+    '''
+    count_dict = {}
+    for filename in input_list:
+        if not os.path.isfile(filename):
+            print 'Input file not found: ' + filename
+            sys.exit(1)
+        in_file = open(filename)
+        reader = csv.reader(in_file, delimiter=delimiter)
+        for row in reader:
+            try:
+                timestamp = int(row[0])
+            except (ValueError, IndexError):
+                # Header
+                continue
+            if timestamp <= max_ts:
+                count_dict[timestamp] = count_dict.get(timestamp, 0) + 1
+        in_file.close()
+    return count_dict
+
+
+def get_float_variable(name, default):
+    '''
+    Return float from environment variable
+    '''
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def simulate(args):
+    '''
+    Simulate execution and write details file
+    '''
+    input_list, query_list = parse_environment(args.env)
+    max_range = get_range(query_list)
+    count_dict = count_tuples(input_list, args.delimiter, args.max)
+    algorithm = args.preference or args.temporal or args.subsequence or 'cql'
+    factor = FACTOR_DICT.get(algorithm, 1.0)
+    factor = get_float_variable(FACTOR_VARIABLE + algorithm.upper(), factor)
+    # CQL equivalences register many queries
+    factor *= max(len(query_list), 1)
+    cost = get_float_variable(COST_VARIABLE, COST_DEFAULT) * factor
+    tuple_memory = get_float_variable(MEMORY_VARIABLE, MEMORY_DEFAULT)
+    noise = get_float_variable(NOISE_VARIABLE, NOISE_DEFAULT)
+    do_sleep = os.environ.get(SLEEP_VARIABLE) == '1'
+    do_allocate = os.environ.get(ALLOCATE_VARIABLE) == '1'
+    allocated = []
+    window_count = 0
+    out_file = open(args.details, 'w')
+    writer = csv.DictWriter(out_file, DETAILS_HEADER)
+    writer.writerow({field: field for field in DETAILS_HEADER})
+    for timestamp in range(1, args.max + 1):
+        # Tuples in window
+        window_count += count_dict.get(timestamp, 0)
+        window_count -= count_dict.get(timestamp - max_range, 0)
+        runtime = cost * window_count * \
+            max(random.gauss(1.0, noise), 0.0)
+        memory = int(tuple_memory * window_count * max_range)
+        if do_sleep:
+            time.sleep(runtime)
+        if do_allocate:
+            allocated = [bytearray(memory)]
+        writer.writerow({TIMESTAMP: timestamp, RUNTIME: runtime,
+                         MEMORY: memory})
+    out_file.close()
+    del allocated
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('FakeStreamPref')
+    parser.add_argument('-r', '--delimiter', action="store", default=',',
+                        help='Delimiter of input files')
+    parser.add_argument('-e', '--env', action="store",
+                        help='Environment file')
+    parser.add_argument('-d', '--details', action="store",
+                        help='Details file')
+    parser.add_argument('-m', '--max', action="store", type=int,
+                        help='Maximum timestamp')
+    parser.add_argument('-p', '--preference', action="store",
+                        help='Algorithm for preference operators')
+    parser.add_argument('-t', '--temporal', action="store",
+                        help='Algorithm for temporal preference operators')
+    parser.add_argument('-s', '--subsequence', action="store",
+                        help='Algorithm for subsequence operators')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    if args.env is None or args.details is None or args.max is None:
+        get_arguments(True)
+        sys.exit(1)
+    simulate(args)
+
+
+if __name__ == '__main__':
+    main()
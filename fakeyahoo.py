@@ -0,0 +1,178 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Stand-in for the historical data service of Yahoo Finance to exercise the
+import tool without network access
+
+It serves the files of a directory (one file per symbol named as
+<symbol>.csv) as historical data of the symbol in query parameter "s" with
+ETag and Last-Modified headers, conditional requests (If-None-Match and
+If-Modified-Since) of unchanged files are answered with 304 Not Modified
+
+Use it with yfimport.py --url http://localhost:<port>/table.csv?s={ss}
+'''
+
+import BaseHTTPServer
+import SocketServer
+import email.utils
+import hashlib
+import os
+import random
+import threading
+import urlparse
+
+
+# Default port
+PORT_DEFAULT = 8000
+
+
+def count_response(counter, status, size):
+    '''
+    Count a response (counter holds a lock and counts by status)
+    '''
+    lock, count_dict = counter
+    with lock:
+        count, total = count_dict.get(status, (0, 0))
+        count_dict[status] = (count + 1, total + size)
+
+
+def report_counter(counter):
+    '''
+    Return counts of responses by status
+    '''
+    lock, count_dict = counter
+    with lock:
+        return ', '.join([str(status) + ': ' + str(count) +
+                          ' requests (' + str(total) + ' bytes)'
+                          for status, (count, total) in
+                          sorted(count_dict.items())])
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Threaded HTTP server
+    '''
+    daemon_threads = True
+
+
+def is_not_modified(headers, etag, mtime):
+    '''
+    Check if conditional request headers match current version of a file
+    '''
+    if_none_match = headers.getheader('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or \
+            if_none_match.strip() == '*'
+    if_modified_since = headers.getheader('If-Modified-Since')
+    if if_modified_since is not None:
+        since = email.utils.parsedate_tz(if_modified_since)
+        if since is not None:
+            return int(mtime) <= email.utils.mktime_tz(since)
+    return False
+
+
+def get_handler(data_dir, error_rate, counter, verbose):
+    '''
+    Return request handler class serving files of a directory
+    '''
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        '''
+        Request handler of historical data
+        '''
+
+        def send(self, status, content='', header_dict=None):
+            '''
+            Send response
+            '''
+            self.send_response(status)
+            for key, value in (header_dict or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            count_response(counter, status, len(content))
+
+        def do_GET(self):  # IGNORE:invalid-name
+            '''
+            Answer request of historical data
+            '''
+            query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+            symbol = query.get('s', [''])[0]
+            filename = os.path.join(data_dir, symbol + '.csv')
+            if random.random() < error_rate:
+                self.send(503)
+                return
+            if not symbol or os.sep in symbol or \
+                    not os.path.isfile(filename):
+                self.send(404)
+                return
+            content = open(filename).read()
+            mtime = os.path.getmtime(filename)
+            etag = '"' + hashlib.md5(content).hexdigest() + '"'
+            header_dict = {'ETag': etag,
+                           'Last-Modified': email.utils.formatdate(
+                               mtime, usegmt=True)}
+            if is_not_modified(self.headers, etag, mtime):
+                self.send(304, '', header_dict)
+                return
+            header_dict['Content-Type'] = 'text/csv'
+            self.send(200, content, header_dict)
+
+        def log_message(self, *args):  # IGNORE:arguments-differ
+            '''
+            Log requests only when verbose
+            '''
+            if verbose:
+                BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+    return Handler
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('FakeYahoo')
+    parser.add_argument('-d', '--directory', action="store",
+                        help='Directory of historical files (<symbol>.csv)')
+    parser.add_argument('-p', '--port', action="store", type=int,
+                        default=PORT_DEFAULT,
+                        help='Port to listen (default: ' +
+                        str(PORT_DEFAULT) + ')')
+    parser.add_argument('-e', '--error-rate', action="store", type=float,
+                        default=0.0,
+                        help='Fraction of requests answered with 503 ' +
+                        '(transient errors)')
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        default=False,
+                        help='Log every request')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    if args.directory is None:
+        get_arguments(True)
+        return
+    counter = (threading.Lock(), {})
+    handler = get_handler(args.directory, args.error_rate, counter,
+                          args.verbose)
+    server = Server(('', args.port), handler)
+    print 'Serving ' + args.directory + ' on port ' + str(args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print 'Responses: ' + report_counter(counter)
+
+
+if __name__ == '__main__':
+    main()
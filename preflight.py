@@ -0,0 +1,107 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to estimate the state size of experiment runs before their execution
+
+Tools estimate the tuples held by the relations of each algorithm from the
+statistics of their data file (see streamstats.py), the bytes per tuple of
+each algorithm are calibrated from the memory of past runs stored in the
+results database and runs predicted to exceed a memory budget are skipped
+(only the algorithms over the budget, harder configurations are pruned)
+'''
+
+import json
+
+from streamstats import get_stats
+from warehouse import WAREHOUSE_FILE, connect
+
+
+# Query for memory of current successful runs
+SAMPLES_QUERY = '''
+SELECT parameters, algorithm, memory
+FROM run WHERE tool = ? AND current = 1 AND status = 'ok' AND memory > 0;
+'''
+# Bytes per tuple without calibration
+TUPLE_BYTES = 100.0
+# Bytes per megabyte
+MEGABYTE = 1024 * 1024
+
+
+def add_preflight_arguments(parser):
+    '''
+    Add arguments for pre-flight estimation of runs
+    '''
+    parser.add_argument('--memory-budget', action="store", type=float,
+                        default=None,
+                        help='Skip runs with predicted memory over budget ' +
+                        'in MB (estimated from stream statistics)')
+
+
+def get_median(value_list):
+    '''
+    Return median of a list of values
+    '''
+    value_list = sorted(value_list)
+    middle = len(value_list) // 2
+    if len(value_list) % 2:
+        return value_list[middle]
+    return (value_list[middle - 1] + value_list[middle]) / 2.0
+
+
+def calibrate(sample_list, estimate_function):
+    '''
+    Return median bytes per estimated tuple of each algorithm (None holds the
+    median of all algorithms)
+
+    sample_list holds (configuration, algorithm, memory) of past runs
+    '''
+    ratio_dict = {}
+    for exp_conf, alg, memory in sample_list:
+        size = estimate_function(exp_conf, alg)
+        if size > 0:
+            ratio_dict.setdefault(alg, []).append(memory / size)
+    calibration = {alg: get_median(ratio_dict[alg]) for alg in ratio_dict}
+    calibration[None] = TUPLE_BYTES
+    if ratio_dict:
+        calibration[None] = get_median([ratio for ratio_list in
+                                        ratio_dict.values()
+                                        for ratio in ratio_list])
+    return calibration
+
+
+def get_predictor(tool, data_file, register_str, estimate_function,
+                  filename=WAREHOUSE_FILE):
+    '''
+    Return function to predict memory in bytes of a configuration and
+    algorithm (None if the data file could not be profiled)
+
+    estimate_function(conf, alg, stats) returns the tuples held by the
+    relations of an algorithm
+    '''
+    stats = get_stats(data_file, register_str)
+    if stats is None:
+        return None
+    connection = connect(filename)
+    sample_list = [(json.loads(parameters), alg, memory)
+                   for parameters, alg, memory in
+                   connection.execute(SAMPLES_QUERY, (tool,))]
+    connection.close()
+    calibration = calibrate(
+        sample_list, lambda conf, alg: estimate_function(conf, alg, stats))
+    return lambda conf, alg: \
+        estimate_function(conf, alg, stats) * \
+        calibration.get(alg, calibration[None])
+
+
+def is_over_budget(predictor, experiment_conf, algorithm, args):
+    '''
+    Check if a run is predicted to exceed the memory budget
+    '''
+    if predictor is None or args.memory_budget is None:
+        return False
+    memory = predictor(experiment_conf, algorithm) / MEGABYTE
+    if memory <= args.memory_budget:
+        return False
+    print 'Predicted memory over budget: ' + algorithm + ' ' + \
+        str(experiment_conf) + ' (' + str(round(memory, 1)) + ' MB)'
+    return True
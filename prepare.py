@@ -0,0 +1,197 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to prepare data files of experiment tools
+
+The imported transaction file (or the file of a symbol tier) is sorted by
+timestamp once and every data file is written in the same pass, projected to
+the attributes of the stream registered by its tool (data files with identical
+attributes are hardlinked)
+'''
+
+import errno
+import os
+import re
+import shutil
+import subprocess
+
+from yfimport import TRANSACTION_FILE, TRANSACTION_HEADER, TS, get_tier_file
+
+
+# Modules of experiment tools
+TOOL_LIST = ['best', 'seq', 'conseq', 'endseq', 'bestseq']
+# Command to sort transaction file by timestamp
+SORT_COMMAND = ['sort', '-g']
+# Delimiter of transaction file
+DELIMITER = '|'
+# Suffix of data files being written
+TEMP_SUFFIX = '.tmp'
+# Errors of hardlinks not supported by filesystem
+LINK_ERRORS = [errno.EXDEV, errno.EPERM, errno.EMLINK]
+
+# Registration of streams in environment files
+REGISTER_STREAM_RE = re.compile(r'REGISTER\s+STREAM\s+\w+\s*\(([^)]*)\)',
+                                re.I | re.S)
+
+
+def get_stream_attributes(register_str):
+    '''
+    Return attributes (timestamp first) of the stream registered by a string
+    '''
+    match = REGISTER_STREAM_RE.search(register_str)
+    if match is None:
+        raise ValueError('Stream registration not found')
+    att_list = [TS]
+    for att_def in match.group(1).split(','):
+        att_list.append(att_def.split()[0])
+    return att_list
+
+
+def get_projection(att_list):
+    '''
+    Return positions of attributes in transaction file (None if all
+    attributes are kept in the same order)
+    '''
+    for att in att_list:
+        if att not in TRANSACTION_HEADER:
+            raise ValueError('Attribute not found in transaction file: ' +
+                             att)
+    if att_list == TRANSACTION_HEADER:
+        return None
+    return [TRANSACTION_HEADER.index(att) for att in att_list]
+
+
+def is_prepared(data_file):
+    '''
+    Check if a data file is newer than transaction file
+    '''
+    return os.path.isfile(data_file) and os.path.isfile(TRANSACTION_FILE) \
+        and os.path.getmtime(data_file) >= os.path.getmtime(TRANSACTION_FILE)
+
+
+def link_file(source_file, target_file):
+    '''
+    Hardlink a file (copy if filesystem does not support it)
+    '''
+    if os.path.isfile(target_file):
+        if os.path.samefile(source_file, target_file):
+            return
+        os.remove(target_file)
+    try:
+        os.link(source_file, target_file)
+    except OSError as exc:
+        if exc.errno not in LINK_ERRORS:
+            raise
+        shutil.copy2(source_file, target_file)
+
+
+def prepare_data(target_list, source_file=TRANSACTION_FILE):
+    '''
+    Sort transaction file once and write the data files of all targets
+
+    target_list holds pairs (data file, stream registration string), data
+    files are written to temporary files and renamed, so that hardlinks of
+    data files out of the targets are never written
+    '''
+    if not os.path.isfile(source_file):
+        print 'Transaction file not found: ' + source_file + '\n' + \
+            'Make sure that import tool was executed'
+        return
+    # Data files of each projection (first file is written, others linked)
+    projection_dict = {}
+    for data_file, register_str in target_list:
+        projection = get_projection(get_stream_attributes(register_str))
+        key = tuple(projection) if projection is not None else None
+        projection_dict.setdefault(key, []).append(data_file)
+    for data_file, _ in target_list:
+        data_dir = os.path.dirname(data_file)
+        if data_dir and not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+    out_list = []
+    for key, file_list in projection_dict.items():
+        out_list.append((key, open(file_list[0] + TEMP_SUFFIX, 'w')))
+    process = subprocess.Popen(SORT_COMMAND + [source_file],
+                               stdout=subprocess.PIPE)
+    for line in process.stdout:
+        field_list = None
+        for key, out_file in out_list:
+            if key is None:
+                out_file.write(line)
+                continue
+            if field_list is None:
+                text = line.rstrip('\r\n')
+                field_list = text.split(DELIMITER)
+                # Line terminator is kept
+                end = line[len(text):]
+            out_file.write(DELIMITER.join([field_list[index]
+                                           for index in key]) + end)
+    process.wait()
+    for _, out_file in out_list:
+        out_file.close()
+    if process.returncode:
+        print 'Error sorting transaction file: ' + source_file
+        for file_list in projection_dict.values():
+            os.remove(file_list[0] + TEMP_SUFFIX)
+        return
+    for file_list in projection_dict.values():
+        os.rename(file_list[0] + TEMP_SUFFIX, file_list[0])
+        for data_file in file_list[1:]:
+            link_file(file_list[0], data_file)
+
+
+def get_targets(tool_list):
+    '''
+    Return data file and stream registration string of tools
+    '''
+    target_list = []
+    for tool in tool_list:
+        module = __import__(tool)
+        register_str = getattr(module, 'REG_STREAM_STR', None) or \
+            getattr(module, 'REGISTER_DEFAULT')
+        target_list.append((module.DATA_FILE, register_str))
+    return target_list
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('Prepare')
+    parser.add_argument('-t', '--tools', action="store", nargs='+',
+                        choices=TOOL_LIST, default=TOOL_LIST,
+                        help='Tools to prepare (default: all)')
+    parser.add_argument('-f', '--force', action="store_true", default=False,
+                        help='Prepare data files even if they are updated')
+    parser.add_argument('--tier', action="store", type=float, default=None,
+                        help='Prepare data files from the transactions of ' +
+                        'a symbol tier (percentage imported with ' +
+                        'yfimport.py --tiers)')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    source_file = TRANSACTION_FILE
+    if args.tier is not None:
+        source_file = get_tier_file(args.tier)
+    # Data files of a tier replace the current ones
+    target_list = [(data_file, register_str) for data_file, register_str
+                   in get_targets(args.tools)
+                   if args.force or args.tier is not None or
+                   not is_prepared(data_file)]
+    if not target_list:
+        print 'Data files are updated'
+        return
+    print 'Preparing data files from ' + source_file
+    prepare_data(target_list, source_file)
+
+
+if __name__ == '__main__':
+    main()
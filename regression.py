@@ -0,0 +1,176 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to detect performance regressions between two experiment sweeps
+
+Summary (or result) files of both sweeps are compared for each parameter
+value and algorithm with a one-sided Welch's t-test, significant increases
+of runtime or memory are reported with their effect size
+'''
+
+import math
+import os
+import sys
+
+from experiment import is_interval_file, read_interval_file,\
+    read_summary_file, t_cdf
+
+
+# Prefixes of compared files
+FILE_PREFIX_LIST = ['runtime', 'memory']
+# Significance level
+ALPHA = 0.05
+# Minimum relative increase of mean to be reported
+MIN_CHANGE = 0.05
+# Output header
+OUTPUT_HEADER = ['file', 'value', 'algorithm', 'old', 'new', 'change',
+                 'cohen_d', 'p_value', 'verdict']
+# Verdicts
+REGRESSION = 'REGRESSION'
+IMPROVEMENT = 'improvement'
+UNCHANGED = 'unchanged'
+UNTESTED = 'untested'
+
+
+def welch_test(old_acc, new_acc):
+    '''
+    One-sided Welch's t-test for increase of mean from old to new sample
+
+    Accumulators hold (count, mean, sum of squared differences), return
+    (p-value, Cohen's d) or None when there are not enough runs
+    '''
+    old_count, old_mean, old_sum_sq = old_acc
+    new_count, new_mean, new_sum_sq = new_acc
+    if old_count < 2 or new_count < 2:
+        return None
+    old_var = old_sum_sq / (old_count - 1)
+    new_var = new_sum_sq / (new_count - 1)
+    pooled_std = math.sqrt((old_sum_sq + new_sum_sq) /
+                           (old_count + new_count - 2))
+    diff = new_mean - old_mean
+    if pooled_std == 0:
+        effect = float('inf') if diff > 0 else 0.0
+    else:
+        effect = diff / pooled_std
+    old_err = old_var / old_count
+    new_err = new_var / new_count
+    if old_err + new_err == 0:
+        return (0.0 if diff > 0 else 1.0, effect)
+    t_val = diff / math.sqrt(old_err + new_err)
+    # Welch-Satterthwaite degrees of freedom
+    dof = (old_err + new_err) ** 2 / \
+        (old_err ** 2 / (old_count - 1) + new_err ** 2 / (new_count - 1))
+    return (1.0 - t_cdf(t_val, dof), effect)
+
+
+def read_file(filename):
+    '''
+    Read summary or result file as accumulators
+    '''
+    if is_interval_file(filename):
+        return read_interval_file(filename)
+    return read_summary_file(filename)
+
+
+def compare_file(old_file, new_file, alpha, min_change):
+    '''
+    Compare every parameter value and algorithm of two files
+    '''
+    _, _, _, old_dict = read_file(old_file)
+    _, value_list, alg_list, new_dict = read_file(new_file)
+    rec_list = []
+    for value in value_list:
+        if value not in old_dict:
+            continue
+        for alg in alg_list:
+            if alg not in old_dict[value]:
+                continue
+            old_acc = old_dict[value][alg]
+            new_acc = new_dict[value][alg]
+            rec = {'file': os.path.basename(new_file), 'value': value,
+                   'algorithm': alg, 'old': old_acc[1], 'new': new_acc[1],
+                   'change': float('NaN'), 'cohen_d': float('NaN'),
+                   'p_value': float('NaN'), 'verdict': UNTESTED}
+            if old_acc[1]:
+                rec['change'] = (new_acc[1] - old_acc[1]) / old_acc[1]
+            result = welch_test(old_acc, new_acc)
+            if result is not None:
+                rec['p_value'], rec['cohen_d'] = result
+                rec['verdict'] = UNCHANGED
+                if rec['p_value'] < alpha and rec['change'] > min_change:
+                    rec['verdict'] = REGRESSION
+                elif 1.0 - rec['p_value'] < alpha and \
+                        rec['change'] < -min_change:
+                    rec['verdict'] = IMPROVEMENT
+            rec_list.append(rec)
+    return rec_list
+
+
+def compare_directories(old_dir, new_dir, alpha, min_change):
+    '''
+    Compare all runtime and memory files found in both directories
+    '''
+    rec_list = []
+    for filename in sorted(os.listdir(new_dir)):
+        if not any(filename.startswith(prefix)
+                   for prefix in FILE_PREFIX_LIST):
+            continue
+        old_file = old_dir + os.sep + filename
+        if not os.path.isfile(old_file):
+            print 'File does not exists: ' + old_file
+            continue
+        rec_list += compare_file(old_file, new_dir + os.sep + filename,
+                                 alpha, min_change)
+    return rec_list
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('Regression')
+    parser.add_argument('old', action="store",
+                        help='Summary (or result) directory of old sweep')
+    parser.add_argument('new', action="store",
+                        help='Summary (or result) directory of new sweep')
+    parser.add_argument('-a', '--alpha', action="store", type=float,
+                        default=ALPHA,
+                        help='Significance level (default: ' +
+                        str(ALPHA) + ')')
+    parser.add_argument('-c', '--min-change', action="store", type=float,
+                        default=MIN_CHANGE,
+                        help='Minimum relative increase of mean ' +
+                        '(default: ' + str(MIN_CHANGE) + ')')
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        default=False,
+                        help='Show all comparisons')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    rec_list = compare_directories(args.old, args.new, args.alpha,
+                                   args.min_change)
+    regression_count = 0
+    print '|'.join(OUTPUT_HEADER)
+    for rec in rec_list:
+        if rec['verdict'] == REGRESSION:
+            regression_count += 1
+        elif not args.verbose:
+            continue
+        print '|'.join([str(rec[field]) for field in OUTPUT_HEADER])
+    print str(regression_count) + ' regressions in ' + \
+        str(len(rec_list)) + ' comparisons'
+    if regression_count:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
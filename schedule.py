@@ -0,0 +1,267 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to schedule experiment runs by predicted runtime
+
+A log-linear cost model is fitted for each algorithm from the runs stored in
+the results database (logarithm of runtime as a linear function of the
+logarithms of numeric parameters and data size, other parameters are
+indicators) and jobs are ordered and packed longest-processing-time-first
+across workers
+
+Shards of a sweep share the assignment of jobs stored by the first shard to
+schedule them (models fitted on each host may differ)
+'''
+
+import errno
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+
+from experiment import EPSILON, get_host, get_limits, is_pending
+from warehouse import WAREHOUSE_FILE, connect
+
+
+# Query for runtimes of current runs
+SAMPLES_QUERY = '''
+SELECT parameters, algorithm, data_size, runtime
+FROM run WHERE tool = ? AND current = 1 AND runtime > 0;
+'''
+# Intercept feature
+INTERCEPT = ''
+# Feature of data size
+SIZE_FEATURE = 'log_size'
+# Regularization of least squares (keeps constant features solvable)
+RIDGE = 1e-6
+# Predicted runtime without fitted model (seconds)
+DEFAULT_COST = 1.0
+# Prefix of files with assignment of jobs to shards
+ASSIGNMENT_PREFIX = 'assignment-'
+
+
+def get_features(experiment_conf, data_size):
+    '''
+    Return features of an experiment configuration
+    '''
+    feature_dict = {INTERCEPT: 1.0}
+    for key, value in experiment_conf.items():
+        if isinstance(value, (int, long, float)) and value > 0:
+            feature_dict['log_' + key] = math.log(value)
+        else:
+            feature_dict[key + '=' + str(value)] = 1.0
+    if data_size:
+        feature_dict[SIZE_FEATURE] = math.log(data_size)
+    return feature_dict
+
+
+def solve(matrix, vector):
+    '''
+    Solve linear system by Gaussian elimination with partial pivoting
+    '''
+    size = len(vector)
+    aug = [list(matrix[row]) + [vector[row]] for row in range(size)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda row: abs(aug[row][col]))
+        if abs(aug[pivot][col]) < EPSILON:
+            continue
+        aug[col], aug[pivot] = aug[pivot], aug[col]
+        for row in range(col + 1, size):
+            factor = aug[row][col] / aug[col][col]
+            for index in range(col, size + 1):
+                aug[row][index] -= factor * aug[col][index]
+    solution = [0.0] * size
+    for row in range(size - 1, -1, -1):
+        if abs(aug[row][row]) < EPSILON:
+            continue
+        total = aug[row][size] - sum(aug[row][index] * solution[index]
+                                     for index in range(row + 1, size))
+        solution[row] = total / aug[row][row]
+    return solution
+
+
+def fit_least_squares(sample_list):
+    '''
+    Fit coefficients of features to log runtime
+
+    sample_list holds pairs (feature dictionary, runtime)
+    '''
+    name_list = sorted(set(name for feature_dict, _ in sample_list
+                           for name in feature_dict))
+    size = len(name_list)
+    matrix = [[0.0] * size for _ in range(size)]
+    vector = [0.0] * size
+    for feature_dict, runtime in sample_list:
+        row = [feature_dict.get(name, 0.0) for name in name_list]
+        target = math.log(runtime)
+        for index_a in range(size):
+            if not row[index_a]:
+                continue
+            vector[index_a] += row[index_a] * target
+            for index_b in range(size):
+                matrix[index_a][index_b] += row[index_a] * row[index_b]
+    for index in range(size):
+        matrix[index][index] += RIDGE
+    return dict(zip(name_list, solve(matrix, vector)))
+
+
+def read_samples(connection, tool):
+    '''
+    Return runs of a tool as (configuration, algorithm, data size, runtime)
+    '''
+    return [(json.loads(parameters), alg, data_size, runtime)
+            for parameters, alg, data_size, runtime in
+            connection.execute(SAMPLES_QUERY, (tool,))]
+
+
+def fit_model(sample_list):
+    '''
+    Fit a cost model for each algorithm (None if there are no samples)
+    '''
+    if not sample_list:
+        return None
+    alg_dict = {}
+    for exp_conf, alg, data_size, runtime in sample_list:
+        alg_dict.setdefault(alg, []).append(
+            (get_features(exp_conf, data_size), runtime))
+    model = {alg: fit_least_squares(alg_dict[alg]) for alg in alg_dict}
+    # Geometric mean of all runs for algorithms without samples
+    model[None] = math.exp(sum(math.log(runtime)
+                               for _, _, _, runtime in sample_list) /
+                           len(sample_list))
+    return model
+
+
+def get_model(tool, filename=WAREHOUSE_FILE):
+    '''
+    Fit cost model of a tool from results database
+    '''
+    connection = connect(filename)
+    model = fit_model(read_samples(connection, tool))
+    connection.close()
+    return model
+
+
+def predict(model, experiment_conf, algorithm, data_size):
+    '''
+    Return predicted runtime of a run (seconds)
+    '''
+    if model is None:
+        return DEFAULT_COST
+    if algorithm not in model:
+        return model[None]
+    coef_dict = model[algorithm]
+    feature_dict = get_features(experiment_conf, data_size)
+    # Features not seen when fitting (new categories) are ignored
+    log_cost = sum(coef_dict[name] * value
+                   for name, value in feature_dict.items()
+                   if name in coef_dict)
+    return math.exp(log_cost)
+
+
+def lpt_schedule(cost_list, workers):
+    '''
+    Assign jobs longest-processing-time-first to the least loaded worker
+
+    Return job indexes in execution order, worker of each job and predicted
+    makespan
+    '''
+    # Ties are broken by job index
+    order_list = sorted(range(len(cost_list)),
+                        key=lambda index: (-cost_list[index], index))
+    heap = [(0.0, worker) for worker in range(workers)]
+    worker_list = [None] * len(cost_list)
+    for index in order_list:
+        load, worker = heapq.heappop(heap)
+        worker_list[index] = worker
+        heapq.heappush(heap, (load + cost_list[index], worker))
+    return order_list, worker_list, max(load for load, _ in heap)
+
+
+def get_assignment(key_list, worker_list, workers):
+    '''
+    Return worker of each job (by base name of key) in the assignment shared
+    by the shards of a sweep
+
+    The assignment is stored (named by a digest of the jobs and workers) by
+    the first shard in the parent of the directory of the jobs (main
+    directory of the tool, so it is not merged with detail files), other
+    shards reuse it
+    '''
+    name_list = [os.path.basename(key) for key in key_list]
+    digest = hashlib.md5('\n'.join(name_list + [str(workers)])).hexdigest()
+    assign_file = os.path.join(os.path.dirname(os.path.dirname(key_list[0])),
+                               ASSIGNMENT_PREFIX + digest + '.json')
+    if not os.path.isfile(assign_file):
+        temp_file = assign_file + '.' + get_host() + '-' + str(os.getpid())
+        out_file = open(temp_file, 'w')
+        json.dump(dict(zip(name_list, worker_list)), out_file)
+        out_file.close()
+        # Link fails if another shard stored its assignment meanwhile
+        try:
+            os.link(temp_file, assign_file)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        os.remove(temp_file)
+    in_file = open(assign_file)
+    worker_dict = json.load(in_file)
+    in_file.close()
+    return worker_dict
+
+
+def schedule_jobs(job_list, key_function, cost_function, model, args,
+                  rand=None, pending_function=None):
+    '''
+    Order jobs longest-processing-time-first and print predicted makespan
+
+    key_function(job) returns the detail file (or key) of a job,
+    cost_function(job) its predicted runtime and pending_function(job) if it
+    was not executed yet (by default if its detail file is pending), return
+    ordered jobs (jobs of equal cost shuffled if a random generator is given)
+    and their assignment to this shard (empty if not sharded or without
+    model, jobs are then assigned by hash of key)
+
+    Jobs are scheduled in order of their keys, so that the assignment does
+    not depend on the execution order of each host
+    '''
+    workers = args.workers or 1
+    if args.shard is not None:
+        workers = args.shard[1]
+    job_list = sorted(job_list, key=key_function)
+    key_list = [key_function(job) for job in job_list]
+    cost_list = [cost_function(job) for job in job_list]
+    order_list, worker_list, _ = lpt_schedule(cost_list, workers)
+    if pending_function is None:
+        limits = get_limits(args)
+        flag_list = [is_pending(key, limits) for key in key_list]
+    else:
+        flag_list = [pending_function(job) for job in job_list]
+    # Prediction of remaining work (executed jobs cost nothing)
+    pending_list = [cost if pending else 0.0
+                    for pending, cost in zip(flag_list, cost_list)]
+    makespan = lpt_schedule(pending_list, workers)[2]
+    print 'Predicted sweep: ' + \
+        str(len([cost for cost in pending_list if cost])) + ' jobs, ' + \
+        str(round(sum(pending_list), 2)) + ' s of work, ' + \
+        str(round(makespan, 2)) + ' s makespan on ' + str(workers) + \
+        ' workers'
+    assigned_dict = {}
+    if args.shard is not None and model is not None and job_list:
+        worker_dict = get_assignment(key_list, worker_list, workers)
+        for key in key_list:
+            name = os.path.basename(key)
+            # Jobs out of stored assignment are assigned by hash of key
+            if name in worker_dict:
+                assigned_dict[key] = worker_dict[name] == args.shard[0]
+    ordered_list = []
+    # Shuffling is restricted to ties, so the LPT order is kept
+    for _, tie_iter in itertools.groupby(order_list,
+                                         key=lambda index: cost_list[index]):
+        tie_list = [job_list[index] for index in tie_iter]
+        if rand is not None:
+            rand.shuffle(tie_list)
+        ordered_list.extend(tie_list)
+    return ordered_list, assigned_dict
@@ -0,0 +1,421 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to profile the data streams of experiment tools
+
+The data file of a tool is scanned once in bounded memory and its statistics
+are stored in a sidecar file next to it (<data file>.stats.json):
+- tuples per timestamp;
+- for each window range, active identifiers (symbol, method), tuples and
+  tuples per identifier (mean sequence length) per window;
+- heavy hitter identifiers.
+
+Distinct identifiers are estimated by HyperLogLog sketches (one for each
+timestamp, merged over the timestamps of a window) and heavy hitters by a
+Count-Min sketch
+'''
+
+import hashlib
+import json
+import math
+import os
+import struct
+
+from prepare import TOOL_LIST, get_stream_attributes, get_targets
+from yfimport import METHOD, SYMBOL, TS
+
+
+# Suffix of sidecar files
+STATS_SUFFIX = '.stats.json'
+# Delimiter of data files
+DELIMITER = '|'
+# Identifier attributes of sequences
+ID_ATT_LIST = [SYMBOL, METHOD]
+# Largest window range profiled (every range from 1 is profiled)
+MAX_RANGE = 32
+# HyperLogLog precision (2^p registers, standard error 1.04 / sqrt(2^p))
+HLL_PRECISION = 10
+# Count-Min sketch dimensions
+CM_WIDTH = 2048
+CM_DEPTH = 4
+# Number of heavy hitters
+HEAVY_HITTERS = 10
+# Quantiles of summaries
+QUANTILE_LIST = [0.5, 0.9, 0.99]
+# Bits of hash values
+HASH_BITS = 64
+
+# Powers 2^-k of HyperLogLog ranks
+POWER_LIST = [2.0 ** -rank for rank in range(HASH_BITS + 2)]
+
+
+def get_stats_file(data_file):
+    '''
+    Return filename of statistics of a data file
+    '''
+    return os.path.splitext(data_file)[0] + STATS_SUFFIX
+
+
+def get_hashes(key):
+    '''
+    Return two 64-bit hash values of a key
+    '''
+    return struct.unpack('<QQ', hashlib.md5(key).digest())
+
+
+def new_hll(precision=HLL_PRECISION):
+    '''
+    Return empty HyperLogLog registers
+    '''
+    return bytearray(1 << precision)
+
+
+def add_hll(registers, hash_value):
+    '''
+    Add a hash value to HyperLogLog registers
+    '''
+    size = len(registers)
+    precision = size.bit_length() - 1
+    index = hash_value & (size - 1)
+    rest = hash_value >> precision
+    # Position of first set bit of the remaining bits
+    rank = 1
+    while not rest & 1 and rank <= HASH_BITS - precision:
+        rank += 1
+        rest >>= 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def merge_hll(registers, other):
+    '''
+    Return union of two HyperLogLog registers
+    '''
+    return bytearray(map(max, registers, other))
+
+
+def count_hll(registers):
+    '''
+    Return estimated number of distinct values of HyperLogLog registers
+    '''
+    size = len(registers)
+    alpha = 0.7213 / (1.0 + 1.079 / size)
+    estimate = alpha * size * size / sum(POWER_LIST[rank]
+                                         for rank in registers)
+    zeros = registers.count('\x00')
+    # Linear counting for small cardinalities
+    if estimate <= 2.5 * size and zeros:
+        return size * math.log(float(size) / zeros)
+    return estimate
+
+
+def new_cm(width=CM_WIDTH, depth=CM_DEPTH):
+    '''
+    Return empty Count-Min sketch
+    '''
+    return [[0] * width for _ in range(depth)]
+
+
+def add_cm(sketch, hash_pair, count=1):
+    '''
+    Add a key (given by its hash pair) to Count-Min sketch and return its
+    estimated count
+    '''
+    hash_a, hash_b = hash_pair
+    estimate = None
+    for row, counter_list in enumerate(sketch):
+        # Hashes of each row are combinations of the two hash values
+        index = (hash_a + row * hash_b) % len(counter_list)
+        counter_list[index] += count
+        if estimate is None or counter_list[index] < estimate:
+            estimate = counter_list[index]
+    return estimate
+
+
+def add_heavy_hitter(top_dict, key, estimate, size=HEAVY_HITTERS):
+    '''
+    Keep the keys with largest estimated counts
+    '''
+    if key in top_dict or len(top_dict) < size:
+        top_dict[key] = estimate
+        return
+    min_key = min(top_dict, key=top_dict.get)
+    if estimate > top_dict[min_key]:
+        del top_dict[min_key]
+        top_dict[key] = estimate
+
+
+def add_value(histogram, value):
+    '''
+    Add a value into histogram (frequency of each value)
+    '''
+    histogram[value] = histogram.get(value, 0) + 1
+
+
+def summarize_histogram(histogram):
+    '''
+    Return count, mean, minimum, maximum and quantiles of a histogram
+    '''
+    count = sum(histogram.values())
+    if not count:
+        return {'count': 0}
+    total = sum(value * freq for value, freq in histogram.items())
+    summary = {'count': count, 'mean': total / float(count),
+               'min': min(histogram), 'max': max(histogram)}
+    value_list = sorted(histogram)
+    position = 0
+    cumulative = histogram[value_list[0]]
+    for quantile in QUANTILE_LIST:
+        while cumulative < quantile * count:
+            position += 1
+            cumulative += histogram[value_list[position]]
+        summary['p' + str(int(quantile * 100))] = value_list[position]
+    return summary
+
+
+def read_stream(data_file, att_list):
+    '''
+    Read timestamp and identifier of each tuple of a data file
+    '''
+    ts_pos = att_list.index(TS)
+    id_pos_list = [att_list.index(att) for att in ID_ATT_LIST]
+    in_file = open(data_file)
+    for line in in_file:
+        field_list = line.rstrip('\r\n').split(DELIMITER)
+        try:
+            timestamp = int(field_list[ts_pos])
+        except (ValueError, IndexError):
+            # Header
+            continue
+        yield timestamp, DELIMITER.join([field_list[pos]
+                                         for pos in id_pos_list])
+    in_file.close()
+
+
+def profile(data_file, att_list, max_range=MAX_RANGE):
+    '''
+    Profile a data file sorted by timestamp in a single pass
+
+    Return statistics (None if the file is not sorted)
+    '''
+    ts_histogram = {}
+    # Histograms of each range
+    range_list = range(1, max_range + 1)
+    id_dict = {ran: {} for ran in range_list}
+    tuple_dict = {ran: {} for ran in range_list}
+    length_dict = {ran: {} for ran in range_list}
+    # Tuple count and registers of last instants (most recent first)
+    ring = []
+    all_ids = new_hll()
+    all_symbols = new_hll()
+    sketch = new_cm()
+    top_dict = {}
+    tuple_count = 0
+    first_ts = None
+    current = None
+
+    def close_instant(count, registers):
+        '''
+        Account an instant and the windows ending on it
+        '''
+        add_value(ts_histogram, count)
+        ring.insert(0, (count, registers))
+        del ring[max_range:]
+        window_count = 0
+        window_ids = new_hll()
+        for ran in range_list:
+            if ran <= len(ring):
+                window_count += ring[ran - 1][0]
+                window_ids = merge_hll(window_ids, ring[ran - 1][1])
+            ids = int(round(count_hll(window_ids)))
+            add_value(id_dict[ran], ids)
+            add_value(tuple_dict[ran], window_count)
+            add_value(length_dict[ran],
+                      round(float(window_count) / ids, 2) if ids else 0.0)
+
+    count = 0
+    registers = new_hll()
+    for timestamp, identifier in read_stream(data_file, att_list):
+        if current is None:
+            first_ts = current = timestamp
+        elif timestamp < current:
+            print 'Data file is not sorted by timestamp: ' + data_file
+            return None
+        # Instants without tuples also close windows
+        while current < timestamp:
+            close_instant(count, registers)
+            count = 0
+            registers = new_hll()
+            current += 1
+        hash_pair = get_hashes(identifier)
+        add_hll(registers, hash_pair[0])
+        add_hll(all_ids, hash_pair[0])
+        add_hll(all_symbols,
+                get_hashes(identifier.split(DELIMITER)[0])[0])
+        add_heavy_hitter(top_dict, identifier, add_cm(sketch, hash_pair))
+        count += 1
+        tuple_count += 1
+    if current is None:
+        print 'Empty data file: ' + data_file
+        return None
+    close_instant(count, registers)
+    stats = {'tuples': tuple_count, 'min_ts': first_ts, 'max_ts': current,
+             'identifiers': int(round(count_hll(all_ids))),
+             'symbols': int(round(count_hll(all_symbols))),
+             'tuples_per_ts': summarize_histogram(ts_histogram),
+             'max_range': max_range,
+             'windows': {},
+             'heavy_hitters': [identifier.split(DELIMITER) + [estimate]
+                               for identifier, estimate in
+                               sorted(top_dict.items(),
+                                      key=lambda item: -item[1])],
+             'sketch': {'hll_registers': len(all_ids),
+                        'cm_width': CM_WIDTH, 'cm_depth': CM_DEPTH}}
+    for ran in range_list:
+        stats['windows'][str(ran)] = {
+            'identifiers': summarize_histogram(id_dict[ran]),
+            'tuples': summarize_histogram(tuple_dict[ran]),
+            'sequence_length': summarize_histogram(length_dict[ran])}
+    return stats
+
+
+def write_stats(data_file, stats):
+    '''
+    Write statistics of a data file into its sidecar file
+    '''
+    file_stat = os.stat(data_file)
+    stats = dict(stats, file=data_file, size=file_stat.st_size,
+                 mtime=file_stat.st_mtime)
+    out_file = open(get_stats_file(data_file), 'w')
+    json.dump(stats, out_file, indent=1, sort_keys=True)
+    out_file.close()
+
+
+def read_stats(data_file, max_range=None):
+    '''
+    Read statistics of a data file (None if they are missing, outdated or do
+    not cover max_range)
+    '''
+    stats_file = get_stats_file(data_file)
+    if not os.path.isfile(stats_file) or not os.path.isfile(data_file):
+        return None
+    in_file = open(stats_file)
+    try:
+        stats = json.load(in_file)
+    except ValueError:
+        return None
+    finally:
+        in_file.close()
+    file_stat = os.stat(data_file)
+    if stats.get('size') != file_stat.st_size or \
+            stats.get('mtime') != file_stat.st_mtime:
+        return None
+    if max_range is not None and stats.get('max_range', 0) < max_range:
+        return None
+    return stats
+
+
+def get_stats(data_file, register_str, max_range=MAX_RANGE):
+    '''
+    Return statistics of a data file (profiled when the sidecar file is not
+    updated)
+    '''
+    stats = read_stats(data_file, max_range)
+    if stats is None:
+        print 'Profiling ' + data_file
+        stats = profile(data_file, get_stream_attributes(register_str),
+                        max_range)
+        if stats is not None:
+            write_stats(data_file, stats)
+    return stats
+
+
+def get_window_stats(stats, ran):
+    '''
+    Return statistics of windows of a range (largest profiled range when it
+    is exceeded)
+    '''
+    return stats['windows'][str(min(ran, stats['max_range']))]
+
+
+def print_stats(stats):
+    '''
+    Print statistics of a data file
+    '''
+    ts_summary = stats['tuples_per_ts']
+    print 'Tuples: ' + str(stats['tuples']) + ', timestamps: ' + \
+        str(stats['min_ts']) + '..' + str(stats['max_ts']) + \
+        ', identifiers: ~' + str(stats['identifiers']) + \
+        ', symbols: ~' + str(stats['symbols'])
+    print 'Tuples per timestamp: mean ' + \
+        str(round(ts_summary['mean'], 2)) + ', max ' + \
+        str(ts_summary['max']) + ', p99 ' + str(ts_summary['p99'])
+    print 'range|identifiers|identifiers_p99|tuples|sequence_length'
+    for ran in range(1, stats['max_range'] + 1):
+        window = stats['windows'][str(ran)]
+        print '|'.join([str(ran),
+                        str(round(window['identifiers']['mean'], 1)),
+                        str(window['identifiers']['p99']),
+                        str(round(window['tuples']['mean'], 1)),
+                        str(round(window['sequence_length']['mean'], 2))])
+    print 'Heavy hitters: ' + \
+        ', '.join([symbol + '/' + method + ' ' + str(estimate)
+                   for symbol, method, estimate in stats['heavy_hitters']])
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('StreamStats')
+    parser.add_argument('-t', '--tools', action="store", nargs='+',
+                        choices=TOOL_LIST, default=TOOL_LIST,
+                        help='Tools to profile (default: all)')
+    parser.add_argument('-m', '--max-range', action="store", type=int,
+                        default=MAX_RANGE,
+                        help='Largest window range (default: ' +
+                        str(MAX_RANGE) + ')')
+    parser.add_argument('-f', '--force', action="store_true", default=False,
+                        help='Profile data files even if statistics are ' +
+                        'updated')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    # Statistics of each profiled file (hardlinked data files are the same)
+    inode_dict = {}
+    for data_file, register_str in get_targets(args.tools):
+        if not os.path.isfile(data_file):
+            print 'Data file not found: ' + data_file + '\n' + \
+                'Make sure that data files were prepared'
+            continue
+        file_stat = os.stat(data_file)
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        stats = None
+        if not args.force:
+            stats = read_stats(data_file, args.max_range)
+        if stats is None and inode in inode_dict:
+            stats = inode_dict[inode]
+            write_stats(data_file, stats)
+        elif stats is None:
+            print 'Profiling ' + data_file
+            stats = profile(data_file, get_stream_attributes(register_str),
+                            args.max_range)
+            if stats is None:
+                continue
+            write_stats(data_file, stats)
+        inode_dict[inode] = stats
+        print 'Statistics of ' + data_file
+        print_stats(stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/python -u
+# -*- coding: utf-8 -*-
+'''
+Module to store experiment results in a SQLite database
+
+Each detail file is ingested once and keyed by tool, experiment (parameters),
+algorithm, run, host, revision and data size, so summaries and confidence
+intervals are SQL aggregates and sweeps from different dates or machines can
+be compared
+'''
+
+import csv
+import json
+import os
+import sqlite3
+import time
+
+from experiment import HOST, REVISION, STATUS, STATUS_MISSING, STATUS_OK,\
+    get_host, get_resource_file, get_revision, is_outdated,\
+    read_resource_file, write_interval_file
+
+
+# Database file
+WAREHOUSE_FILE = 'results.db'
+
+# Result fields
+RUNTIME = 'runtime'
+MEMORY = 'memory'
+FIELD_LIST = [RUNTIME, MEMORY]
+# Values of runs not found in database (runtime, memory, status)
+MISSING_RUN = (float('NaN'), float('NaN'), STATUS_MISSING)
+
+# Database schema
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS run (
+    tool TEXT NOT NULL,
+    experiment TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    run INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    runtime REAL,
+    memory REAL,
+    status TEXT NOT NULL,
+    detail_file TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    current INTEGER NOT NULL DEFAULT 1,
+    ingested REAL NOT NULL,
+    data_size INTEGER NOT NULL,
+    PRIMARY KEY (tool, experiment, algorithm, run, host, revision, data_size)
+);
+CREATE INDEX IF NOT EXISTS run_current
+    ON run (tool, current, data_size, experiment, algorithm);
+CREATE INDEX IF NOT EXISTS run_sweep
+    ON run (tool, host, revision, experiment, algorithm);
+CREATE INDEX IF NOT EXISTS run_file
+    ON run (detail_file, mtime, size);
+'''
+
+# Query for runs of current detail files
+RUNS_QUERY = '''
+SELECT experiment, algorithm, run, runtime, memory, status
+FROM run WHERE tool = ? AND current = 1 AND data_size = ?;
+'''
+
+# Aggregate (count, mean, sum of squared differences) per experiment and
+# algorithm
+STATISTICS_QUERY = '''
+SELECT r.experiment, r.algorithm, COUNT(r.{field}), g.mean,
+    SUM((r.{field} - g.mean) * (r.{field} - g.mean))
+FROM run AS r JOIN (
+    SELECT experiment, algorithm, AVG({field}) AS mean
+    FROM run WHERE tool = ? AND {condition} AND {field} IS NOT NULL
+    GROUP BY experiment, algorithm) AS g
+ON r.experiment = g.experiment AND r.algorithm = g.algorithm
+WHERE r.tool = ? AND {condition} AND r.{field} IS NOT NULL
+GROUP BY r.experiment, r.algorithm;
+'''
+
+# Sweeps stored for a tool
+SWEEPS_QUERY = '''
+SELECT host, revision, COUNT(*), MIN(ingested), MAX(ingested)
+FROM run WHERE tool = ?
+GROUP BY host, revision ORDER BY MIN(ingested);
+'''
+
+
+def connect(filename=WAREHOUSE_FILE):
+    '''
+    Open the results database (creating the schema if needed)
+    '''
+    connection = sqlite3.connect(filename)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def read_detail_file(detail_file):
+    '''
+    Return total runtime and average memory of a detail file
+    '''
+    in_file = open(detail_file, 'r')
+    reader = csv.DictReader(in_file, skipinitialspace=True)
+    sum_time = 0.0
+    sum_memory = 0.0
+    count = 0
+    for rec in reader:
+        sum_time += float(rec[RUNTIME])
+        sum_memory += float(rec[MEMORY])
+        count += 1
+    in_file.close()
+    if not count:
+        return (None, None)
+    return (sum_time, sum_memory / count)
+
+
+def ingest(connection, tool, experiment_id, experiment_conf, algorithm, count,
+           detail_file, data_size, artifact=None):
+    '''
+    Ingest a detail file (and its resource file) of a run over data of
+    data_size bytes if it was not ingested yet
+
+    Runs without detail file are stored only when their resource file
+    records a failure, otherwise previous rows of the file stop being current
+    (as well as rows of runs that used artifacts other than artifact)
+    '''
+    if is_outdated(detail_file, artifact):
+        connection.execute('UPDATE run SET current = 0 '
+                           'WHERE detail_file = ?', (detail_file,))
+        return False
+    source_file = detail_file
+    if not os.path.isfile(source_file):
+        source_file = get_resource_file(detail_file)
+        if not os.path.isfile(source_file):
+            connection.execute('UPDATE run SET current = 0 '
+                               'WHERE detail_file = ?', (detail_file,))
+            return False
+    stat = os.stat(source_file)
+    cursor = connection.execute(
+        'SELECT 1 FROM run WHERE detail_file = ? AND mtime = ? AND size = ? '
+        'AND current = 1', (detail_file, stat.st_mtime, stat.st_size))
+    if cursor.fetchone() is not None:
+        return False
+    resource_rec = read_resource_file(get_resource_file(detail_file)) or {}
+    runtime, memory = (None, None)
+    status = resource_rec.get(STATUS) or STATUS_MISSING
+    if source_file == detail_file:
+        runtime, memory = read_detail_file(detail_file)
+        status = STATUS_OK
+    connection.execute('UPDATE run SET current = 0 WHERE detail_file = ?',
+                       (detail_file,))
+    connection.execute(
+        'INSERT OR REPLACE INTO run VALUES '
+        '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)',
+        (tool, experiment_id, json.dumps(experiment_conf, sort_keys=True),
+         algorithm, count, resource_rec.get(HOST) or get_host(),
+         resource_rec.get(REVISION) or get_revision(), runtime, memory,
+         status, detail_file, stat.st_mtime, stat.st_size, time.time(),
+         data_size))
+    return True
+
+
+def get_runs(connection, tool, data_size):
+    '''
+    Return (runtime, memory, status) of current runs of a tool over data of
+    data_size bytes indexed by (experiment, algorithm, run)
+    '''
+    run_dict = {}
+    for exp_id, alg, count, runtime, memory, status in \
+            connection.execute(RUNS_QUERY, (tool, data_size)):
+        if runtime is None:
+            runtime = float('NaN')
+        if memory is None:
+            memory = float('NaN')
+        run_dict[(exp_id, alg, count)] = (runtime, memory, status)
+    return run_dict
+
+
+def get_statistics(connection, tool, field, sweep=None, data_size=None):
+    '''
+    Return (count, mean, sum of squared differences) of a field indexed by
+    (experiment, algorithm) for current runs or for a sweep (host, revision),
+    restricted to runs over data of data_size bytes if given
+    '''
+    if field not in FIELD_LIST:
+        raise ValueError('Invalid field: ' + field)
+    parameters = (tool,)
+    condition = 'current = 1'
+    if sweep is not None:
+        condition = 'host = ? AND revision = ?'
+        parameters += tuple(sweep)
+    if data_size is not None:
+        condition += ' AND data_size = ?'
+        parameters += (data_size,)
+    stat_dict = {}
+    query = STATISTICS_QUERY.format(field=field, condition=condition)
+    # Squared differences from the mean of each group (two passes)
+    for exp_id, alg, count, mean, sum_sq in \
+            connection.execute(query, parameters + parameters):
+        stat_dict[(exp_id, alg)] = (count, mean, sum_sq)
+    return stat_dict
+
+
+def write_intervals(connection, tool, field, parameter, value_list, id_list,
+                    alg_list, out_file, sweep=None, data_size=None):
+    '''
+    Write confidence intervals of a field for a parameter variation
+
+    id_list holds the experiment identifier of each value of value_list
+    '''
+    stat_dict = get_statistics(connection, tool, field, sweep, data_size)
+    acc_dict = {}
+    for value, exp_id in zip(value_list, id_list):
+        acc_dict[value] = {alg: stat_dict.get((exp_id, alg), (0, 0.0, 0.0))
+                           for alg in alg_list}
+    write_interval_file(out_file, parameter, value_list, alg_list, acc_dict)
+
+
+def get_sweeps(connection, tool):
+    '''
+    Return list of sweeps (host, revision, runs, first and last ingestion)
+    '''
+    return list(connection.execute(SWEEPS_QUERY, (tool,)))
+
+
+def compare_sweeps(connection, tool, field, sweep_a, sweep_b):
+    '''
+    Return mean of a field for two sweeps indexed by (experiment, algorithm)
+    '''
+    stat_a = get_statistics(connection, tool, field, sweep_a)
+    stat_b = get_statistics(connection, tool, field, sweep_b)
+    comparison = {}
+    for key in set(stat_a.keys()) | set(stat_b.keys()):
+        mean_a = stat_a[key][1] if key in stat_a else float('NaN')
+        mean_b = stat_b[key][1] if key in stat_b else float('NaN')
+        comparison[key] = (mean_a, mean_b)
+    return comparison
+
+
+def get_sweep(sweep_str):
+    '''
+    Parse a sweep in format host:revision
+    '''
+    if ':' not in sweep_str:
+        return None
+    return tuple(sweep_str.rsplit(':', 1))
+
+
+def get_arguments(print_help=False):
+    '''
+    Get arguments
+    '''
+    import argparse
+    parser = argparse.ArgumentParser('Warehouse')
+    parser.add_argument('tool', action="store",
+                        help='Tool main directory (e.g. streampref_seq)')
+    parser.add_argument('-d', '--database', action="store",
+                        default=WAREHOUSE_FILE,
+                        help='Results database (default: ' +
+                        WAREHOUSE_FILE + ')')
+    parser.add_argument('-c', '--compare', action="store", nargs=2,
+                        metavar='HOST:REVISION',
+                        help='Compare two sweeps')
+    parser.add_argument('-f', '--field', action="store", default=RUNTIME,
+                        choices=FIELD_LIST,
+                        help='Field to compare (default: ' + RUNTIME + ')')
+    args = parser.parse_args()
+    if print_help:
+        parser.print_help()
+    return args
+
+
+def main():
+    '''
+    Main routine
+    '''
+    args = get_arguments()
+    connection = connect(args.database)
+    if args.compare:
+        sweep_a = get_sweep(args.compare[0])
+        sweep_b = get_sweep(args.compare[1])
+        if sweep_a is None or sweep_b is None:
+            get_arguments(True)
+            return
+        comparison = compare_sweeps(connection, args.tool, args.field,
+                                    sweep_a, sweep_b)
+        print 'experiment|algorithm|' + args.compare[0] + '|' + \
+            args.compare[1] + '|ratio'
+        for key in sorted(comparison):
+            mean_a, mean_b = comparison[key]
+            ratio = mean_b / mean_a if mean_a else float('NaN')
+            print '|'.join([key[0], key[1], str(mean_a), str(mean_b),
+                            str(ratio)])
+    else:
+        print 'host|revision|runs|first|last'
+        for host, revision, count, first, last in \
+                get_sweeps(connection, args.tool):
+            print '|'.join([host, revision, str(count),
+                            time.ctime(first), time.ctime(last)])
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,13 @@ Module to import historical stock quotes from Yahoo Finance
 
 import csv
 import datetime
+import hashlib
+import math
+import multiprocessing
 import os
+import tarfile
+import time
+import zipfile
 
 # URL for historical information
 HISTORICAL_URL = 'http://real-chart.finance.yahoo.com/table.csv?' + \
@@ -17,8 +23,10 @@ HISTORICAL_URL = 'http://real-chart.finance.yahoo.com/table.csv?' + \
 IMPORTED_DIR = 'yahoo_data'
 # Historical directory
 HISTORICAL_DIR = IMPORTED_DIR + os.sep + 'historical'
+# Directory of invalid downloads (kept for later re-fetch)
+QUARANTINE_DIR = IMPORTED_DIR + os.sep + 'quarantine'
 # Directories list
-DIR_LIST = [IMPORTED_DIR, HISTORICAL_DIR]
+DIR_LIST = [IMPORTED_DIR, HISTORICAL_DIR, QUARANTINE_DIR]
 
 # Stock file
 STOCK_FILE = IMPORTED_DIR + os.sep + 'stocks.csv'
@@ -28,10 +36,34 @@ TRADE_FILE = IMPORTED_DIR + os.sep + 'trade.csv'
 VOLATILITY_FILE = IMPORTED_DIR + os.sep + 'volatility.csv'
 # Transactions file
 TRANSACTION_FILE = IMPORTED_DIR + os.sep + 'transaction.csv'
+# Trading calendar file
+CALENDAR_FILE = IMPORTED_DIR + os.sep + 'calendar.csv'
+# Negative cache file (symbols whose download failed)
+NEGATIVE_FILE = IMPORTED_DIR + os.sep + 'negative.csv'
+# HTTP validators of historical downloads (ETag and Last-Modified)
+VALIDATOR_FILE = IMPORTED_DIR + os.sep + 'validators.csv'
+# Packed historical store (append-only data file and symbol index)
+PACK_FILE = IMPORTED_DIR + os.sep + 'historical.pack'
+PACK_INDEX_FILE = IMPORTED_DIR + os.sep + 'historical.idx'
+# Prefix of transactions files of symbol tiers
+TIER_PREFIX = IMPORTED_DIR + os.sep + 'transaction-t'
+# Tier with all symbols (percentage)
+FULL_TIER = 100.0
 
 # Number of retries to get an URL
 URL_RETRY = 10
 
+# Error classes of downloads
+ERROR_NOT_FOUND = 'not_found'
+ERROR_TRANSIENT = 'transient'
+ERROR_INVALID = 'invalid'
+# HTTP status codes of symbols not found (not retried)
+NOT_FOUND_CODES = [404, 410]
+# Seconds a failed symbol is skipped for each error class
+NEGATIVE_TTL = {ERROR_NOT_FOUND: 30 * 24 * 3600,
+                ERROR_TRANSIENT: 3600,
+                ERROR_INVALID: 24 * 3600}
+
 # Attribute names
 SECTOR = 'sector'
 INDUSTRY = 'industry'
@@ -51,6 +83,15 @@ ADJ_CLOSE = 'adj close'
 METHOD = 'method'
 RATE = 'rate'
 PRICE = 'price'
+ERROR = 'error'
+TIME = 'time'
+ETAG = 'etag'
+LAST_MODIFIED = 'last_modified'
+CHECKED = 'checked'
+OFFSET = 'offset'
+LENGTH = 'length'
+FIRST_DATE = 'first_date'
+LAST_DATE = 'last_date'
 
 # Original file header of historical files
 HISTORICAL_HEADER = [DATE, OPEN, HIGH, LOW, CLOSE, VOLUME, ADJ_CLOSE]
@@ -63,14 +104,37 @@ TRADE_HEADER = [TS, SYMBOL, OPEN, CLOSE, VOLUME]
 VOLATILITY_HEADER = [TS, SYMBOL, METHOD, RATE]
 # File header for transactions stream
 TRANSACTION_HEADER = [TS, SYMBOL, SECTOR, COUNTRY, PRICE, VOLUME, METHOD, RATE]
+# File header for trading calendar
+CALENDAR_HEADER = [DATE, TS]
+# File header for negative cache
+NEGATIVE_HEADER = [SYMBOL, ERROR, TIME]
+# File header for HTTP validators
+VALIDATOR_HEADER = [SYMBOL, ETAG, LAST_MODIFIED, CHECKED]
+# File header for index of packed store
+PACK_INDEX_HEADER = [SYMBOL, OFFSET, LENGTH, FIRST_DATE, LAST_DATE]
 
 # Volatility ranges
 VOLATILITY_COUNTS = [21, 60]
 
+# Volatility estimators
+CLOSE_OPEN = 'close_open'
+PARKINSON = 'parkinson'
+GARMAN_KLASS = 'garman_klass'
+ESTIMATOR_LIST = [CLOSE_OPEN, PARKINSON, GARMAN_KLASS]
+# Default volatility estimators
+VOLATILITY_ESTIMATORS = [CLOSE_OPEN]
+# Method code of volatility records is the offset of estimator plus window
+METHOD_OFFSET = {CLOSE_OPEN: 0, PARKINSON: 1000, GARMAN_KLASS: 2000}
+# Trading days per year
+TRADING_DAYS = 252
+
 
-def read_url(url):
+def read_url(url, header_dict=None):
     '''
-    Try to get an URL content
+    Try to get an URL content (request headers may make it conditional)
+
+    Return response (None if the URL could not be read) and error class
+    (None if the URL was read or was not modified)
     '''
     import requests
     from time import sleep
@@ -79,7 +143,7 @@ def read_url(url):
     while try_count < URL_RETRY:
         content = None
         try:
-            content = requests.get(url)
+            content = requests.get(url, headers=header_dict)
         except Exception as exc:  # IGNORE:broad-except
             print '\n\n Error for ' + url
             print exc
@@ -87,16 +151,19 @@ def read_url(url):
             sleep(1)
         # Try to read the URL content
         if content is not None:
-            if content.status_code == 200:
-                return content.text
+            if content.status_code in [200, 304]:
+                return (content, None)
+            elif content.status_code in NOT_FOUND_CODES:
+                # Retries do not help for missing symbols
+                print '\n\nNot found: ' + url
+                return (None, ERROR_NOT_FOUND)
             else:
                 print '\n\nError for ' + url
                 print 'Error code: ' + str(content.status_code)
                 print 'Retry\n\n'
                 sleep(1)
         try_count += 1
-    # Return empty string when the URL could not be read
-    return ''
+    return (None, ERROR_TRANSIENT)
 
 
 def write_csv_file(rec_list, filename, att_list, mode='w'):
@@ -104,7 +171,9 @@ def write_csv_file(rec_list, filename, att_list, mode='w'):
     Write stock records on file
     '''
     out_file = open(filename, mode)
-    out_write = csv.DictWriter(out_file, att_list, dialect='table')
+    # Attributes out of the header (e.g. date of records) are not written
+    out_write = csv.DictWriter(out_file, att_list, dialect='table',
+                               extrasaction='ignore')
     if mode == 'w':
         out_write.writeheader()
     out_write.writerows(rec_list)
@@ -115,9 +184,18 @@ def read_csv_file(filename, att_list):
     '''
     Read stocks from file
     '''
-    stock_list = []
     in_file = open(filename)
-    in_reader = csv.DictReader(in_file, att_list, dialect='table')
+    stock_list = read_csv_lines(in_file, att_list)
+    in_file.close()
+    return stock_list
+
+
+def read_csv_lines(line_iter, att_list):
+    '''
+    Read stocks from lines (first line is the header)
+    '''
+    stock_list = []
+    in_reader = csv.DictReader(line_iter, att_list, dialect='table')
     # Skip header
     try:
         in_reader.next()
@@ -125,36 +203,431 @@ def read_csv_file(filename, att_list):
         return stock_list
     for rec in in_reader:
         stock_list.append(rec)
-    in_file.close()
     return stock_list
 
 
-def get_all_historical(stocks_list):
+def read_negative_cache():
+    '''
+    Read error class and time of failed symbols
+    '''
+    negative_dict = {}
+    if not os.path.isfile(NEGATIVE_FILE):
+        return negative_dict
+    for rec in read_csv_file(NEGATIVE_FILE, NEGATIVE_HEADER):
+        negative_dict[rec[SYMBOL]] = (rec[ERROR], float(rec[TIME]))
+    return negative_dict
+
+
+def write_negative_cache(negative_dict):
+    '''
+    Write error class and time of failed symbols
+    '''
+    rec_list = [{SYMBOL: symbol, ERROR: error, TIME: error_time}
+                for symbol, (error, error_time) in
+                sorted(negative_dict.items())]
+    write_csv_file(rec_list, NEGATIVE_FILE, NEGATIVE_HEADER)
+
+
+def is_negative(negative_dict, symbol):
+    '''
+    Check if a symbol failed recently (within TTL of its error class)
+    '''
+    if symbol not in negative_dict:
+        return False
+    error, error_time = negative_dict[symbol]
+    return time.time() - error_time < NEGATIVE_TTL.get(error, 0)
+
+
+def quarantine(symbol, content):
+    '''
+    Keep an invalid download in quarantine directory
+    '''
+    filename = QUARANTINE_DIR + os.sep + symbol + '.csv'
+    out_file = open(filename, 'w')
+    out_file.write(content.encode('utf-8') if isinstance(content, unicode)
+                   else content)
+    out_file.close()
+    print 'Invalid download in quarantine: ' + filename
+
+
+def is_valid_historical(content):
+    '''
+    Check if a download is a historical file (not empty nor an error page)
+    '''
+    header = content.lstrip().split('\n', 1)[0]
+    return header.replace(',', '|').lower().startswith(DATE + '|')
+
+
+def read_validators():
+    '''
+    Read HTTP validators of historical downloads (ETag, Last-Modified and
+    time of last check)
+    '''
+    validator_dict = {}
+    if not os.path.isfile(VALIDATOR_FILE):
+        return validator_dict
+    for rec in read_csv_file(VALIDATOR_FILE, VALIDATOR_HEADER):
+        validator_dict[rec[SYMBOL]] = (rec[ETAG], rec[LAST_MODIFIED],
+                                       float(rec[CHECKED]))
+    return validator_dict
+
+
+def write_validators(validator_dict):
+    '''
+    Write HTTP validators of historical downloads
+    '''
+    rec_list = [{SYMBOL: symbol, ETAG: etag, LAST_MODIFIED: last_modified,
+                 CHECKED: checked}
+                for symbol, (etag, last_modified, checked) in
+                sorted(validator_dict.items())]
+    write_csv_file(rec_list, VALIDATOR_FILE, VALIDATOR_HEADER)
+
+
+def is_stale(filename, validator, max_age):
+    '''
+    Check if a cached download was checked more than max_age seconds ago
+    (cached downloads never expire without max_age)
+    '''
+    if max_age is None:
+        return False
+    checked = os.path.getmtime(filename)
+    if validator is not None:
+        checked = validator[2]
+    return time.time() - checked >= max_age
+
+
+def read_pack_index():
+    '''
+    Read index of packed store (offset, length, first and last date of the
+    historical data of each symbol)
+    '''
+    index_dict = {}
+    if not os.path.isfile(PACK_INDEX_FILE):
+        return index_dict
+    for rec in read_csv_file(PACK_INDEX_FILE, PACK_INDEX_HEADER):
+        index_dict[rec[SYMBOL]] = (int(rec[OFFSET]), int(rec[LENGTH]),
+                                   rec[FIRST_DATE], rec[LAST_DATE])
+    return index_dict
+
+
+def write_pack_index(index_dict):
+    '''
+    Write index of packed store
+    '''
+    rec_list = [{SYMBOL: symbol, OFFSET: offset, LENGTH: length,
+                 FIRST_DATE: first_date, LAST_DATE: last_date}
+                for symbol, (offset, length, first_date, last_date) in
+                sorted(index_dict.items(), key=lambda item: item[1][0])]
+    write_csv_file(rec_list, PACK_INDEX_FILE, PACK_INDEX_HEADER)
+
+
+def append_pack(index_dict, symbol, hist_content):
+    '''
+    Append historical data of a symbol (cache format) to packed store
+
+    Previous data of the symbol is left in the data file (it is only
+    dropped from the index)
+    '''
+    date_list = [line.split('|', 1)[0]
+                 for line in hist_content.splitlines()[1:] if line]
+    out_file = open(PACK_FILE, 'ab')
+    out_file.seek(0, os.SEEK_END)
+    offset = out_file.tell()
+    out_file.write(hist_content)
+    out_file.close()
+    index_dict[symbol] = (offset, len(hist_content),
+                          min(date_list) if date_list else '',
+                          max(date_list) if date_list else '')
+
+
+def read_pack(pack, symbol, start_date, end_date):
+    '''
+    Read historical data of a symbol from packed store (pack holds the data
+    file opened once and the index)
+
+    Return None if the symbol has no data in the period
+    '''
+    pack_file, index_dict = pack
+    if symbol not in index_dict:
+        return None
+    offset, length, first_date, last_date = index_dict[symbol]
+    if not first_date or last_date < start_date.isoformat() or \
+            first_date > end_date.isoformat():
+        return None
+    pack_file.seek(offset)
+    return pack_file.read(length)
+
+
+def get_all_historical(stocks_list, refetch=False, max_age=None,
+                       url=HISTORICAL_URL, packed=False):
     '''
     Get historical data for a stock list
+
+    Symbols that failed recently are skipped (unless refetch is set) and
+    cached downloads older than max_age seconds are revalidated
+
+    In packed mode, downloads are appended to the packed store (downloads
+    cached in the historical directory are packed instead of downloaded,
+    also replacing packed data when they are newer than the packed store)
     '''
-    for rec in stocks_list:
-        symbol = rec[SYMBOL]
-        print 'Getting historical data for ' + symbol
-        filename = HISTORICAL_DIR + os.sep + symbol + '.csv'
-        if not os.path.isfile(filename):
-            get_historical_data(symbol, filename)
-        else:
-            print 'Using cached download for ' + symbol
+    negative_dict = read_negative_cache()
+    validator_dict = read_validators()
+    index_dict = None
+    if packed:
+        index_dict = read_pack_index()
+        packed_index_dict = dict(index_dict)
+        # Index is written after data of symbols is packed
+        pack_time = 0.0
+        if os.path.isfile(PACK_INDEX_FILE):
+            pack_time = os.path.getmtime(PACK_INDEX_FILE)
+    try:
+        for rec in stocks_list:
+            symbol = rec[SYMBOL]
+            if not refetch and is_negative(negative_dict, symbol):
+                print 'Skipping failed symbol ' + symbol + ' (' + \
+                    negative_dict[symbol][0] + ')'
+                continue
+            print 'Getting historical data for ' + symbol
+            filename = HISTORICAL_DIR + os.sep + symbol + '.csv'
+            if os.path.isfile(filename) and not os.path.getsize(filename):
+                # Empty files cached by previous versions
+                os.rename(filename,
+                          QUARANTINE_DIR + os.sep + symbol + '.csv')
+            cache_file = filename
+            is_cached = os.path.isfile(filename)
+            if index_dict is not None:
+                cache_file = PACK_FILE
+                # Files ingested or downloaded after packing are repacked
+                if is_cached and (symbol not in index_dict or
+                                  os.path.getmtime(filename) > pack_time):
+                    print 'Packing historical file of ' + symbol
+                    in_file = open(filename)
+                    append_pack(index_dict, symbol, in_file.read())
+                    in_file.close()
+                is_cached = symbol in index_dict
+            validator = validator_dict.get(symbol)
+            if is_cached and not is_stale(cache_file, validator, max_age):
+                print 'Using cached download for ' + symbol
+                continue
+            if not is_cached:
+                validator = None
+            error, validator = get_historical_data(symbol, filename, url,
+                                                   validator, index_dict)
+            if error is not None:
+                negative_dict[symbol] = (error, time.time())
+                write_negative_cache(negative_dict)
+                continue
+            validator_dict[symbol] = validator
+            if symbol in negative_dict:
+                del negative_dict[symbol]
+                write_negative_cache(negative_dict)
+    finally:
+        # Validators and index are written once (also when interrupted)
+        write_validators(validator_dict)
+        # Unchanged index is not rewritten (trading calendar stays updated)
+        if index_dict is not None and index_dict != packed_index_dict:
+            write_pack_index(index_dict)
 
 
-def get_historical_data(symbol, filename):
+def get_historical_data(symbol, filename, url=HISTORICAL_URL,
+                        validator=None, index_dict=None):
     '''
     Get historical data from a stock list
+
+    The request is conditional when validators of the cached download are
+    given, return error class (None if data was cached or not modified) and
+    new validators (data is appended to packed store when its index is
+    given)
     '''
     print 'Getting historical for ' + symbol
-    hist_url = HISTORICAL_URL.format(ss=symbol)
-    hist_content = read_url(hist_url)
+    hist_url = url.format(ss=symbol)
+    header_dict = {}
+    if validator is not None:
+        if validator[0]:
+            header_dict['If-None-Match'] = validator[0]
+        if validator[1]:
+            header_dict['If-Modified-Since'] = validator[1]
+    response, error = read_url(hist_url, header_dict)
+    if error is None and response.status_code == 304:
+        print 'Cached download not modified for ' + symbol
+        return (None, (validator[0], validator[1], time.time()))
+    hist_content = ''
+    if response is not None:
+        hist_content = response.text
+    if error is None and not is_valid_historical(hist_content):
+        quarantine(symbol, hist_content)
+        error = ERROR_INVALID
+    if error is not None:
+        print 'Historical data not available for ' + symbol + \
+            ' (' + error + ')'
+        return (error, validator)
+    write_historical(symbol, filename, hist_content, index_dict)
+    return (None, (response.headers.get('ETag', ''),
+                   response.headers.get('Last-Modified', ''), time.time()))
+
+
+def write_historical(symbol, filename, hist_content, index_dict=None):
+    '''
+    Write historical data of a symbol with the delimiter and case of the
+    cache (appended to packed store when its index is given)
+    '''
     hist_content = hist_content.replace(',', '|').lower()
-    out_file = open(filename, 'w')
-    out_file.write(hist_content)
-    print 'Historical size: ' + str(out_file.tell())
-    out_file.close()
+    print 'Historical size: ' + str(len(hist_content))
+    if index_dict is not None:
+        append_pack(index_dict, symbol, hist_content)
+    else:
+        out_file = open(filename, 'w')
+        out_file.write(hist_content)
+        out_file.close()
+    quarantine_file = QUARANTINE_DIR + os.sep + symbol + '.csv'
+    if os.path.isfile(quarantine_file):
+        os.remove(quarantine_file)
+
+
+def ingest_content(item):
+    '''
+    Write historical data of a symbol read from an archive
+
+    Return symbol and error class (None if data was cached)
+    '''
+    symbol, content = item
+    if not is_valid_historical(content):
+        quarantine(symbol, content)
+        return (symbol, ERROR_INVALID)
+    write_historical(symbol, HISTORICAL_DIR + os.sep + symbol + '.csv',
+                     content)
+    return (symbol, None)
+
+
+def ingest_zip_members(task):
+    '''
+    Decompress and write members of a zip archive (each process opens the
+    archive to decompress its own members)
+
+    Return list of symbols and error classes
+    '''
+    archive, member_list = task
+    zip_file = zipfile.ZipFile(archive)
+    result_list = [ingest_content((get_member_symbol(member),
+                                   zip_file.read(member)))
+                   for member in member_list]
+    zip_file.close()
+    return result_list
+
+
+def get_member_symbol(name):
+    '''
+    Return symbol of an archive member (None if it is not a CSV file)
+    '''
+    base, ext = os.path.splitext(os.path.basename(name))
+    if ext.lower() != '.csv' or not base:
+        return None
+    return base
+
+
+def read_tar_archive(archive):
+    '''
+    Read historical data of symbols from a tar archive in streaming mode
+    (compressed or not)
+    '''
+    tar_file = tarfile.open(archive, 'r|*')
+    for member in tar_file:
+        symbol = get_member_symbol(member.name)
+        if member.isfile() and symbol is not None:
+            yield (symbol, tar_file.extractfile(member).read())
+    tar_file.close()
+
+
+def read_concatenated(archive):
+    '''
+    Read historical data of symbols from a CSV file with a symbol column
+    (delimited by comma or by the '|' of the cache, lines of each symbol
+    must be contiguous)
+
+    Files without symbol column and lines of a symbol found again after
+    other symbols are reported and skipped
+    '''
+    in_file = open(archive)
+    header_line = in_file.readline().rstrip('\r\n')
+    # Delimiter of cache files or of downloads
+    delimiter = '|' if '|' in header_line else ','
+    att_list = header_line.split(delimiter)
+    name_list = [att.strip().lower() for att in att_list]
+    if SYMBOL not in name_list:
+        print 'Symbol column not found: ' + archive
+        in_file.close()
+        return
+    index = name_list.index(SYMBOL)
+    header = delimiter.join(att_list[:index] + att_list[index + 1:]) + '\n'
+    seen_set = set()
+    symbol = None
+    line_list = []
+    for line in in_file:
+        field_list = line.rstrip('\r\n').split(delimiter)
+        if len(field_list) <= index:
+            continue
+        if field_list[index] != symbol:
+            if symbol is not None and line_list:
+                yield (symbol, header + ''.join(line_list))
+            symbol = field_list[index]
+            line_list = []
+            if symbol in seen_set:
+                print 'Skipping lines of symbol out of its block: ' + symbol
+                # Lines are skipped until next symbol
+                line_list = None
+            seen_set.add(symbol)
+        if line_list is not None:
+            line_list.append(delimiter.join(field_list[:index] +
+                                            field_list[index + 1:]) + '\n')
+    if symbol is not None and line_list:
+        yield (symbol, header + ''.join(line_list))
+    in_file.close()
+
+
+def ingest_archive(archive, processes=None, chunk_size=100):
+    '''
+    Populate historical cache from an archive of per-symbol CSV files (zip
+    or tar, compressed or not) or a concatenated CSV file with a symbol
+    column
+
+    Zip members are decompressed and written by a pool of processes, tar
+    archives (a single compressed stream) and concatenated files are read
+    in streaming mode by this process and written by the pool
+    '''
+    start = time.time()
+    pool = multiprocessing.Pool(processes)
+    if zipfile.is_zipfile(archive):
+        zip_file = zipfile.ZipFile(archive)
+        member_list = [name for name in zip_file.namelist()
+                       if get_member_symbol(name) is not None]
+        zip_file.close()
+        task_list = [(archive, member_list[pos:pos + chunk_size])
+                     for pos in range(0, len(member_list), chunk_size)]
+        result_list = [result for chunk in
+                       pool.imap_unordered(ingest_zip_members, task_list)
+                       for result in chunk]
+    else:
+        if tarfile.is_tarfile(archive):
+            item_iter = read_tar_archive(archive)
+        else:
+            item_iter = read_concatenated(archive)
+        result_list = list(pool.imap_unordered(ingest_content, item_iter,
+                                               chunk_size))
+    pool.close()
+    pool.join()
+    # Ingested data replaces failures and validators of previous downloads
+    negative_dict = read_negative_cache()
+    validator_dict = read_validators()
+    for symbol, error in result_list:
+        if error is None:
+            negative_dict.pop(symbol, None)
+            validator_dict.pop(symbol, None)
+    write_negative_cache(negative_dict)
+    write_validators(validator_dict)
+    invalid = len([error for _, error in result_list if error is not None])
+    print 'Ingested ' + str(len(result_list) - invalid) + ' symbols (' + \
+        str(invalid) + ' invalid) in ' + str(round(time.time() - start, 2)) + \
+        ' s'
 
 
 def create_directories():
@@ -178,70 +651,280 @@ def get_date(string_date):
         return None
 
 
-def get_volatility(stock_list, count):
-    '''
-    Calculate volatility over last 'count' records of a list
-    '''
-    import math
-    # Calculate difference between current and previous (CLOSE and OPEN)
-    diff_list = [float(rec[CLOSE]) / float(rec[OPEN])
-                 for rec in stock_list[-count:]]
-    diff_list = [math.log(n) for n in diff_list]
-    if len(diff_list):
-        # Average of differences
-        avg = sum(n for n in diff_list) / float(count)
-        # Variance
-        var = sum([(n - avg) * (n - avg)
-                   for n in diff_list]) / float(count)
-        # Standard deviation
-        dev = math.sqrt(var)
-        # Volatility
-        return dev * math.sqrt(252)
-    else:
+def get_log_ratio(numerator, denominator):
+    '''
+    Return log of the ratio of two prices (None if a price is not positive)
+    '''
+    numerator = float(numerator)
+    denominator = float(denominator)
+    if numerator <= 0 or denominator <= 0:
         return None
+    return math.log(numerator / denominator)
+
+
+def get_return_volatility(ret_list, count):
+    '''
+    Calculate volatility of log returns over the 'count' records ending at
+    each record (fewer records at the start of the list)
+
+    Mean and sum of squared differences are updated as records enter and
+    leave the window (Welford), records without return are skipped
+    '''
+    vol_list = []
+    size = 0
+    mean = 0.0
+    sum_sq = 0.0
+    for index, ret in enumerate(ret_list):
+        if ret is not None:
+            size += 1
+            diff = ret - mean
+            mean += diff / size
+            sum_sq += diff * (ret - mean)
+        old_ret = ret_list[index - count] if index >= count else None
+        if old_ret is not None:
+            size -= 1
+            if size:
+                diff = old_ret - mean
+                mean -= diff / size
+                sum_sq -= diff * (old_ret - mean)
+            else:
+                mean = 0.0
+                sum_sq = 0.0
+        var = sum_sq / size if size else 0.0
+        # Rounding errors of removals may give small negative variances
+        vol_list.append(math.sqrt(max(var, 0.0) * TRADING_DAYS))
+    return vol_list
+
+
+def get_range_terms(trade_list, ret_list, estimator):
+    '''
+    Return daily terms of a range-based volatility estimator (Parkinson or
+    Garman-Klass) over a list of records (None for records with prices that
+    are not positive)
+    '''
+    term_list = []
+    for rec, ret in zip(trade_list, ret_list):
+        hilo = get_log_ratio(rec[HIGH], rec[LOW])
+        if hilo is None or (estimator == GARMAN_KLASS and ret is None):
+            term_list.append(None)
+        elif estimator == PARKINSON:
+            term_list.append(hilo * hilo / (4 * math.log(2)))
+        else:
+            term_list.append(0.5 * hilo * hilo -
+                             (2 * math.log(2) - 1) * ret * ret)
+    return term_list
 
 
-def get_trade_stream(symbol, start_date, end_date):
+def get_prefix_sums(term_list):
+    '''
+    Return prefix sums of daily terms and prefix counts of records with terms
+    '''
+    sum_list = [0.0]
+    size_list = [0]
+    for term in term_list:
+        sum_list.append(sum_list[-1] + (term or 0.0))
+        size_list.append(size_list[-1] + (term is not None))
+    return (sum_list, size_list)
+
+
+def get_range_volatility(prefix_sums, index, count):
+    '''
+    Calculate volatility of a range-based estimator over the 'count' records
+    ending at record 'index' (fewer records at the start of the list) from
+    prefix sums of its daily terms
+    '''
+    sum_list, size_list = prefix_sums
+    start = max(0, index + 1 - count)
+    size = size_list[index + 1] - size_list[start]
+    if not size:
+        return 0.0
+    var = (sum_list[index + 1] - sum_list[start]) / size
+    return math.sqrt(max(var, 0.0) * TRADING_DAYS)
+
+
+def is_calendar_updated(packed=False):
+    '''
+    Check if trading calendar is newer than all historical files (packed
+    store in packed mode) and has trading days
+    '''
+    if not os.path.isfile(CALENDAR_FILE) or \
+            not read_csv_file(CALENDAR_FILE, CALENDAR_HEADER):
+        return False
+    calendar_time = os.path.getmtime(CALENDAR_FILE)
+    if packed:
+        file_list = [PACK_FILE, PACK_INDEX_FILE]
+    else:
+        file_list = [HISTORICAL_DIR + os.sep + filename
+                     for filename in os.listdir(HISTORICAL_DIR)]
+    for filename in file_list:
+        if os.path.isfile(filename) and \
+                os.path.getmtime(filename) > calendar_time:
+            return False
+    return True
+
+
+def add_trading_days(date_set, line_iter):
+    '''
+    Add days with volume in lines of a historical file to a set of dates
+    '''
+    date_pos = HISTORICAL_HEADER.index(DATE)
+    volume_pos = HISTORICAL_HEADER.index(VOLUME)
+    for line in line_iter:
+        field_list = line.split('|')
+        try:
+            if int(field_list[volume_pos]) > 0:
+                date_set.add(field_list[date_pos])
+        except (ValueError, IndexError):
+            # Header and empty files
+            continue
+
+
+def gen_calendar(packed=False):
+    '''
+    Generate trading calendar (days with volume in any historical file or
+    in the packed store in packed mode)
+    '''
+    date_set = set()
+    if packed:
+        index_dict = read_pack_index()
+        if index_dict:
+            pack_file = open(PACK_FILE, 'rb')
+            # Data of symbols is read sequentially
+            for offset, length, _, _ in sorted(index_dict.values()):
+                pack_file.seek(offset)
+                add_trading_days(date_set,
+                                 pack_file.read(length).splitlines())
+            pack_file.close()
+    else:
+        for filename in sorted(os.listdir(HISTORICAL_DIR)):
+            in_file = open(HISTORICAL_DIR + os.sep + filename)
+            add_trading_days(date_set, in_file)
+            in_file.close()
+    rec_list = [{DATE: string_date, TS: index + 1}
+                for index, string_date in enumerate(sorted(date_set))]
+    write_csv_file(rec_list, CALENDAR_FILE, CALENDAR_HEADER)
+    print str(len(rec_list)) + ' trading days'
+
+
+def read_calendar(start_date):
+    '''
+    Read trading calendar as a dense array of trading days (counted from the
+    first trading day since start date, zero for other days) indexed by
+    offset from the first date
+    '''
+    rec_list = read_csv_file(CALENDAR_FILE, CALENDAR_HEADER)
+    if not rec_list:
+        return (0, [])
+    first_ordinal = get_date(rec_list[0][DATE]).toordinal()
+    last_ordinal = get_date(rec_list[-1][DATE]).toordinal()
+    day_list = [0] * (last_ordinal - first_ordinal + 1)
+    base = None
+    for rec in rec_list:
+        rec_date = get_date(rec[DATE])
+        if base is None and rec_date >= start_date:
+            base = int(rec[TS]) - 1
+        day_list[rec_date.toordinal() - first_ordinal] = int(rec[TS])
+    if base is not None:
+        day_list = [max(day - base, 0) for day in day_list]
+    return (first_ordinal, day_list)
+
+
+def get_calendar_day(trading_calendar, rec_date):
+    '''
+    Return trading day of a date (zero if it is not in calendar)
+    '''
+    first_ordinal, day_list = trading_calendar
+    offset = rec_date.toordinal() - first_ordinal
+    if 0 <= offset < len(day_list):
+        return day_list[offset]
+    return 0
+
+
+def get_trade_stream(symbol, start_date, end_date, compress=1,
+                     calendar=False, trading_calendar=None, pack=None):
     '''
     Get transactions stream for a stock symbol
+
+    Timestamps count trading days of the symbol (calendar days since start
+    date in calendar mode, days of the shared trading calendar when it is
+    given) and 'compress' consecutive days share a timestamp
+
+    Historical data is read from packed store when it is given
     '''
-    in_filename = HISTORICAL_DIR + os.sep + symbol + '.csv'
-    hist_list = read_csv_file(in_filename, HISTORICAL_HEADER)
+    if pack is not None:
+        hist_content = read_pack(pack, symbol, start_date, end_date)
+        if hist_content is None:
+            return []
+        hist_list = read_csv_lines(hist_content.splitlines(True),
+                                   HISTORICAL_HEADER)
+    else:
+        in_filename = HISTORICAL_DIR + os.sep + symbol + '.csv'
+        if not os.path.isfile(in_filename):
+            # Historical data not available
+            return []
+        hist_list = read_csv_file(in_filename, HISTORICAL_HEADER)
     # Sort records by date
     hist_list.sort(key=lambda k: k[DATE])
     trade_list = []
-    previous_ts = 0
+    previous_day = 0
     # For each historical record
     for hist_rec in hist_list:
         # Skip record with zero volume and out of period
         # It is not possible to calculate the rate for these records
         rec_date = get_date(hist_rec[DATE])
         if int(hist_rec[VOLUME]) > 0 and start_date <= rec_date <= end_date:
-            rec_ts = previous_ts + 1
-            previous_ts = rec_ts
-            t_rec = {TS: rec_ts, SYMBOL: symbol,
-                     OPEN: hist_rec[OPEN], CLOSE: hist_rec[CLOSE],
+            rec_day = previous_day + 1
+            if trading_calendar is not None:
+                rec_day = get_calendar_day(trading_calendar, rec_date)
+            elif calendar:
+                rec_day = (rec_date - start_date).days + 1
+            previous_day = rec_day
+            rec_ts = (rec_day - 1) // compress + 1
+            # HIGH and LOW are kept for range-based volatility estimators
+            t_rec = {TS: rec_ts, SYMBOL: symbol, DATE: hist_rec[DATE],
+                     OPEN: hist_rec[OPEN], HIGH: hist_rec[HIGH],
+                     LOW: hist_rec[LOW], CLOSE: hist_rec[CLOSE],
                      VOLUME: hist_rec[VOLUME]}
             # Append record into transactions list
             trade_list.append(t_rec)
     return trade_list
 
 
-def get_volatility_stream(symbol, trade_list):
+def get_volatility_stream(symbol, trade_list, window_list=VOLATILITY_COUNTS,
+                          estimator_list=VOLATILITY_ESTIMATORS):
     '''
     Get volatilities stream for a stock symbol
+
+    Volatility of each record is calculated over trailing windows of records
+    for every estimator (running mean and variance for log returns, prefix
+    sums for range-based estimators)
     '''
+    ret_list = [get_log_ratio(rec[CLOSE], rec[OPEN]) for rec in trade_list]
+    # Volatilities of each record indexed by (estimator, count)
+    vol_dict = {}
+    for estimator in estimator_list:
+        if estimator == CLOSE_OPEN:
+            for count in window_list:
+                vol_dict[(estimator, count)] = \
+                    get_return_volatility(ret_list, count)
+            continue
+        # HIGH and LOW are only read by range-based estimators
+        prefix_sums = get_prefix_sums(
+            get_range_terms(trade_list, ret_list, estimator))
+        for count in window_list:
+            vol_dict[(estimator, count)] = \
+                [get_range_volatility(prefix_sums, index, count)
+                 for index in range(len(trade_list))]
     volatolity_list = []
     # For each historical record
-    for rec in trade_list:
-        # For each count in volatility counts
-        for count in VOLATILITY_COUNTS:
-            # Calculate volatility for this count
-            vol = get_volatility(trade_list, count)
-            if vol is not None:
+    for index, rec in enumerate(trade_list):
+        for estimator in estimator_list:
+            # For each count in volatility counts
+            for count in window_list:
                 # Create volatility record
-                v_rec = {SYMBOL: symbol, TS: rec[TS],
-                         METHOD: count, RATE: vol}
+                v_rec = {SYMBOL: symbol, TS: rec[TS], DATE: rec[DATE],
+                         METHOD: METHOD_OFFSET[estimator] + count,
+                         RATE: vol_dict[(estimator, count)][index]}
                 # Append record to list
                 volatolity_list.append(v_rec)
     return volatolity_list
@@ -254,49 +937,83 @@ def get_transaction_stream(stock_rec, trade_list, volatility_list):
     full_list = []
     if not len(trade_list):
         return full_list
+    # Compressed timestamps are shared by several days
+    date_dict = {}
+    for vol_rec in volatility_list:
+        date_dict.setdefault(vol_rec[DATE], []).append(vol_rec)
     for trade_rec in trade_list:
-        for vol_rec in volatility_list:
-            if vol_rec[TS] == trade_rec[TS]:
-                rec = {}
-                rec[METHOD] = vol_rec[METHOD]
-                rec[RATE] = vol_rec[RATE]
-                rec[TS] = trade_rec[TS]
-                rec[SYMBOL] = stock_rec[SYMBOL]
-                rec[SECTOR] = stock_rec[SECTOR]
-                rec[COUNTRY] = stock_rec[COUNTRY]
-                rec[PRICE] = trade_rec[CLOSE]
-                rec[VOLUME] = trade_rec[VOLUME]
-                rec[TS] = trade_rec[TS]
-                full_list.append(rec)
+        for vol_rec in date_dict.get(trade_rec[DATE], []):
+            rec = {}
+            rec[METHOD] = vol_rec[METHOD]
+            rec[RATE] = vol_rec[RATE]
+            rec[TS] = trade_rec[TS]
+            rec[SYMBOL] = stock_rec[SYMBOL]
+            rec[SECTOR] = stock_rec[SECTOR]
+            rec[COUNTRY] = stock_rec[COUNTRY]
+            rec[PRICE] = trade_rec[CLOSE]
+            rec[VOLUME] = trade_rec[VOLUME]
+            rec[TS] = trade_rec[TS]
+            full_list.append(rec)
     return full_list
 
 
-def get_streams(stock_list, start_date, end_date):
+def get_tier_file(tier):
+    '''
+    Return transactions file of a symbol tier (percentage of symbols)
+    '''
+    if tier >= FULL_TIER:
+        return TRANSACTION_FILE
+    return TIER_PREFIX + '%g' % tier + '.csv'
+
+
+def get_symbol_fraction(symbol):
+    '''
+    Return stable position of a symbol in [0, 1) given by its hash
+
+    A symbol belongs to every tier greater than its position, so tiers are
+    nested and keep the same symbols between imports
+    '''
+    return int(hashlib.md5(symbol).hexdigest()[:8], 16) / float(16 ** 8)
+
+
+def get_streams(stock_list, start_date, end_date, tier_list=None,
+                compress=1, calendar=False, trading_calendar=None,
+                packed=False, window_list=VOLATILITY_COUNTS,
+                estimator_list=VOLATILITY_ESTIMATORS):
     '''
     Get transactions and volatilities streams for a stock list
+
+    Transactions of a sample of symbols are also written for each tier of
+    tier_list (percentage of symbols)
+
+    In packed mode, the data file of packed store is opened once for all
+    symbols
     '''
     if not len(stock_list):
         return
+    pack = None
+    if packed:
+        if not os.path.isfile(PACK_FILE):
+            print 'Packed store not found: ' + PACK_FILE
+            return
+        pack = (open(PACK_FILE, 'rb'), read_pack_index())
+    # Transactions files of partial tiers
+    tier_dict = {tier: get_tier_file(tier) for tier in tier_list or []
+                 if tier < FULL_TIER}
     # Get transaction and volatility streams
-    if os.path.isfile(TRADE_FILE):
-        os.remove(TRADE_FILE)
-    if os.path.isfile(VOLATILITY_FILE):
-        os.remove(VOLATILITY_FILE)
-    # First symbol
-    rec = stock_list[0]
-    symbol = rec[SYMBOL]
-    print 'Processing ' + symbol
-    trade_list = get_trade_stream(symbol, start_date, end_date)
-    volatility_list = get_volatility_stream(symbol, trade_list)
-    transaction_list = get_transaction_stream(rec, trade_list, volatility_list)
-    write_csv_file(trade_list, TRADE_FILE, TRADE_HEADER)
-    write_csv_file(volatility_list, VOLATILITY_FILE, VOLATILITY_HEADER)
-    write_csv_file(transaction_list, TRANSACTION_FILE, TRANSACTION_HEADER)
-    for rec in stock_list[1:]:
+    write_csv_file([], TRADE_FILE, TRADE_HEADER)
+    write_csv_file([], VOLATILITY_FILE, VOLATILITY_HEADER)
+    write_csv_file([], TRANSACTION_FILE, TRANSACTION_HEADER)
+    for filename in tier_dict.values():
+        write_csv_file([], filename, TRANSACTION_HEADER)
+    for rec in stock_list:
         symbol = rec[SYMBOL]
         print 'Processing ' + symbol
-        trade_list = get_trade_stream(symbol, start_date, end_date)
-        volatility_list = get_volatility_stream(symbol, trade_list)
+        trade_list = get_trade_stream(symbol, start_date, end_date,
+                                      compress, calendar, trading_calendar,
+                                      pack)
+        volatility_list = get_volatility_stream(symbol, trade_list,
+                                                window_list, estimator_list)
         transaction_list = get_transaction_stream(rec, trade_list,
                                                   volatility_list)
         write_csv_file(trade_list, TRADE_FILE,
@@ -305,6 +1022,13 @@ def get_streams(stock_list, start_date, end_date):
                        VOLATILITY_HEADER, 'a')
         write_csv_file(transaction_list, TRANSACTION_FILE, TRANSACTION_HEADER,
                        'a')
+        fraction = get_symbol_fraction(symbol)
+        for tier, filename in tier_dict.items():
+            if fraction < tier / FULL_TIER:
+                write_csv_file(transaction_list, filename,
+                               TRANSACTION_HEADER, 'a')
+    if pack is not None:
+        pack[0].close()
 
 
 def filter_by_exchange(symbol_list, exchange):
@@ -348,6 +1072,59 @@ def get_arguments(print_help=False):
                         '(default: system current date)')
     parser.add_argument('-x', '--exchange', action="store",
                         help='Filter by an exchange')
+    parser.add_argument('-t', '--tiers', action="store", nargs='+',
+                        type=float, default=None,
+                        help='Also write transactions of nested tiers ' +
+                        'with these percentages of symbols (e.g. 1 5 25)')
+    parser.add_argument('-k', '--compress', action="store", type=int,
+                        default=1,
+                        help='Days folded into each timestamp (default: 1)')
+    parser.add_argument('-c', '--calendar', action="store_true",
+                        default=False,
+                        help='Timestamps count calendar days since start ' +
+                        'date instead of trading days of each symbol')
+    parser.add_argument('-a', '--aligned', action="store_true",
+                        default=False,
+                        help='Timestamps count days of a trading calendar ' +
+                        'shared by all symbols (' + CALENDAR_FILE + ')')
+    parser.add_argument('-r', '--refetch', action="store_true",
+                        default=False,
+                        help='Get historical data of symbols that failed ' +
+                        'recently (negative cache and quarantine)')
+    parser.add_argument('-m', '--max-age', action="store", type=float,
+                        default=None,
+                        help='Revalidate cached downloads checked more ' +
+                        'than MAX_AGE days ago (conditional requests)')
+    parser.add_argument('-u', '--url', action="store",
+                        default=HISTORICAL_URL,
+                        help='URL of historical data ({ss} is replaced ' +
+                        'by symbol)')
+    parser.add_argument('-i', '--ingest', action="store", default=None,
+                        help='Populate historical data from an archive ' +
+                        '(zip or tar of <symbol>.csv files or CSV file ' +
+                        'with symbol column) before downloading')
+    parser.add_argument('-p', '--processes', action="store", type=int,
+                        default=None,
+                        help='Processes to ingest archive (default: ' +
+                        'number of CPUs)')
+    parser.add_argument('-w', '--windows', action="store", nargs='+',
+                        type=int, default=VOLATILITY_COUNTS,
+                        help='Windows of volatility in records (default: ' +
+                        ' '.join(str(count) for count in VOLATILITY_COUNTS) +
+                        ')')
+    parser.add_argument('-v', '--estimators', action="store", nargs='+',
+                        choices=ESTIMATOR_LIST,
+                        default=VOLATILITY_ESTIMATORS,
+                        help='Volatility estimators (method code is ' +
+                        'window plus ' + ', '.join(
+                            str(METHOD_OFFSET[estimator]) + ' for ' +
+                            estimator for estimator in ESTIMATOR_LIST) + ')')
+    parser.add_argument('-b', '--packed', action="store_true",
+                        default=False,
+                        help='Store historical data in a single packed ' +
+                        'file with symbol index (downloads cached in ' +
+                        'historical directory are packed when newer ' +
+                        'than packed data)')
     args = parser.parse_args()
     if print_help:
         parser.print_help()
@@ -371,6 +1148,10 @@ def main():
         start_date = get_date(args.start)
         if start_date is None:
             return
+    for count in args.windows:
+        if not 0 < count < METHOD_OFFSET[PARKINSON]:
+            print 'Invalid volatility window: ' + str(count)
+            return
     print 'Reading stocks'
     stock_list = read_csv_file(STOCK_FILE, STOCK_HEADER)
     print str(len(stock_list)) + ' read'
@@ -378,9 +1159,27 @@ def main():
         print 'Filtering stocks by exchange ' + args.exchange
         stock_list = filter_by_exchange(stock_list, args.exchange)
         print str(len(stock_list)) + ' filtered'
+    if args.ingest:
+        print 'Ingesting historical data from ' + args.ingest
+        ingest_archive(args.ingest, args.processes)
     print 'Getting historical data'
-    get_all_historical(stock_list)
-    get_streams(stock_list, start_date, end_date)
+    max_age = None
+    if args.max_age is not None:
+        max_age = args.max_age * 24 * 3600
+    get_all_historical(stock_list, args.refetch, max_age, args.url,
+                       args.packed)
+    if args.compress < 1:
+        print 'Invalid compression: ' + str(args.compress)
+        return
+    trading_calendar = None
+    if args.aligned:
+        if not is_calendar_updated(args.packed):
+            print 'Generating trading calendar'
+            gen_calendar(args.packed)
+        trading_calendar = read_calendar(start_date)
+    get_streams(stock_list, start_date, end_date, args.tiers, args.compress,
+                args.calendar, trading_calendar, args.packed, args.windows,
+                args.estimators)
     print 'WARNING: The stream files must be sorted by timestamp'
 
 